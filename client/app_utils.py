@@ -8,6 +8,9 @@ import requests
 import datetime
 from pytz import timezone
 
+import httpsession
+import intentparser
+
 
 def sendEmail(SUBJECT, BODY, TO, FROM, SENDER, PASSWORD, SMTP_SERVER):
     """Sends an HTML email."""
@@ -186,7 +189,29 @@ def text2int(textnum, numwords={}):
     return result + current
 
 
-def determineIntent(profile, input):
+def determineIntent(profile, input, gazetteers=None):
+    """
+    Determines the intent of a phrase and its entities, in wit.ai's format.
+
+    The intent is determined offline by the intentparser, unless the profile
+    sets 'intent_parser' to 'witai'.
+
+    Arguments:
+        profile -- contains information related to the user
+        input -- the phrase
+        gazetteers -- (optional) a dict of entity names and lists of their
+                      known values, which take precedence over the entities
+                      the intentparser finds otherwise
+    """
+    if (len(input) == 0):
+        return {}
+    if profile.get('intent_parser') == 'witai':
+        return determineWitIntent(profile, input)
+    return intentparser.get_parser().parse(input, gazetteers)
+
+
+def determineWitIntent(profile, input):
+    """Determines the intent of a phrase with the wit.ai message API."""
     logger = logging.getLogger(__name__)
     if (len(input) == 0):
         return {}
@@ -195,8 +220,9 @@ def determineIntent(profile, input):
     headers = {'Authorization': 'Bearer %s' %
                profile['witai-stt']['access_token'],
                'accept': 'application/json'}
-    r = requests.post('https://api.wit.ai/message?v=20150611',
-                      headers=headers, params=parameters)
+    r = httpsession.get_session().post(
+        'https://api.wit.ai/message?v=20150611',
+        headers=headers, params=parameters)
 
     try:
         r.raise_for_status()
@@ -0,0 +1,527 @@
+# -*- coding: utf-8-*-
+"""
+Audio capture helpers used by the Mic class.
+
+A CaptureStream keeps a single PyAudio input stream open for as long as Nikita
+is running and copies every chunk it reads into a RingBuffer. Passive and
+active listening read from that buffer through independent StreamReaders, so
+no audio is lost between two listening cycles and the input device is only
+opened once.
+
+Recorded audio is collected by a Recorder and handed to the STT engines as an
+AudioSegment, which keeps the raw PCM data in memory.
+"""
+import io
+import time
+import audioop
+import logging
+import threading
+import wave
+
+
+class Interrupted(Exception):
+    """
+    Raised when the user interrupted Nikita while she was speaking.
+    """
+    pass
+
+
+class RingBuffer(object):
+    """
+    A fixed number of audio chunks, addressed by an absolute chunk index.
+
+    The index of a chunk never changes, even after the chunk has been
+    overwritten by newer data. Readers therefore can keep a position and will
+    notice when they fell too far behind. Every chunk is stored together with
+    the time at which it was captured.
+    """
+
+    def __init__(self, size):
+        """
+        Arguments:
+            size -- the maximum number of chunks kept in the buffer
+        """
+        self._size = size
+        self._slots = [None] * size
+        self._times = [None] * size
+        self._head = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def head(self):
+        """
+        Returns:
+            The index the next appended chunk will get
+        """
+        return self._head
+
+    @property
+    def tail(self):
+        """
+        Returns:
+            The index of the oldest chunk that is still available
+        """
+        return max(0, self._head - self._size)
+
+    def append(self, chunk, timestamp=None):
+        """
+        Arguments:
+            chunk -- the captured audio data
+            timestamp -- (optional) the time.time() at which the end of the
+                         chunk was captured (Default: now)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._cond:
+            self._slots[self._head % self._size] = chunk
+            self._times[self._head % self._size] = timestamp
+            self._head += 1
+            self._cond.notify_all()
+
+    def get(self, index):
+        """
+        Returns the chunk with the given index, waiting for it to be captured
+        if necessary.
+        """
+        return self.get_with_time(index)[0]
+
+    def get_with_time(self, index):
+        """
+        Returns a tuple (chunk, capture time) of the chunk with the given
+        index, waiting for it to be captured if necessary.
+
+        Raises:
+            IndexError if the chunk has already been overwritten
+            EOFError if the buffer has been closed
+        """
+        with self._cond:
+            while index >= self._head:
+                if self._closed:
+                    raise EOFError('Ring buffer has been closed')
+                # Use a timeout, otherwise the wait can't be interrupted
+                # by KeyboardInterrupt
+                self._cond.wait(1)
+            if index < self.tail:
+                raise IndexError('Chunk %d has already been overwritten' %
+                                 index)
+            return (self._slots[index % self._size],
+                    self._times[index % self._size])
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StreamReader(object):
+    """
+    Reads chunks from a RingBuffer, starting at a given position.
+    """
+
+    def __init__(self, buffer, position, chunk_time=0):
+        """
+        Arguments:
+            buffer -- the RingBuffer to read from
+            position -- the absolute chunk index to start reading at
+            chunk_time -- (optional) the duration of a chunk in seconds,
+                          used by mute()
+        """
+        self._logger = logging.getLogger(__name__)
+        self._buffer = buffer
+        self.position = position
+        self.chunk_time = chunk_time
+        # the capture time of the chunk read last
+        self.timestamp = None
+        # (start, end) times of the audio that is replaced by silence
+        self._muted = []
+
+    def mute(self, start, end):
+        """
+        Replaces the chunks captured between the start and end times (e.g.
+        while a sound was played) by silence.
+        """
+        self._muted.append((start, end))
+
+    def read(self):
+        """
+        Returns the next chunk, blocking until it has been captured. Its
+        capture time is available in the timestamp attribute afterwards.
+        """
+        try:
+            chunk, timestamp = self._buffer.get_with_time(self.position)
+        except IndexError:
+            self._logger.warning("Reader fell behind the capture stream, " +
+                                 "skipping %d chunks.",
+                                 self._buffer.tail - self.position)
+            self.position = self._buffer.tail
+            chunk, timestamp = self._buffer.get_with_time(self.position)
+        self.position += 1
+        self.timestamp = timestamp
+        if any(timestamp > start and timestamp - self.chunk_time < end
+               for start, end in self._muted):
+            chunk = '\x00' * len(chunk)
+        return chunk
+
+
+class CaptureStream(object):
+    """
+    Continuously records audio from the default input device into a
+    RingBuffer on a background thread.
+    """
+
+    def __init__(self, audio, format, rate=16000, chunk=1024,
+                 buffer_time=30):
+        """
+        Arguments:
+            audio -- an initialized pyaudio.PyAudio instance
+            format -- the PyAudio sample format (e.g. pyaudio.paInt16)
+            rate -- the sample rate in Hz (Default: 16000)
+            chunk -- the number of frames per chunk (Default: 1024)
+            buffer_time -- the number of seconds kept in the ring buffer
+                           (Default: 30)
+        """
+        self._logger = logging.getLogger(__name__)
+        self._audio = audio
+        self.format = format
+        self.rate = rate
+        self.chunk = chunk
+        self.buffer = RingBuffer(max(1, rate * buffer_time / chunk))
+        self._stream = None
+        self._thread = None
+        self._running = False
+        self._listeners = []
+
+    @property
+    def chunks_per_second(self):
+        return float(self.rate) / self.chunk
+
+    def start(self):
+        if self._running:
+            return
+        self._stream = self._audio.open(format=self.format,
+                                        channels=1,
+                                        rate=self.rate,
+                                        input=True,
+                                        frames_per_buffer=self.chunk)
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name='CaptureStream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join()
+        self._stream.stop_stream()
+        self._stream.close()
+        self.buffer.close()
+
+    def add_listener(self, listener):
+        """
+        Registers a callable that is called with every captured chunk on the
+        capture thread, before the chunk becomes visible to readers. It must
+        return quickly, otherwise the stream overflows.
+        """
+        self._listeners.append(listener)
+
+    def reader(self, position=None, preroll=0):
+        """
+        Creates a new StreamReader.
+
+        Arguments:
+            position -- (optional) the absolute chunk index to start reading
+                        at (Default: the next chunk that will be captured)
+            preroll -- (optional) the number of already captured chunks to
+                       include before position (Default: 0)
+
+        Returns:
+            A StreamReader instance
+        """
+        if position is None:
+            position = self.buffer.head
+        position = max(self.buffer.tail, position - preroll)
+        return StreamReader(self.buffer, position,
+                            chunk_time=1 / self.chunks_per_second)
+
+    def _run(self):
+        while self._running:
+            try:
+                data = self._stream.read(self.chunk)
+                timestamp = time.time()
+            except IOError as e:
+                # Input overflows are reported as IOError by PyAudio. We lose
+                # a few frames, but the stream is still usable.
+                self._logger.debug("Error while reading from input stream: " +
+                                   "%s", e)
+                continue
+            for listener in self._listeners:
+                try:
+                    listener(data)
+                except Exception:
+                    self._logger.error("Capture stream listener failed.",
+                                       exc_info=True)
+            self.buffer.append(data, timestamp)
+
+
+class AudioSegment(object):
+    """
+    A piece of recorded audio, kept in memory as raw PCM data.
+
+    Engines that work with raw PCM use pcm or buffer directly, without
+    copying the data. Only libraries that insist on a str get a copy from
+    raw. Engines that need a WAV container use wav or wav_file(), which are
+    only built when they are requested for the first time.
+    """
+
+    def __init__(self, data, rate=16000, width=2, channels=1):
+        """
+        Arguments:
+            data -- the raw PCM data (a str, bytearray, buffer or
+                    memoryview)
+            rate -- the sample rate in Hz (Default: 16000)
+            width -- the sample width in bytes (Default: 2)
+            channels -- the number of channels (Default: 1)
+        """
+        self.data = data
+        self.rate = rate
+        self.width = width
+        self.channels = channels
+        self._wav = None
+
+    @classmethod
+    def from_wav(cls, fp):
+        """
+        Reads a WAV file into a new AudioSegment.
+
+        Arguments:
+            fp -- a file name or a file object containing WAV data
+        """
+        wav = wave.open(fp, 'rb')
+        try:
+            return cls(wav.readframes(wav.getnframes()),
+                       rate=wav.getframerate(),
+                       width=wav.getsampwidth(),
+                       channels=wav.getnchannels())
+        finally:
+            wav.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def duration(self):
+        """
+        Returns:
+            The length of the segment in seconds
+        """
+        bytes_per_second = self.rate * self.width * self.channels
+        return float(len(self.data)) / bytes_per_second
+
+    @property
+    def pcm(self):
+        """
+        Returns:
+            A memoryview of the raw PCM data (no copy is made)
+        """
+        return memoryview(self.data)
+
+    @property
+    def buffer(self):
+        """
+        Returns:
+            A read-only buffer of the raw PCM data. Unlike a memoryview, it
+            is accepted by the C modules of Python 2 (e.g. audioop, socket)
+            and by requests as an upload. No copy is made, unless the
+            segment has been created from a memoryview.
+        """
+        if isinstance(self.data, memoryview):
+            return buffer(self.data.tobytes())
+        return buffer(self.data)
+
+    @property
+    def raw(self):
+        """
+        Returns:
+            The raw PCM data as str, which some libraries insist on. This only
+            copies the data if it isn't stored as str already.
+        """
+        if isinstance(self.data, str):
+            return self.data
+        return self.pcm.tobytes()
+
+    @property
+    def wav(self):
+        """
+        Returns:
+            The segment as WAV file contents (str)
+        """
+        if self._wav is None:
+            f = io.BytesIO()
+            wav = wave.open(f, 'wb')
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(self.width)
+            wav.setframerate(self.rate)
+            wav.writeframes(self.raw)
+            wav.close()
+            self._wav = f.getvalue()
+        return self._wav
+
+    def wav_file(self):
+        """
+        Returns:
+            A new file object containing the segment as WAV file
+        """
+        return io.BytesIO(self.wav)
+
+
+class Recorder(object):
+    """
+    Collects chunks of audio in a single preallocated bytearray, so that
+    recording doesn't allocate memory per chunk and the result can be handed
+    out without joining or copying it.
+    """
+
+    def __init__(self, max_time, rate=16000, width=2, channels=1):
+        """
+        Arguments:
+            max_time -- the maximum length of the recording in seconds
+            rate -- the sample rate in Hz (Default: 16000)
+            width -- the sample width in bytes (Default: 2)
+            channels -- the number of channels (Default: 1)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.rate = rate
+        self.width = width
+        self.channels = channels
+        self._buffer = bytearray(int(max_time * rate) * width * channels)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def append(self, chunk):
+        """
+        Appends a chunk to the recording. Audio that doesn't fit into the
+        buffer anymore is dropped.
+
+        Returns:
+            False if the chunk had to be truncated, else True
+        """
+        end = min(self._length + len(chunk), len(self._buffer))
+        # Assigning a slice of the same length doesn't reallocate
+        self._buffer[self._length:end] = chunk[:end - self._length]
+        complete = (end - self._length == len(chunk))
+        if not complete:
+            self._logger.warning("Recorder is full, dropping audio.")
+        self._length = end
+        return complete
+
+    def segment(self):
+        """
+        Returns:
+            An AudioSegment backed by the recorded part of the buffer. No
+            data is copied, so the recorder must not be reused afterwards.
+        """
+        return AudioSegment(buffer(self._buffer, 0, self._length),
+                            rate=self.rate, width=self.width,
+                            channels=self.channels)
+
+
+class EchoSuppressor(object):
+    """
+    Removes Nikita's own voice from the captured audio while she is speaking,
+    so that it doesn't trigger the keyword detection.
+
+    The energy of every captured chunk is compared with the energy of the
+    sound being played at that time. Chunks that aren't clearly louder than
+    the expected echo are replaced by silence. How strongly the output
+    couples into the microphone is learned while the user is silent.
+    """
+
+    def __init__(self, output, start_time, coupling=1.0, margin=2.0,
+                 adaptation=0.1, latency=0.1):
+        """
+        Arguments:
+            output -- an AudioSegment containing the sound being played
+            start_time -- the time.time() at which the playback started
+            coupling -- the initial ratio between the captured echo energy
+                        and the output energy (Default: 1.0)
+            margin -- how many times louder than the expected echo speech
+                      has to be (Default: 2.0)
+            adaptation -- the weight of a new chunk when updating the
+                          coupling (Default: 0.1)
+            latency -- the maximum delay between the output and its echo in
+                       seconds (Default: 0.1)
+        """
+        self.start_time = start_time
+        self.coupling = coupling
+        self.margin = margin
+        self.adaptation = adaptation
+        self.latency = latency
+        # energy of the output in windows of 'resolution' seconds
+        self.resolution = 0.02
+        window = max(1, int(output.rate * self.resolution))
+        window *= output.width * output.channels
+        data = output.buffer
+        self._energies = [audioop.rms(buffer(data, i, window), output.width)
+                          for i in range(0, len(data), window)]
+
+    def expected_energy(self, start, end):
+        """
+        Returns:
+            The highest output energy between the start and end offsets (in
+            seconds), extended by the latency
+        """
+        first = max(0, int((start - self.latency) / self.resolution))
+        last = int(end / self.resolution) + 1
+        energies = self._energies[first:last]
+        return max(energies) if energies else 0
+
+    def process(self, chunk, width=2, rate=16000, now=None):
+        """
+        Arguments:
+            chunk -- a chunk of raw PCM data that has just been captured
+            width -- the sample width of the chunk (Default: 2)
+            rate -- the sample rate of the chunk (Default: 16000)
+            now -- (optional) the time at which the chunk was captured, e.g.
+                   StreamReader.timestamp (Default: now, which is only
+                   right if the chunk is processed as soon as it is
+                   captured)
+
+        Returns:
+            The chunk, or silence if it only seems to contain the echo
+        """
+        if now is None:
+            now = time.time()
+        end = now - self.start_time
+        start = end - float(len(chunk)) / (width * rate)
+        expected = self.expected_energy(start, end)
+        if not expected:
+            return chunk
+        energy = audioop.rms(chunk, width)
+        if energy > self.coupling * expected * self.margin:
+            return chunk
+        self.coupling += self.adaptation * (float(energy) / expected -
+                                            self.coupling)
+        return '\x00' * len(chunk)
+
+
+def to_segment(fp):
+    """
+    Returns fp itself if it is an AudioSegment, otherwise reads the WAV file
+    fp into a new AudioSegment. This allows STT engines to accept both.
+    """
+    if isinstance(fp, AudioSegment):
+        return fp
+    return AudioSegment.from_wav(fp)
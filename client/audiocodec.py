@@ -0,0 +1,238 @@
+# -*- coding: utf-8-*-
+"""
+Audio encoders that shrink the uploads to the cloud STT engines.
+
+Every engine lists the encodings its API accepts together with the matching
+content type, most preferred first (see AbstractSTTEngine.CODECS). The first
+encoder that is available on this system is used.
+
+Encoder methods:
+    encode - encode a complete recording
+    encode_stream - encode chunks of audio while they are being recorded
+    is_available - returns True if the encoder can be used on this system
+
+Run this module to compare the encoders (and, with --engine, the end-to-end
+latency of an STT engine with each of them).
+"""
+import io
+import audioop
+import logging
+import argparse
+from abc import ABCMeta, abstractmethod
+
+try:
+    import numpy
+    import soundfile
+except ImportError:
+    pass
+
+import diagnose
+
+
+class AbstractEncoder(object):
+    """
+    Generic parent class for all encoders
+    """
+    __metaclass__ = ABCMeta
+
+    # the sample widths in bytes the encoder can handle, None for any
+    WIDTHS = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @classmethod
+    def supports(cls, width):
+        return cls.WIDTHS is None or width in cls.WIDTHS
+
+    def __init__(self, rate=16000, width=2):
+        """
+        Arguments:
+            rate -- the sample rate of the PCM input in Hz (Default: 16000)
+            width -- the sample width of the PCM input in bytes (Default: 2)
+
+        Raises:
+            ValueError if the encoder can't handle the sample width
+        """
+        if not self.supports(width):
+            raise ValueError("Encoder '%s' can't encode %d bit samples" %
+                             (self.SLUG, width * 8))
+        self._logger = logging.getLogger(__name__)
+        self.rate = rate
+        self.width = width
+
+    def encode(self, data):
+        """
+        Arguments:
+            data -- raw mono PCM data (a str or buffer, see
+                    AudioSegment.buffer)
+
+        Returns:
+            The encoded data (a str, or data itself if it isn't encoded)
+        """
+        return ''.join(self.encode_stream([data]))
+
+    @abstractmethod
+    def encode_stream(self, chunks):
+        """
+        Yields the encoded data as soon as chunks of raw mono PCM data come
+        in.
+        """
+        pass
+
+
+class PCMEncoder(AbstractEncoder):
+    """
+    Passes the audio through unchanged.
+    """
+
+    SLUG = 'pcm'
+
+    def encode(self, data):
+        return data
+
+    def encode_stream(self, chunks):
+        return (chunk for chunk in chunks)
+
+
+class ULawEncoder(AbstractEncoder):
+    """
+    Compresses 16 bit samples to 8 bit using mu-law companding, which has
+    been designed for speech. This halves the size at almost no CPU cost.
+    """
+
+    SLUG = 'ulaw'
+    WIDTHS = (1, 2, 4)
+
+    def encode_stream(self, chunks):
+        for chunk in chunks:
+            yield audioop.lin2ulaw(chunk, self.width)
+
+
+class FLACEncoder(AbstractEncoder):
+    """
+    Compresses losslessly with FLAC through libsndfile. Requires the
+    soundfile and numpy packages. libsndfile writes FLAC with at most 24
+    bits, so 32 bit samples can't be encoded.
+    """
+
+    SLUG = 'flac'
+    WIDTHS = (1, 2)
+
+    @classmethod
+    def is_available(cls):
+        return (diagnose.check_python_import('soundfile') and
+                diagnose.check_python_import('numpy'))
+
+    def encode_stream(self, chunks):
+        dtype = {1: 'int8', 2: 'int16'}[self.width]
+        subtype = {1: 'PCM_S8', 2: 'PCM_16'}[self.width]
+        output = io.BytesIO()
+        sent = 0
+        f = soundfile.SoundFile(output, 'w', samplerate=self.rate,
+                                channels=1, subtype=subtype, format='FLAC')
+        try:
+            for chunk in chunks:
+                f.write(numpy.frombuffer(chunk, dtype=dtype))
+                # libsndfile rewrites the header when the file is closed, so
+                # only the data after what has already been sent matters
+                data = output.getvalue()[sent:]
+                sent += len(data)
+                if data:
+                    yield data
+        finally:
+            f.close()
+        data = output.getvalue()[sent:]
+        if data:
+            yield data
+
+
+def get_encoders():
+    def get_subclasses(cls):
+        subclasses = set()
+        for subclass in cls.__subclasses__():
+            subclasses.add(subclass)
+            subclasses.update(get_subclasses(subclass))
+        return subclasses
+    return [encoder for encoder in list(get_subclasses(AbstractEncoder))
+            if hasattr(encoder, 'SLUG') and encoder.SLUG]
+
+
+def get_encoder_by_slug(slug):
+    selected = filter(lambda encoder: encoder.SLUG == slug, get_encoders())
+    if len(selected) == 0:
+        raise ValueError("No encoder found for slug '%s'" % slug)
+    return selected[0]
+
+
+def negotiate(codecs, rate=16000, width=2, preferred=None):
+    """
+    Picks the first available encoder accepted by an engine that can
+    handle the sample width.
+
+    Arguments:
+        codecs -- a sequence of (encoder slug, content type) pairs. The
+                  content type may contain %(rate)d and %(bits)d.
+        rate -- the sample rate of the audio in Hz (Default: 16000)
+        width -- the sample width of the audio in bytes (Default: 2)
+        preferred -- (optional) the slug of the encoder to use if possible
+
+    Returns:
+        A tuple (encoder instance, content type)
+
+    Raises:
+        ValueError if none of the encoders is available
+    """
+    codecs = list(codecs)
+    if preferred is not None:
+        codecs.sort(key=lambda codec: codec[0] != preferred)
+    for slug, content_type in codecs:
+        encoder_class = get_encoder_by_slug(slug)
+        if encoder_class.is_available() and encoder_class.supports(width):
+            return (encoder_class(rate=rate, width=width),
+                    content_type % {'rate': rate, 'bits': width * 8})
+    raise ValueError("None of the encoders %r is available" %
+                     [slug for slug, content_type in codecs])
+
+
+if __name__ == '__main__':
+    import time
+    import nikitapath
+    import audio
+    import stt
+
+    parser = argparse.ArgumentParser(description='Nikita audio encoders')
+    parser.add_argument('file', nargs='?',
+                        default=nikitapath.data('audio', 'time.wav'),
+                        help='The WAV file to encode')
+    parser.add_argument('--engine',
+                        help='Also measure the latency of this STT engine')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    segment = audio.AudioSegment.from_wav(args.file)
+    print("%-6s %10s %8s %10s" % ('codec', 'bytes', 'ratio', 'encode'))
+    for encoder_class in sorted(get_encoders(), key=lambda e: e.SLUG):
+        if not encoder_class.is_available():
+            print("%-6s not available" % encoder_class.SLUG)
+            continue
+        encoder = encoder_class(rate=segment.rate, width=segment.width)
+        start = time.time()
+        data = encoder.encode(segment.buffer)
+        print("%-6s %10d %7.1f%% %8.1fms" % (
+            encoder_class.SLUG, len(data), 100.0 * len(data) / len(segment),
+            1000 * (time.time() - start)))
+
+    if args.engine:
+        engine = stt.get_engine_by_slug(args.engine).get_active_instance()
+        print("")
+        print("%-6s %10s  %s" % ('codec', 'latency', 'result'))
+        for slug, content_type in engine.CODECS:
+            if not get_encoder_by_slug(slug).is_available():
+                continue
+            engine.codec = slug
+            start = time.time()
+            result = engine.transcribe(segment)
+            print("%-6s %8.0fms  %r" % (slug, 1000 * (time.time() - start),
+                                        result))
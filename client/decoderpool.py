@@ -0,0 +1,121 @@
+# -*- coding: utf-8-*-
+"""
+A pool of STT decoders in worker processes.
+
+Decoding is CPU bound and the decoders hold the GIL, so utterances from
+several microphones can only be decoded in parallel by separate processes.
+A DecoderPool starts a number of worker processes with an engine instance
+(and thereby a decoder) of their own, and hands every utterance to a free
+one. When all workers are busy and queue_size utterances are already
+waiting, transcribe() blocks until one of them is done. An utterance that
+timed out still counts until its worker is really done with it.
+
+The workers create their temporary files (e.g. the PocketSphinx logfiles) in
+a directory of the pool, which is removed when the pool is closed, as
+terminated workers can't clean up after themselves.
+"""
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import threading
+
+import audio
+
+# the engine instance of a worker process
+_engine = None
+
+
+def _init_worker(engine_class, kwargs, tempdir):
+    global _engine
+    tempfile.tempdir = tempdir
+    _engine = engine_class(**kwargs)
+
+
+def _transcribe(data, rate, width, channels):
+    """
+    Returns:
+        A tuple (success, result), result is the exception if the engine
+        failed, as the pool only calls back for a successful call
+    """
+    segment = audio.AudioSegment(data, rate=rate, width=width,
+                                 channels=channels)
+    try:
+        return (True, list(_engine.transcribe(segment)))
+    except Exception as e:
+        return (False, e)
+
+
+class DecoderPool(object):
+
+    def __init__(self, engine_class, kwargs, size=2, queue_size=None,
+                 timeout=60):
+        """
+        Arguments:
+            engine_class -- the STT engine class every worker instantiates
+            kwargs -- the keyword arguments for engine_class
+            size -- the number of worker processes (Default: 2)
+            queue_size -- the number of utterances that may wait for a
+                          worker (Default: size)
+            timeout -- the number of seconds after which an utterance is
+                       given up (Default: 60)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.size = size
+        self.queue_size = size if queue_size is None else queue_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        # number of utterances that are being decoded or waiting
+        self._pending = 0
+        self._logger.debug("Starting %d decoder processes for %s", size,
+                           engine_class.__name__)
+        self._tempdir = tempfile.mkdtemp(prefix='decoderpool_')
+        self._pool = multiprocessing.Pool(size, _init_worker,
+                                          (engine_class, kwargs,
+                                           self._tempdir))
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def transcribe(self, segment):
+        """
+        Decodes an audio.AudioSegment in one of the worker processes and
+        waits for the result.
+
+        Raises:
+            multiprocessing.TimeoutError if no result came in time
+        """
+        with self._cond:
+            if self._pending >= self.size + self.queue_size:
+                self._logger.warning("All decoders are busy, waiting...")
+            while self._pending >= self.size + self.queue_size:
+                # Use a timeout, otherwise the wait can't be interrupted
+                # by KeyboardInterrupt
+                self._cond.wait(1)
+            self._pending += 1
+        try:
+            # the audio is pickled to the worker process, which copies it
+            # anyway, so it might as well be a str
+            result = self._pool.apply_async(
+                _transcribe, (segment.raw, segment.rate, segment.width,
+                              segment.channels), callback=self._done)
+        except Exception:
+            self._done(None)
+            raise
+        success, value = result.get(self.timeout)
+        if not success:
+            raise value
+        return value
+
+    def _done(self, result):
+        # called by the pool once a worker is done with an utterance, even
+        # if transcribe() has given up on it already
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+        shutil.rmtree(self._tempdir, ignore_errors=True)
@@ -5,10 +5,9 @@ import subprocess
 import tempfile
 import logging
 
-import yaml
-
 import diagnose
 import nikitapath
+import nikitaconfig
 
 
 class PhonetisaurusG2P(object):
@@ -65,22 +64,16 @@ class PhonetisaurusG2P(object):
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as pull request
-        # nikitaproject/nikita-client#128 has been merged
-
         conf = {'fst_model': os.path.join(nikitapath.APP_PATH, os.pardir,
                                           'phonetisaurus', 'g014b2b.fst')}
         # Try to get fst_model from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'pocketsphinx' in profile:
-                    if 'fst_model' in profile['pocketsphinx']:
-                        conf['fst_model'] = \
-                            profile['pocketsphinx']['fst_model']
-                    if 'nbest' in profile['pocketsphinx']:
-                        conf['nbest'] = int(profile['pocketsphinx']['nbest'])
+        profile = nikitaconfig.get_profile()
+        if 'pocketsphinx' in profile:
+            if 'fst_model' in profile['pocketsphinx']:
+                conf['fst_model'] = \
+                    profile['pocketsphinx']['fst_model']
+            if 'nbest' in profile['pocketsphinx']:
+                conf['nbest'] = int(profile['pocketsphinx']['nbest'])
         return conf
 
     def __new__(cls, fst_model=None, *args, **kwargs):
@@ -0,0 +1,92 @@
+# -*- coding: utf-8-*-
+"""
+A shared HTTP session for all network engines (STT, TTS and wit.ai intents).
+
+Reusing a single session keeps connections to the APIs alive between
+requests, so that an utterance doesn't have to wait for a new TCP and TLS
+handshake. The pool size, timeouts and retries can be set in the 'http'
+section of profile.yml:
+
+    http:
+      pool_size: 4
+      connect_timeout: 3.05
+      read_timeout: 30
+      retries: 2
+      backoff_factor: 0.3
+"""
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+import nikitaconfig
+
+
+class Session(requests.Session):
+    """
+    A requests.Session with a connection pool, default timeouts and retries
+    with exponential backoff.
+    """
+
+    def __init__(self, pool_size=4, connect_timeout=3.05, read_timeout=30,
+                 retries=2, backoff_factor=0.3):
+        """
+        Arguments:
+            pool_size -- the number of connections kept per host (Default: 4)
+            connect_timeout -- the number of seconds to wait for a connection
+                               (Default: 3.05)
+            read_timeout -- the number of seconds to wait for the response
+                            (Default: 30)
+            retries -- how often failed connections (and server errors for
+                       idempotent requests) are retried (Default: 2)
+            backoff_factor -- the delay before the n-th retry is
+                              backoff_factor * 2 ** (n - 1) seconds
+                              (Default: 0.3)
+        """
+        super(Session, self).__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        # uploads aren't idempotent, so only retry requests that didn't
+        # reach the server
+        retry = Retry(total=retries, connect=retries, read=0,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(Session, self).request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_config():
+    config = {}
+    profile = nikitaconfig.get_profile()
+    if 'http' in profile:
+        for key in ('pool_size', 'connect_timeout', 'read_timeout',
+                    'retries', 'backoff_factor'):
+            if key in profile['http']:
+                config[key] = profile['http'][key]
+    return config
+
+
+def get_session():
+    """
+    Returns:
+        The Session shared by all engines, which is created on first use
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            config = get_config()
+            logging.getLogger(__name__).debug(
+                "Creating HTTP session with config: %r", config)
+            _session = Session(**config)
+        return _session
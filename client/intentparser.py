@@ -0,0 +1,225 @@
+# -*- coding: utf-8-*-
+"""
+An offline intent parser, which replaces the wit.ai message API.
+
+Modules declare the intents they understand with example phrases in an
+INTENTS constant, e.g.
+
+    INTENTS = {'travel_time': ['how long does it take to get to {location}',
+                               'travel time to {location}']}
+
+The parts in braces are entities. More examples, e.g. from logged
+transcripts, can be added to intents.yml in the config dir, in the same
+format. A naive Bayes classifier over the words and word pairs of the
+examples picks the intent, and the examples of that intent are used as
+templates to extract the entities. Known values of an entity (a gazetteer,
+e.g. the titles in the Plex library) take precedence over the templates.
+
+The result has the same shape as a wit.ai outcome:
+
+    {'_text': 'travel time to detroit', 'intent': 'travel_time',
+     'confidence': 0.93,
+     'entities': {'location': [{'value': 'detroit', 'suggested': True}]}}
+"""
+import os
+import re
+import math
+import logging
+import threading
+import collections
+import yaml
+
+import nikitapath
+import registry
+
+ENTITY = re.compile(r'\{(\w+)\}')
+
+
+def tokenize(text):
+    """
+    Returns:
+        The lower case words of text
+    """
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def features(text):
+    """
+    Returns:
+        The words and the pairs of adjacent words of text
+    """
+    words = tokenize(text)
+    return words + [' '.join(pair) for pair in zip(words, words[1:])]
+
+
+class IntentParser(object):
+
+    def __init__(self, examples, min_confidence=0.5, smoothing=1.0):
+        """
+        Arguments:
+            examples -- a dict of intent names and lists of example phrases,
+                        entities are written as {name}
+            min_confidence -- the minimum posterior probability of an
+                              intent (Default: 0.5)
+            smoothing -- the additive smoothing of the word counts
+                         (Default: 1.0)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.min_confidence = min_confidence
+        self.smoothing = smoothing
+        self._templates = {}
+        self._counts = {}
+        self._totals = {}
+        self._priors = {}
+        vocabulary = set()
+        total = sum(len(phrases) for phrases in examples.values())
+        for intent, phrases in examples.items():
+            counts = collections.Counter()
+            for phrase in phrases:
+                # entities vary, only the words around them are features
+                counts.update(features(ENTITY.sub(' ', phrase)))
+            self._counts[intent] = counts
+            self._totals[intent] = sum(counts.values())
+            self._priors[intent] = math.log(float(len(phrases)) / total)
+            # the most specific template, with the most words, comes first
+            self._templates[intent] = [
+                self._template(phrase)
+                for phrase in sorted(phrases, reverse=True,
+                                     key=lambda p: len(ENTITY.sub('', p)))
+                if ENTITY.search(phrase)]
+            vocabulary.update(counts)
+        self._vocabulary = vocabulary
+
+    @classmethod
+    def get_instance(cls, modules=None):
+        """
+        Trains a parser with the INTENTS of the modules and the examples in
+        intents.yml.
+
+        Arguments:
+            modules -- (optional) the modules, by default all modules of the
+                       registry
+        """
+        if modules is None:
+            modules = registry.get_registry().modules
+        examples = collections.defaultdict(list)
+        for module in modules:
+            for intent, phrases in (getattr(module, 'INTENTS', None) or
+                                    {}).items():
+                examples[intent].extend(phrases)
+        path = nikitapath.config('intents.yml')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for intent, phrases in (yaml.safe_load(f) or {}).items():
+                    examples[intent].extend(phrases)
+        return cls(dict(examples))
+
+    @staticmethod
+    def _template(phrase):
+        parts = ENTITY.split(phrase)
+        pattern = ''
+        for i, part in enumerate(parts):
+            if i % 2:
+                pattern += r'(?P<%s>.+?)' % part
+            else:
+                pattern += r'\s+'.join(re.escape(word)
+                                       for word in part.split())
+                if part[-1:].isspace():
+                    pattern += r'\s+'
+        return re.compile(r'\b' + pattern + r'[.!?]*$', re.IGNORECASE)
+
+    def classify(self, text):
+        """
+        Returns:
+            A list of (probability, intent) tuples, most probable first, or
+            an empty list if none of the words of text are known
+        """
+        known = [feature for feature in features(text)
+                 if feature in self._vocabulary]
+        if not known:
+            # the priors alone would pick the intent with the most examples
+            return []
+        scores = {}
+        size = len(self._vocabulary)
+        for intent, counts in self._counts.items():
+            denominator = self._totals[intent] + self.smoothing * size
+            scores[intent] = self._priors[intent] + sum(
+                math.log((counts[feature] + self.smoothing) / denominator)
+                for feature in known)
+        if not scores:
+            return []
+        best = max(scores.values())
+        weights = dict((intent, math.exp(score - best))
+                       for intent, score in scores.items())
+        total = sum(weights.values())
+        return sorted(((weight / total, intent)
+                       for intent, weight in weights.items()),
+                      reverse=True)
+
+    def entities(self, intent, text, gazetteers=None):
+        """
+        Arguments:
+            intent -- the intent of text
+            text -- the phrase
+            gazetteers -- (optional) a dict of entity names and lists of
+                          their known values
+
+        Returns:
+            A dict of entity names and lists of values in wit.ai's format
+        """
+        text = ' '.join(text.split())
+        entities = {}
+        for template in self._templates.get(intent, []):
+            match = template.search(text)
+            if match:
+                for name, value in match.groupdict().items():
+                    entities[name] = [{'value': value, 'suggested': True}]
+                break
+        for name, values in (gazetteers or {}).items():
+            found = [value for value in values
+                     if re.search(r'\b%s\b' % re.escape(value), text,
+                                  re.IGNORECASE)]
+            if found:
+                value = max(found, key=len)
+                entities[name] = [{'value': value, 'suggested': True}]
+        return entities
+
+    def parse(self, text, gazetteers=None):
+        """
+        Arguments:
+            text -- the phrase
+            gazetteers -- (optional) a dict of entity names and lists of
+                          their known values
+
+        Returns:
+            The outcome in wit.ai's format, or an empty dict if no intent
+            is probable enough
+        """
+        ranking = self.classify(text)
+        if not ranking or ranking[0][0] < self.min_confidence:
+            self._logger.debug("No intent for '%s': %r", text, ranking)
+            return {}
+        confidence, intent = ranking[0]
+        outcome = {'_text': text,
+                   'intent': intent,
+                   'confidence': confidence,
+                   'entities': self.entities(intent, text, gazetteers)}
+        self._logger.info('Intent: %r', outcome)
+        return outcome
+
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """
+    Returns:
+        The IntentParser shared by all modules, which is trained on first
+        use
+    """
+    global _parser
+    with _parser_lock:
+        if _parser is None:
+            _parser = IntentParser.get_instance()
+        return _parser
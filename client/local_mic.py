@@ -44,3 +44,9 @@ class Mic:
                                    %s, %s)", (self.profile['nikita_id'],
                                    speechType, phrase))
             self.db.commit()
+
+    def wait(self):
+        pass
+
+    def flush(self):
+        pass
@@ -0,0 +1,286 @@
+# -*- coding: utf-8-*-
+"""
+A manifest of the plugin modules, so that they don't have to be imported
+at startup.
+
+For every module, the manifest records its WORDS, its PRIORITY, its SCORE,
+its INTENTS (see the intentparser module), whether it has a score function
+and the regular expression its isValid function searches for. These are
+read from the module's source code without running it. Only if a value isn't
+a plain literal, the module is imported once to get it. The manifest is stored
+together with a hash of each module's source, so that changed modules are
+described again.
+
+The registry hands out LazyModule instances built from the manifest. They
+only import the real module when it is needed: to handle a phrase, or to
+call an isValid function that doesn't just search for a pattern.
+"""
+import ast
+import json
+import hashlib
+import logging
+import pkgutil
+import re
+import threading
+import time
+
+# the version of the entries, older entries are described again
+VERSION = 3
+
+
+def source_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def describe(location, name, path, on_load=None):
+    """
+    Describes a module from its source code.
+
+    Arguments:
+        location -- the directory that contains the module
+        name -- the name of the module
+        path -- the source file of the module
+        on_load -- (optional) called with the name and the load time if the
+                   module had to be imported
+
+    Returns:
+        A dict with the manifest entry of the module
+    """
+    entry = {'name': name, 'location': location, 'path': path,
+             'hash': source_hash(path), 'version': VERSION, 'words': None,
+             'priority': None, 'score': None, 'intents': None,
+             'scored': False, 'pattern': None, 'flags': 0}
+    try:
+        with open(path, 'r') as f:
+            tree = ast.parse(f.read(), path)
+    except SyntaxError:
+        tree = ast.Module(body=[])
+    constants = {}
+    literal = True
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+           isinstance(node.targets[0], ast.Name):
+            target = node.targets[0].id
+            try:
+                constants[target] = _literal(node.value, constants)
+            except ValueError:
+                if target in ('WORDS', 'PRIORITY', 'SCORE', 'INTENTS'):
+                    literal = False
+        elif isinstance(node, ast.FunctionDef) and node.name == 'isValid':
+            entry['pattern'], entry['flags'] = _search_pattern(node,
+                                                               constants)
+        elif isinstance(node, ast.FunctionDef) and node.name == 'score':
+            entry['scored'] = True
+    if literal:
+        entry['words'] = constants.get('WORDS')
+        entry['priority'] = constants.get('PRIORITY', 0)
+        entry['score'] = constants.get('SCORE', 1.0)
+        entry['intents'] = constants.get('INTENTS')
+    else:
+        mod = _import(location, name, on_load)
+        entry['words'] = getattr(mod, 'WORDS', None)
+        entry['priority'] = getattr(mod, 'PRIORITY', 0)
+        entry['score'] = getattr(mod, 'SCORE', 1.0)
+        entry['intents'] = getattr(mod, 'INTENTS', None)
+    if entry['words'] is not None:
+        entry['words'] = list(entry['words'])
+    return entry
+
+
+def _literal(node, constants):
+    """
+    Evaluates string and number literals, lists and dicts of them, the
+    concatenation of strings and names of constants assigned before.
+    """
+    if isinstance(node, ast.Name) and node.id in constants:
+        return constants[node.id]
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left = _literal(node.left, constants)
+        right = _literal(node.right, constants)
+        if isinstance(left, basestring) and isinstance(right, basestring):
+            return left + right
+        raise ValueError("Not a literal")
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise ValueError("Not a literal")
+
+
+def _search_pattern(function, constants):
+    """
+    Returns:
+        A tuple (pattern, flags) if the function only returns
+        bool(re.search(pattern, text[, flags])) or True, else (None, 0)
+    """
+    body = [node for node in function.body
+            if not (isinstance(node, ast.Expr) and
+                    isinstance(node.value, ast.Str))]
+    if len(body) != 1 or not isinstance(body[0], ast.Return):
+        return (None, 0)
+    value = body[0].value
+    if isinstance(value, ast.Name) and value.id == 'True':
+        # matches everything
+        return ('', 0)
+    if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) \
+       and value.func.id == 'bool' and len(value.args) == 1:
+        value = value.args[0]
+    if not (isinstance(value, ast.Call) and
+            isinstance(value.func, ast.Attribute) and
+            isinstance(value.func.value, ast.Name) and
+            value.func.value.id == 're' and value.func.attr == 'search' and
+            len(value.args) in (2, 3) and not value.keywords):
+        return (None, 0)
+    # the pattern has to be searched in the argument
+    argument = value.args[1]
+    if not (function.args.args and isinstance(argument, ast.Name) and
+            argument.id == function.args.args[0].id):
+        return (None, 0)
+    try:
+        pattern = _literal(value.args[0], constants)
+    except ValueError:
+        return (None, 0)
+    flags = 0
+    if len(value.args) == 3:
+        names = []
+        flag = value.args[2]
+        while isinstance(flag, ast.BinOp) and isinstance(flag.op, ast.BitOr):
+            names.append(flag.right)
+            flag = flag.left
+        names.append(flag)
+        for node in names:
+            if not (isinstance(node, ast.Attribute) and
+                    isinstance(node.value, ast.Name) and
+                    node.value.id == 're' and
+                    isinstance(getattr(re, node.attr, None), int)):
+                return (None, 0)
+            flags |= getattr(re, node.attr)
+    return (pattern, flags)
+
+
+def _import(location, name, on_load=None):
+    start = time.time()
+    try:
+        loader = pkgutil.get_importer(location).find_module(name)
+        return loader.load_module(name)
+    finally:
+        if on_load is not None:
+            on_load(name, time.time() - start)
+
+
+def load(path):
+    """
+    Returns:
+        The manifest entries stored in path by name, or an empty dict if
+        there are none
+    """
+    try:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    return dict((entry['name'], entry) for entry in entries)
+
+
+def save(path, entries):
+    with open(path, 'w') as f:
+        json.dump(sorted(entries.values(), key=lambda entry: entry['name']),
+                  f, indent=2, sort_keys=True)
+
+
+def _str(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+
+class LazyModule(object):
+    """
+    Stands in for a plugin module and imports it on first use.
+    """
+
+    def __init__(self, entry, on_load=None):
+        """
+        Arguments:
+            entry -- the manifest entry of the module
+            on_load -- (optional) called with the name and the load time when
+                       the module is imported
+        """
+        self._logger = logging.getLogger(__name__)
+        self.__name__ = _str(entry['name'])
+        self.WORDS = [_str(word) for word in entry['words']]
+        self.PRIORITY = entry['priority']
+        self.SCORE = entry.get('score', 1.0)
+        self.INTENTS = None
+        if entry.get('intents') is not None:
+            self.INTENTS = dict((_str(intent), [_str(phrase)
+                                                for phrase in phrases])
+                                for intent, phrases
+                                in entry['intents'].items())
+        # whether the module has a score function of its own
+        self.scored = entry.get('scored', False)
+        self._location = entry['location']
+        self._on_load = on_load
+        # the regular expression isValid searches for, if it is known
+        self.pattern = None
+        self.flags = entry['flags']
+        self._regex = None
+        if entry['pattern'] is not None:
+            self.pattern = _str(entry['pattern'])
+            self._regex = re.compile(self.pattern, self.flags)
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """
+        Returns:
+            The real module, which is imported on the first call
+        """
+        with self._lock:
+            if self._module is None:
+                self._logger.debug("Importing module '%s'", self.__name__)
+                self._module = _import(self._location, self.__name__,
+                                       self._on_load)
+        return self._module
+
+    def isValid(self, text):
+        if self._regex is not None:
+            return bool(self._regex.search(text))
+        try:
+            module = self.load()
+        except Exception:
+            self._logger.warning("Skipped module '%s' due to an error.",
+                                 self.__name__, exc_info=True)
+            return False
+        return module.isValid(text)
+
+    def score(self, text):
+        """
+        Returns:
+            How well the module matches text, between 0 (not at all) and 1
+        """
+        if self.scored:
+            return self.load().score(text)
+        return self.SCORE if self.isValid(text) else 0.0
+
+    def handle(self, text, mic, profile):
+        return self.load().handle(text, mic, profile)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__name__
+
+
+if __name__ == '__main__':
+    import nikitapath
+
+    for finder, name, ispkg in pkgutil.iter_modules([nikitapath.PLUGIN_PATH]):
+        entry = describe(nikitapath.PLUGIN_PATH, name,
+                         finder.find_module(name).get_filename())
+        print("%-16s %-8s %r" % (name, entry['priority'], entry['pattern']))
@@ -3,12 +3,27 @@
     The Mic class handles all interactions with the microphone and speaker.
 """
 import logging
-import tempfile
-import wave
-import audioop
+import collections
+import threading
+import time
 import pyaudio
 import alteration
+import audio
 import nikitapath
+import player
+import speechqueue
+import ttscache
+import vad
+
+# sample rate and number of frames per chunk of the capture stream
+RATE = 16000
+CHUNK = 1024
+
+# number of seconds of audio kept in the capture ring buffer
+BUFFER_TIME = 30
+
+# maximum number of seconds between playing a sound and capturing it
+PLAYBACK_LATENCY = 0.1
 
 
 class Mic:
@@ -29,6 +44,9 @@ class Mic:
         """
         self._logger = logging.getLogger(__name__)
         self.speaker = speaker
+        # phrases are spoken in the background, see say()
+        self._speech = speechqueue.SpeechQueue(
+            speaker, cache=ttscache.TTSCache.get_instance(profile))
         self.passive_stt_engine = passive_stt_engine
         self.active_stt_engine = active_stt_engine
         self._logger.info("Initializing PyAudio. ALSA/Jack error messages " +
@@ -36,59 +54,86 @@ class Mic:
                           "can usually be safely ignored.")
         self._audio = pyaudio.PyAudio()
         self._logger.info("Initialization of PyAudio completed.")
+        # play sounds through PyAudio as well instead of running aplay
+        if profile.get('playback', 'aplay') == player.PyAudioPlayer.SLUG:
+            speaker.player = player.PyAudioPlayer(self._audio)
+        for beep in ('beep_hi.wav', 'beep_lo.wav'):
+            speaker.player.preload(nikitapath.data('audio', beep))
+        # a single input stream stays open for the lifetime of this instance
+        self._stream = audio.CaptureStream(self._audio, pyaudio.paInt16,
+                                           rate=RATE, chunk=CHUNK,
+                                           buffer_time=BUFFER_TIME)
+        # position in the capture stream at which passive listening stopped,
+        # so that the following active listen doesn't miss anything
+        self._resume_position = None
         self.db = db
         self.db_cursor = self.db.cursor()
         self.profile = profile
+        # decides which parts of the captured audio contain speech
+        vad_profile = profile.get('vad', {})
+        vad_class = vad.get_detector_by_slug(
+            vad_profile.get('detector', vad.get_default_detector_slug()))
+        width = pyaudio.get_sample_size(pyaudio.paInt16)
+        self._vad = vad_class.get_instance(profile, rate=RATE, width=width)
+        # a second detector follows the noise of the room on the capture
+        # thread, so that no listen has to spend time on calibration
+        self._noise_tracker = vad_class.get_instance(profile, rate=RATE,
+                                                     width=width)
+        self._stream.add_listener(self._noise_tracker.track)
+        self._stream.start()
+        # decode the passive stream chunk by chunk if the engine supports it
+        self._passive_streaming = (
+            getattr(passive_stt_engine, 'INCREMENTAL', False) and
+            profile.get('stt_passive_streaming', True))
+        # upload the active recording while it is being made if possible
+        self._active_streaming = (
+            getattr(active_stt_engine, 'STREAMING', False) and
+            profile.get('stt_active_streaming', True))
+        # keep listening for the keyword while speaking
+        self._barge_in = (self._passive_streaming and
+                          profile.get('barge_in', False))
+        # the keyword of the last passive listen and whether it has been said
+        # while Nikita was speaking
+        self._persona = None
+        self._interrupted = False
+        # the thread playing the low beep after an active listen
+        self._beep = None
 
     def __del__(self):
+        self._stream.stop()
+        self.speaker.player.close()
         self._audio.terminate()
 
-    def getScore(self, data):
-        rms = audioop.rms(data, 2)
-        score = rms / 3
-        return score
-
-    def fetchThreshold(self):
-
-        # TODO: Consolidate variables from the next three functions
-        THRESHOLD_MULTIPLIER = 1.8
-        RATE = 16000
-        CHUNK = 1024
-
-        # number of seconds to allow to establish threshold
-        THRESHOLD_TIME = 1
-
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
-
-        # stores the audio data
-        frames = []
+    def _recorder(self, max_time):
+        return audio.Recorder(max_time, rate=RATE,
+                              width=pyaudio.get_sample_size(pyaudio.paInt16))
 
-        # stores the lastN score values
-        lastN = [i for i in range(20)]
+    @property
+    def noise_floor(self):
+        """
+        The current estimate of the background noise energy (RMS), which is
+        continuously updated from the live capture stream.
+        """
+        return self._noise_tracker.noise_floor
 
-        # calculate the long run average, and thereby the proper threshold
-        for i in range(0, RATE / CHUNK * THRESHOLD_TIME):
+    def fetchThreshold(self):
+        """
+        Calibrates the voice activity detector with the current noise
+        statistics of the room.
 
-            data = stream.read(CHUNK)
-            frames.append(data)
+        Returns:
+            The energy above which sound is considered as speech
+        """
 
-            # save this data point as a score
-            lastN.pop(0)
-            lastN.append(self.getScore(data))
-            average = sum(lastN) / len(lastN)
+        # directly after startup, the tracker might not have seen any audio
+        stream = self._stream.reader()
+        while self._noise_tracker.threshold is None:
+            stream.read()
 
-        stream.stop_stream()
-        stream.close()
+        self._vad.load_calibration(self._noise_tracker.calibration)
 
         # this will be the benchmark to cause a disturbance over!
-        THRESHOLD = average * THRESHOLD_MULTIPLIER
-
-        return THRESHOLD
+        return self._vad.threshold
 
     def passiveListen(self, PERSONA):
         """
@@ -96,101 +141,165 @@ class Mic:
         needs to be restarted.
         """
 
-        THRESHOLD_MULTIPLIER = 1.8
-        RATE = 16000
-        CHUNK = 1024
+        self._persona = PERSONA
+        try:
+            self.wait()
+        except audio.Interrupted:
+            pass
+        if self._interrupted:
+            # PERSONA has already been said while Nikita was speaking
+            self._interrupted = False
+            return (self.fetchThreshold(), PERSONA)
 
-        # number of seconds to allow to establish threshold
-        THRESHOLD_TIME = 1
+        if self._passive_streaming:
+            return self.passiveListenStreaming(PERSONA)
 
         # number of seconds to listen before forcing restart
         LISTEN_TIME = 10
 
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
-
-        # stores the audio data
-        frames = []
-
-        # stores the lastN score values
-        lastN = [i for i in range(30)]
-
-        # calculate the long run average, and thereby the proper threshold
-        for i in range(0, RATE / CHUNK * THRESHOLD_TIME):
+        # number of chunks recorded before the disturbance to keep
+        PREROLL = 20
 
-            data = stream.read(CHUNK)
-            frames.append(data)
+        THRESHOLD = self.fetchThreshold()
 
-            # save this data point as a score
-            lastN.pop(0)
-            lastN.append(self.getScore(data))
-            average = sum(lastN) / len(lastN)
-
-        # this will be the benchmark to cause a disturbance over!
-        THRESHOLD = average * THRESHOLD_MULTIPLIER
-
-        # save some memory for sound data
-        frames = []
+        stream = self._stream.reader()
+        self._vad.reset()
 
         # flag raised when sound disturbance detected
         didDetect = False
 
-        # start passively listening for disturbance above threshold
+        # start passively listening for speech
         for i in range(0, RATE / CHUNK * LISTEN_TIME):
 
-            data = stream.read(CHUNK)
-            frames.append(data)
-            score = self.getScore(data)
+            data = stream.read()
 
-            if score > THRESHOLD:
+            if self._vad.process(data) == vad.SPEECH_START:
                 didDetect = True
                 break
 
         # no use continuing if no flag raised
         if not didDetect:
             self._logger.debug('No distrubance detected')
-            stream.stop_stream()
-            stream.close()
             return (None, None)
 
-        # cutoff any recording before this disturbance was detected
-        frames = frames[-20:]
+        # rewind the stream, so that the recording includes the audio right
+        # before this disturbance was detected
+        stream = self._stream.reader(position=stream.position,
+                                     preroll=PREROLL)
 
         # otherwise, let's keep recording for few seconds and save the file
         DELAY_MULTIPLIER = 1
-        for i in range(0, RATE / CHUNK * DELAY_MULTIPLIER):
-
-            data = stream.read(CHUNK)
-            frames.append(data)
-
-        # save the audio data
-        stream.stop_stream()
-        stream.close()
-
-        with tempfile.NamedTemporaryFile(mode='w+b') as f:
-            wav_fp = wave.open(f, 'wb')
-            wav_fp.setnchannels(1)
-            wav_fp.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
-            wav_fp.setframerate(RATE)
-            wav_fp.writeframes(''.join(frames))
-            wav_fp.close()
-            f.seek(0)
-            # check if PERSONA was said
-            transcribed = self.passive_stt_engine.transcribe(f)
+        recorder = self._recorder(float(PREROLL) * CHUNK / RATE +
+                                  DELAY_MULTIPLIER)
+        for i in range(0, PREROLL + RATE / CHUNK * DELAY_MULTIPLIER):
+
+            recorder.append(stream.read())
+
+        # check if PERSONA was said
+        transcribed = self.passive_stt_engine.transcribe(recorder.segment())
 
         if any(PERSONA in phrase for phrase in transcribed):
+            # the active listen that follows will start right here
+            self._resume_position = stream.position
+            return (THRESHOLD, PERSONA)
+
+        return (False, transcribed)
+
+    def passiveListenStreaming(self, PERSONA):
+        """
+        Listens for PERSONA by feeding the captured audio directly into the
+        passive STT engine as soon as the voice activity detector hears
+        speech. Returns as soon as the partial hypothesis contains PERSONA.
+        Times out after LISTEN_TIME, so needs to be restarted.
+        """
+
+        # number of seconds to listen before forcing restart
+        LISTEN_TIME = 10
+
+        # number of chunks recorded before the speech was detected to decode
+        PREROLL = 20
+
+        # this will be returned as the benchmark for the active listen
+        THRESHOLD = self.fetchThreshold()
+
+        # start a little in the past, so that a keyword that has been said
+        # right before this listen isn't missed
+        end = self._stream.buffer.head + RATE / CHUNK * LISTEN_TIME
+        stream = self._stream.reader(preroll=PREROLL)
+        found, transcribed = self._spot(PERSONA, stream,
+                                        lambda: stream.position >= end,
+                                        PREROLL=PREROLL)
+
+        if found:
+            # the active listen that follows will start right here
+            self._resume_position = stream.position
             return (THRESHOLD, PERSONA)
 
+        if not transcribed:
+            self._logger.debug('Nothing has been transcribed')
+            return (None, None)
+        return (False, transcribed)
+
+    def _spot(self, PERSONA, stream, stop, PREROLL=20, transform=None):
+        """
+        Feeds the speech in stream into the passive STT engine, utterance by
+        utterance, until PERSONA is part of the partial hypothesis.
+
+        Arguments:
+        PERSONA -- the keyword to listen for
+        stream -- the StreamReader to read from
+        stop -- a callable that returns True when listening should end
+        PREROLL -- the number of chunks before the detected speech to decode
+        transform -- (optional) a callable that is applied to every chunk
+                     before it is processed
+
+        Returns:
+            A tuple (found, transcribed), where transcribed contains the
+            phrases of the last complete utterance
+        """
+        self._vad.reset()
+        recent = collections.deque(maxlen=PREROLL)
+        transcribed = []
+        in_utterance = False
+        while not stop():
+            data = stream.read()
+            if transform is not None:
+                data = transform(data)
+            recent.append(data)
+            event = self._vad.process(data)
+
+            if event == vad.SPEECH_START:
+                # decode the audio that led to the detection, too
+                self.passive_stt_engine.start_utterance()
+                in_utterance = True
+                for chunk in recent:
+                    hypothesis = self.passive_stt_engine.process_chunk(chunk)
+                    if PERSONA in hypothesis:
+                        break
+            elif in_utterance:
+                hypothesis = self.passive_stt_engine.process_chunk(data)
+            else:
+                continue
+
+            if PERSONA in hypothesis:
+                self.passive_stt_engine.end_utterance()
+                return (True, [hypothesis])
+
+            if event == vad.SPEECH_END:
+                transcribed = self.passive_stt_engine.end_utterance()
+                in_utterance = False
+
+        if in_utterance:
+            transcribed = self.passive_stt_engine.end_utterance()
         return (False, transcribed)
 
     def activeListen(self, THRESHOLD=None, LISTEN=True, MUSIC=False):
         """
             Records until a second of silence or times out after 12 seconds
 
+            THRESHOLD is deprecated and ignored, the voice activity detector
+            is calibrated with the current noise statistics instead.
+
             Returns the first matching string or None
         """
 
@@ -201,70 +310,100 @@ class Mic:
     def activeListenToAllOptions(self, THRESHOLD=None, LISTEN=True,
                                  MUSIC=False):
         """
-            Records until a second of silence or times out after 12 seconds
+            Records until the voice activity detector hears the end of speech
+            or times out after 12 seconds
+
+            THRESHOLD is deprecated and ignored, the voice activity detector
+            is calibrated with the current noise statistics instead.
 
             Returns a list of the matching options or None
         """
 
-        RATE = 16000
-        CHUNK = 1024
         LISTEN_TIME = 12
 
-        # check if no threshold provided
-        if THRESHOLD is None:
-            THRESHOLD = self.fetchThreshold()
+        # number of seconds to wait for speech to start
+        NO_SPEECH_TIME = 3
+
+        self.fetchThreshold()
 
+        # don't record Nikita's own voice
+        self.wait()
+
+        beep_start = time.time()
         self.speaker.play(nikitapath.data('audio', 'beep_hi.wav'))
 
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
+        # resume where passive listening stopped, if possible
+        stream = self._stream.reader(position=self._resume_position)
+        self._resume_position = None
+        # the microphone picks up the beep, which isn't part of the command
+        stream.mute(beep_start, time.time() + PLAYBACK_LATENCY)
 
-        frames = []
-        # increasing the range # results in longer pause after command
-        # generation
-        lastN = [THRESHOLD * 1.2 for i in range(30)]
+        chunks = self._utterance(stream, LISTEN_TIME, NO_SPEECH_TIME)
 
-        for i in range(0, RATE / CHUNK * LISTEN_TIME):
+        if self._active_streaming:
+            return self.active_stt_engine.transcribe_stream(
+                chunks, rate=RATE,
+                width=pyaudio.get_sample_size(pyaudio.paInt16))
 
-            data = stream.read(CHUNK)
-            frames.append(data)
-            score = self.getScore(data)
+        recorder = self._recorder(LISTEN_TIME)
+        for data in chunks:
+            recorder.append(data)
 
-            lastN.pop(0)
-            lastN.append(score)
+        return self.active_stt_engine.transcribe(recorder.segment())
 
-            average = sum(lastN) / float(len(lastN))
+    def _utterance(self, stream, LISTEN_TIME, NO_SPEECH_TIME):
+        """
+        Yields the chunks read from stream until the voice activity detector
+        hears the end of speech, or no speech started within NO_SPEECH_TIME,
+        or LISTEN_TIME is over. Then the low beep is played.
+        """
+        self._vad.reset()
+        heard_speech = False
 
-            # TODO: 0.8 should not be a MAGIC NUMBER!
-            if average < THRESHOLD * 0.8:
-                break
+        for i in range(0, RATE / CHUNK * LISTEN_TIME):
 
-        self.speaker.play(nikitapath.data('audio', 'beep_lo.wav'))
+            data = stream.read()
+            yield data
+            event = self._vad.process(data)
 
-        # save the audio data
-        stream.stop_stream()
-        stream.close()
+            if event == vad.SPEECH_START:
+                heard_speech = True
+            elif event == vad.SPEECH_END:
+                break
+            elif (not heard_speech and
+                  i >= RATE / CHUNK * NO_SPEECH_TIME):
+                self._logger.debug('No speech detected')
+                break
+
+        # don't delay the end of an upload in progress with the beep, say()
+        # and wait() let it finish before anything else is played
+        self._beep = threading.Thread(target=self.speaker.play,
+                                      args=(nikitapath.data('audio',
+                                                            'beep_lo.wav'),))
+        self._beep.daemon = True
+        self._beep.start()
 
-        with tempfile.SpooledTemporaryFile(mode='w+b') as f:
-            wav_fp = wave.open(f, 'wb')
-            wav_fp.setnchannels(1)
-            wav_fp.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
-            wav_fp.setframerate(RATE)
-            wav_fp.writeframes(''.join(frames))
-            wav_fp.close()
-            f.seek(0)
-            return self.active_stt_engine.transcribe(f)
+    def _finishBeep(self):
+        """
+        Blocks until the low beep of the last active listen has been played,
+        as the output device can only play one sound at a time.
+        """
+        beep = self._beep
+        if beep is not None:
+            beep.join()
+            self._beep = None
 
     def say(self, speechType, phrase,
             OPTIONS=" -vdefault+m3 -p 40 -s 160 --stdout > say.wav"):
+        """
+        Queues phrase to be spoken and returns immediately. Listening waits
+        until everything has been said, use wait() to wait for it explicitly.
+        """
         # alter phrase before speaking
         phrase = alteration.clean(phrase)
         self._logger.transcript('Returned: %r|%r', speechType, phrase)
-        self.speaker.say(phrase)
+        self._finishBeep()
+        self._speech.say(phrase)
         if speechType == 'I':
             self.db_cursor.execute("INSERT INTO transcript (nikita_id, \
                                    create_timestamp, speech_type, \
@@ -272,3 +411,57 @@ class Mic:
                                    %s, %s)", (self.profile['nikita_id'],
                                    speechType, phrase))
             self.db.commit()
+
+    def wait(self):
+        """
+        Blocks until everything passed to say() has been spoken.
+
+        Raises:
+            audio.Interrupted if barge-in is enabled and the keyword of the
+            last passive listen has been heard meanwhile. The remaining
+            phrases have been dropped then and the next passive listen
+            returns at once.
+        """
+        self._finishBeep()
+        if self._barge_in and self._persona and self._speech.busy:
+            self._waitInterruptible()
+        else:
+            self._speech.wait()
+
+    def flush(self):
+        """
+        Drops everything passed to say() that hasn't been spoken yet.
+        """
+        self._speech.flush()
+
+    def _waitInterruptible(self):
+        """
+        Listens for the keyword of the last passive listen while phrases are
+        being spoken. Nikita's own voice is removed from the captured audio
+        as long as the speaker reports what it is playing.
+        """
+        width = pyaudio.get_sample_size(pyaudio.paInt16)
+        # [suppressor, start time of the sound it was created for]
+        echo = [None, None]
+        self.fetchThreshold()
+        stream = self._stream.reader()
+
+        def suppress(data):
+            playing = getattr(self.speaker, 'now_playing', None)
+            if not playing or playing[0] is None:
+                return data
+            if echo[1] != playing[1]:
+                echo[:] = [audio.EchoSuppressor(*playing), playing[1]]
+            # align with the output at capture time, the reader may lag
+            return echo[0].process(data, width=width, rate=RATE,
+                                   now=stream.timestamp)
+
+        found, transcribed = self._spot(self._persona, stream,
+                                        lambda: not self._speech.busy,
+                                        transform=suppress)
+        if found:
+            self._logger.info("Interrupted by keyword '%s'", self._persona)
+            self.flush()
+            self._resume_position = stream.position
+            self._interrupted = True
+            raise audio.Interrupted()
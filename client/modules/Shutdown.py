@@ -28,6 +28,7 @@ def handle(text, mic, profile):
             mic.say('A', "Alright, I will stay alive.")
         elif 'yes' in text.lower():
             mic.say('A', "It was nice knowing you. Good bye.")
+            mic.wait()
             os.system("shutdown -h now")
         else:
             mic.say('A', "I did not get that so I will stay alive.")
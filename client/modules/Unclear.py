@@ -5,6 +5,8 @@ import random
 WORDS = []
 
 PRIORITY = -(maxint + 1)
+# only used if no other module matches any alternative
+SCORE = 0.01
 
 
 def handle(text, mic, profile):
@@ -16,6 +16,8 @@ from client import app_utils
 
 WORDS = ["WHO", "WHAT", "HOW", "TELL", "ME", "ABOUT", "WHEN", "DEFINE"]
 PRIORITY = -1
+# any question matches, so a more specific module on another alternative wins
+SCORE = 0.5
 
 
 def handle(text, mic, profile):
@@ -25,6 +25,34 @@ from client import app_utils
 WORDS = ["PLEX", "PLAY", "PAUSE", "STOP", "YES", "NO", "REWIND", "PAWS"]
 PRIORITY = 4
 
+INTENTS = {'query_movie': ['play {title}',
+                           'play the movie {title}',
+                           'play movie {title}',
+                           'plex play {title}',
+                           'i want to watch {title}',
+                           'can you play {title}',
+                           'please play {title}']}
+
+PLEX_DB = '/home/pi/com.plexapp.plugins.library.db'
+
+
+def getTitles():
+    """
+        Returns the titles of the movies in the Plex library, or an empty
+        list if the library can't be read.
+    """
+    try:
+        dbCon = sqlite3.connect(PLEX_DB)
+        try:
+            cur = dbCon.cursor()
+            cur.execute("SELECT title FROM metadata_items \
+                         WHERE library_section_id=1;")
+            return [row[0] for row in cur.fetchall() if row[0]]
+        finally:
+            dbCon.close()
+    except sqlite3.Error:
+        return []
+
 
 def handle(text, mic, profile):
     """
@@ -62,7 +90,7 @@ def handle(text, mic, profile):
         # tries to find the movie provided in the plex database
         # return the name of the movie and information required to play
         try:
-            dbCon = sqlite3.connect('/home/pi/com.plexapp.plugins.library.db')
+            dbCon = sqlite3.connect(PLEX_DB)
 
             # add wildcard before 's'
             temp = ""
@@ -196,16 +224,17 @@ def handle(text, mic, profile):
     # play operation
     if 'play' in text.lower():
         # attempt to use wit to determine intent
-        intent = app_utils.determineIntent(profile, text)
+        intent = app_utils.determineIntent(profile, text,
+                                           {'title': getTitles()})
         # Use intent if found
         if intent:
             # check intent (play, stop, rewind, etc)
             if json.loads(json.dumps(intent))['intent'] == 'query_movie':
-                witSuggestion = (json.loads(json.dumps(intent))['entities']
-                                 ['title'][0]['suggested'])
-                if witSuggestion:
-                    movie = (json.loads(json.dumps(intent))['entities']
-                             ['title'][0]['value'])
+                # the intent may come without a title
+                titles = (json.loads(json.dumps(intent))
+                          .get('entities', {}).get('title'))
+                if titles and titles[0]['suggested']:
+                    movie = titles[0]['value']
                     movieID = findMovie(movie)
                     playMovie(movieID)
                     mic.say('I', "Now playing " + str(movie) + "...")
@@ -22,6 +22,16 @@ from client import app_utils
 WORDS = ["TRAFFIC", "CRASHES", "ACCIDENTS", "COMMUTE", "HOW", "LONG",
          "DOES", "IT", "TAKE", "TO", "GET", "WORK"]
 
+INTENTS = {'travel_time': ['how long does it take to get to {location}',
+                           'how long does it take to drive to {location}',
+                           'how long will it take to get to {location}',
+                           'how long is the drive to {location}',
+                           'how long to get to {location}',
+                           'how far is {location}',
+                           'what is the travel time to {location}',
+                           'travel time to {location}',
+                           'commute to {location}']}
+
 
 def getTraffic(profile, db):
     f = urllib2.urlopen('http://dev.virtualearth.net/REST/v1/Traffic' +
@@ -108,17 +118,23 @@ def handle(text, mic, profile):
         else:
             mic.say('A', "I am currently unable to retrieve this information")
     else:
-        intent = app_utils.determineIntent(profile, text)
+        intent = app_utils.determineIntent(
+            profile, text, {'location': profile.get('locations', {}).keys()})
         # Use intent if found
         if intent:
             # check intent to get destination
             if json.loads(json.dumps(intent))['intent'] == 'travel_time':
-                witSuggestion = (json.loads(json.dumps(intent))['entities']
-                                 ['location'][0]['suggested'])
-                if witSuggestion:
-                    location = (json.loads(json.dumps(intent))['entities']
-                             ['location'][0]['value'])
-                    coordinates = getCoordinates(profile, mic.db, location)
+                # the intent may come without a location
+                locations = (json.loads(json.dumps(intent))
+                             .get('entities', {}).get('location'))
+                if locations and locations[0]['suggested']:
+                    location = locations[0]['value']
+                    # known locations are looked up in the profile
+                    if location in profile.get('locations', {}):
+                        coordinates = profile['locations'][location]
+                    else:
+                        coordinates = getCoordinates(profile, mic.db,
+                                                     location)
                     travelTime = getTravelTime(profile, mic.db,
                                                profile['locations']['home'],
                                                coordinates)
@@ -126,6 +142,9 @@ def handle(text, mic, profile):
                         mic.say('I', "Travel time to " + location + " is " + travelTime + ".")
                     else:
                         mic.say('A', "I am currently unable to retrieve this information")
+                else:
+                    mic.say('A', "I'm sorry. I did not catch where you " +
+                            "would like to go.")
 
 
 def isValid(text):
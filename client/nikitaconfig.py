@@ -0,0 +1,83 @@
+# -*- coding: utf-8-*-
+"""
+The profile (profile.yml), which is shared by Nikita, the engines, the
+vocabularies and the modules.
+
+The file is parsed once, on first use. Afterwards, get_profile() returns the
+same read-only Profile, so that nobody can change the settings of everybody
+else by accident. With reload=True, the file is parsed again if it has been
+modified since it was loaded.
+"""
+import os
+import logging
+import threading
+import yaml
+
+import nikitapath
+
+
+class Profile(dict):
+    """
+    A dict that can't be modified. Nested dicts are Profiles as well and
+    nested lists are tuples.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(Profile, self).__init__(*args, **kwargs)
+        for key, value in self.items():
+            dict.__setitem__(self, key, _freeze(value))
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("The profile is read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return Profile(value)
+    elif isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+_profile = None
+_mtime = None
+_lock = threading.Lock()
+
+
+def get_profile(reload=False):
+    """
+    Arguments:
+        reload -- parse the file again if it has been modified since it has
+                  been loaded (Default: False)
+
+    Returns:
+        The Profile, which is empty if there is no profile.yml
+    """
+    global _profile, _mtime
+    path = nikitapath.config('profile.yml')
+    with _lock:
+        if _profile is not None and not reload:
+            return _profile
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if _profile is None or mtime != _mtime:
+            _profile = load(path) if mtime is not None else Profile()
+            _mtime = mtime
+        return _profile
+
+
+def load(path):
+    """
+    Parses a profile file.
+
+    Returns:
+        A Profile
+    """
+    logging.getLogger(__name__).debug("Reading config file: '%s'", path)
+    with open(path, 'r') as f:
+        return Profile(yaml.safe_load(f) or {})
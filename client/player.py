@@ -0,0 +1,188 @@
+# -*- coding: utf-8-*-
+"""
+Players output WAV files for the TTS engines.
+
+Player methods:
+    play - play the WAV file 'filename' and return when it is finished
+    stop - stop the current playback (from another thread)
+    preload - keep the WAV file 'filename' in memory for faster playback
+
+The CommandPlayer runs an external program (e.g. aplay) for every sound. The
+PyAudioPlayer writes the audio to persistent output streams of the PyAudio
+instance that is used for recording anyway.
+"""
+import logging
+import pipes
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from abc import ABCMeta, abstractmethod
+
+import audio
+
+
+class AbstractPlayer(object):
+    """
+    Generic parent class for all players
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self._logger = logging.getLogger(__name__)
+        # (AudioSegment, start time) of the sound that is currently played
+        self.now_playing = None
+
+    @abstractmethod
+    def play(self, filename):
+        pass
+
+    def stop(self):
+        pass
+
+    def preload(self, filename):
+        pass
+
+    def close(self):
+        pass
+
+
+class CommandPlayer(AbstractPlayer):
+    """
+    Plays every sound by running an external program.
+    """
+
+    SLUG = 'aplay'
+
+    def __init__(self, command):
+        """
+        Arguments:
+            command -- the command line, the file name gets appended
+        """
+        super(CommandPlayer, self).__init__()
+        self.command = command
+        self._lock = threading.Lock()
+        self._process = None
+
+    def play(self, filename):
+        self.run(self.command + [str(filename)], filename)
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._logger.debug('Stopping playback')
+                self._process.terminate()
+
+    def run(self, cmd, filename=None):
+        """
+        Runs a command that plays audio and waits for it to finish. The
+        playback can be cut off with stop().
+
+        Arguments:
+            cmd -- the command to execute
+            filename -- (optional) the WAV file played by the command
+        """
+        output = None
+        if filename is not None:
+            try:
+                output = audio.AudioSegment.from_wav(str(filename))
+            except (wave.Error, EOFError, IOError):
+                self._logger.debug("Can't read played file '%s'", filename)
+        self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
+                                                     for arg in cmd]))
+        with tempfile.TemporaryFile() as f:
+            with self._lock:
+                self._process = subprocess.Popen(cmd, stdout=f, stderr=f)
+                self.now_playing = (output, time.time())
+            try:
+                self._process.wait()
+            finally:
+                with self._lock:
+                    self._process = None
+                    self.now_playing = None
+            f.seek(0)
+            output = f.read()
+            if output:
+                self._logger.debug("Output was: '%s'", output)
+
+
+class PyAudioPlayer(AbstractPlayer):
+    """
+    Plays sounds in-process through PyAudio. An output stream is opened once
+    for every audio format and then kept open. Sounds played from several
+    threads are played one after another.
+    """
+
+    SLUG = 'pyaudio'
+
+    def __init__(self, audio, chunk=1024):
+        """
+        Arguments:
+            audio -- an initialized pyaudio.PyAudio instance
+            chunk -- the number of frames written at once (Default: 1024)
+        """
+        super(PyAudioPlayer, self).__init__()
+        self._audio = audio
+        self.chunk = chunk
+        self._streams = {}
+        self._preloaded = {}
+        self._stopped = threading.Event()
+        # held while a sound is written to the streams
+        self._lock = threading.Lock()
+
+    def preload(self, filename):
+        self._preloaded[filename] = audio.AudioSegment.from_wav(filename)
+
+    def play(self, filename):
+        segment = self._preloaded.get(filename)
+        if segment is None:
+            segment = audio.AudioSegment.from_wav(str(filename))
+        self.play_segment(segment)
+
+    def play_segment(self, segment):
+        """
+        Plays an AudioSegment and returns when it has been written to the
+        output stream. If another sound is being played, it waits for it to
+        finish first.
+        """
+        step = self.chunk * segment.width * segment.channels
+        data = segment.pcm
+        with self._lock:
+            stream = self._stream(segment)
+            self._stopped.clear()
+            self.now_playing = (segment, time.time())
+            try:
+                for i in range(0, len(data), step):
+                    if self._stopped.is_set():
+                        self._logger.debug('Playback has been stopped')
+                        break
+                    stream.write(data[i:i + step].tobytes())
+            finally:
+                self.now_playing = None
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            for stream in self._streams.values():
+                stream.stop_stream()
+                stream.close()
+            self._streams = {}
+
+    def _stream(self, segment):
+        key = (segment.width, segment.channels, segment.rate)
+        if key not in self._streams:
+            self._logger.debug("Opening output stream for %d bit, %d " +
+                               "channel(s), %d Hz", segment.width * 8,
+                               segment.channels, segment.rate)
+            self._streams[key] = self._audio.open(
+                format=self._audio.get_format_from_width(segment.width),
+                channels=segment.channels,
+                rate=segment.rate,
+                output=True,
+                frames_per_buffer=self.chunk)
+        return self._streams[key]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8-*-
+"""
+The registry of plugin modules.
+
+The modules in the modules folder are needed by the vocabulary compiler (for
+their WORDS) and by the Brain (to handle the user's input). The registry
+discovers them only once and serves both. Thanks to the manifest, a module
+is only imported when it is needed. The registry measures how long every
+import takes, as some of the modules pull in heavy libraries.
+"""
+import logging
+import pkgutil
+import threading
+import time
+import collections
+
+import nikitapath
+import manifest
+
+
+class ModuleRegistry(object):
+
+    def __init__(self, locations, manifest_path=None):
+        """
+        Arguments:
+            locations -- the directories to look for modules in
+            manifest_path -- (optional) the file to keep the manifest of the
+                             modules in (see the manifest module)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.locations = locations
+        self.manifest_path = manifest_path
+        # the number of seconds it took to import each module
+        self.load_times = collections.OrderedDict()
+        self._modules = None
+        self._lock = threading.Lock()
+
+    @property
+    def modules(self):
+        """
+        All modules that have the WORDS constant, sorted by their PRIORITY.
+        If no PRIORITY is defined for a given module, a priority of 0 is
+        assumed. The modules are discovered on first use and are only
+        imported when they are needed (see manifest.LazyModule).
+        """
+        with self._lock:
+            if self._modules is None:
+                self._modules = self._load()
+        return list(self._modules)
+
+    def _load(self):
+        self._logger.debug("Looking for modules in: %s",
+                           ', '.join(["'%s'" % location
+                                      for location in self.locations]))
+        start = time.time()
+        stored = {}
+        if self.manifest_path is not None:
+            stored = manifest.load(self.manifest_path)
+        entries = {}
+        modules = []
+        for finder, name, ispkg in pkgutil.iter_modules(self.locations):
+            try:
+                path = finder.find_module(name).get_filename()
+                entry = stored.get(name)
+                if entry is None or entry['path'] != path or \
+                   entry.get('version') != manifest.VERSION or \
+                   entry['hash'] != manifest.source_hash(path):
+                    self._logger.debug("Describing module '%s'", name)
+                    entry = manifest.describe(finder.path, name, path,
+                                              self._loaded)
+            except Exception:
+                self._logger.exception("Skipped module '%s' due to an error.",
+                                       name)
+                continue
+            entries[name] = entry
+            if entry['words'] is not None:
+                self._logger.debug("Found module '%s' with words: %r", name,
+                                   entry['words'])
+                modules.append(manifest.LazyModule(entry, self._loaded))
+            else:
+                self._logger.warning("Skipped module '%s' because it " +
+                                     "misses the WORDS constant.", name)
+        modules.sort(key=lambda mod: mod.PRIORITY, reverse=True)
+        if self.manifest_path is not None and entries != stored:
+            try:
+                manifest.save(self.manifest_path, entries)
+            except IOError:
+                self._logger.warning("Can't write module manifest '%s'",
+                                     self.manifest_path, exc_info=True)
+        self._logger.info("Found %d modules in %.2fs", len(modules),
+                          time.time() - start)
+        if self.load_times:
+            # modules whose WORDS aren't literals are imported right away
+            self._logger.info("Module import times:\n%s",
+                              '\n'.join(self.report()))
+        return modules
+
+    def _loaded(self, name, load_time):
+        self.load_times[name] = load_time
+        self._logger.debug("Imported module '%s' in %.1fms", name,
+                           1000 * load_time)
+
+    def report(self):
+        """
+        Returns:
+            A list of lines with the load time of every imported module,
+            slowest first
+        """
+        return ["%-20s %8.1fms" % (name, 1000 * load_time)
+                for name, load_time in sorted(self.load_times.items(),
+                                              key=lambda item: item[1],
+                                              reverse=True)]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Returns:
+        The ModuleRegistry of the modules folder, which is shared by
+        everybody
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModuleRegistry(
+                [nikitapath.PLUGIN_PATH],
+                manifest_path=nikitapath.config('modules.json'))
+        return _registry
@@ -0,0 +1,195 @@
+# -*- coding: utf-8-*-
+"""
+Finds the module that handles the user's input.
+
+Most modules accept a phrase if a regular expression matches it (see the
+manifest module). Instead of asking the modules one by one, the router
+combines all of these expressions into a single one, in which every
+module's expression is an optional lookahead in a named group. One call
+of the combined expression then tells which modules accept a phrase. This
+is not a single pass over the phrase: the regex engine still tries every
+lookahead on its own, but it does so without calling into each module.
+Modules whose isValid does something else, or that have a score function,
+are still asked directly.
+
+Modules may score how well they match a phrase, either with a SCORE constant
+that applies whenever isValid accepts the phrase (e.g. a low score for catch
+all modules), or with a score(text) function that returns a number between 0
+and 1. The score of a module without either is 1 if it accepts a phrase.
+Every score is weighted with the STT engine's confidence in the alternative,
+and the best (module, alternative) pair wins. Ties go to the module with the
+higher PRIORITY, then to the better alternative.
+"""
+import logging
+import re
+
+import manifest
+
+# the maximum number of groups in a Python 2 regular expression
+MAX_GROUPS = 100
+
+# expressions that can't be combined: named groups and backreferences would
+# clash, and global inline flags would apply to all modules
+UNCOMBINABLE = re.compile(r'\(\?P|\\[1-9]|\(\?[iLmsux]+\)')
+
+# alternatives without a confidence get this fraction of the confidence of
+# the alternative before them
+RANK_DECAY = 0.9
+
+
+class Router(object):
+
+    def __init__(self, modules):
+        """
+        Arguments:
+            modules -- the modules, highest PRIORITY first
+        """
+        self._logger = logging.getLogger(__name__)
+        self.modules = modules
+        # (combined expression, {group name: module index}) tuples
+        self._combined = []
+        # indices of the modules in the combined expressions
+        self._routed = set()
+        self._compile()
+
+    def _compile(self):
+        parts = {}
+        for index, module in enumerate(self.modules):
+            if not isinstance(module, manifest.LazyModule) or \
+               module.pattern is None or module.scored or \
+               UNCOMBINABLE.search(module.pattern):
+                continue
+            try:
+                groups = re.compile(module.pattern, module.flags).groups
+            except re.error:
+                continue
+            parts.setdefault(module.flags, []).append(
+                (index, module.pattern, groups + 1))
+
+        for flags, modules in parts.items():
+            chunk = []
+            for index, pattern, groups in modules:
+                if sum(part[2] for part in chunk) + groups > MAX_GROUPS:
+                    self._add(chunk, flags)
+                    chunk = []
+                chunk.append((index, pattern, groups))
+            self._add(chunk, flags)
+        self._logger.debug("Combined the expressions of %d of %d modules " +
+                           "into %d expression(s)", len(self._routed),
+                           len(self.modules), len(self._combined))
+
+    def _add(self, chunk, flags):
+        if not chunk:
+            return
+        names = {}
+        expression = ''
+        for index, pattern, groups in chunk:
+            name = 'm%d' % index
+            names[name] = index
+            # the group only takes part in the match if the module's
+            # expression can be found somewhere in the phrase, every
+            # lookahead searches the phrase from the start again
+            expression += r'(?:(?=(?P<%s>[\s\S]*?(?:%s))))?' % (name, pattern)
+            self._routed.add(index)
+        self._combined.append((re.compile(expression, flags), names))
+
+    def accepting(self, text):
+        """
+        Returns:
+            The set of the indices of all modules in the combined
+            expressions that accept text
+        """
+        indices = set()
+        for expression, names in self._combined:
+            match = expression.match(text)
+            for name, value in match.groupdict().items():
+                if value is not None:
+                    indices.add(names[name])
+        return indices
+
+    @staticmethod
+    def confidences(texts):
+        """
+        Returns:
+            The confidence of every alternative, as reported by the STT
+            engine or else estimated from its rank
+        """
+        confidences = []
+        for text in texts:
+            confidence = getattr(text, 'confidence', None)
+            if confidence is None:
+                confidence = confidences[-1] * RANK_DECAY if confidences \
+                    else 1.0
+            confidences.append(confidence)
+        return confidences
+
+    def score(self, index, text, accepted=None):
+        """
+        Returns:
+            How well the index-th module matches text, between 0 and 1, or
+            0 if the module can't be loaded or fails to score text
+
+        Arguments:
+        index -- the index of the module
+        text -- the phrase
+        accepted -- (optional) the result of accepting(text)
+        """
+        module = self.modules[index]
+        if index in self._routed:
+            if accepted is None:
+                accepted = self.accepting(text)
+            return module.SCORE if index in accepted else 0.0
+        try:
+            if hasattr(module, 'score'):
+                return module.score(text)
+            return getattr(module, 'SCORE', 1.0) if module.isValid(text) \
+                else 0.0
+        except Exception:
+            self._logger.exception("Skipped module '%s' due to an error.",
+                                   module.__name__)
+            return 0.0
+
+    def rank(self, texts):
+        """
+        Scores every module for every alternative.
+
+        Arguments:
+        texts -- the alternatives, best first
+
+        Returns:
+            A list of (score, module, text) tuples of all modules that
+            accept an alternative, best first
+        """
+        confidences = self.confidences(texts)
+        accepted = [self.accepting(text) for text in texts]
+        candidates = []
+        for index, module in enumerate(self.modules):
+            for rank, text in enumerate(texts):
+                score = self.score(index, text, accepted[rank])
+                if score > 0:
+                    candidates.append((score * confidences[rank],
+                                       getattr(module, 'PRIORITY', 0),
+                                       -rank, -index))
+        candidates.sort(reverse=True)
+        return [(candidate[0], self.modules[-candidate[3]],
+                 texts[-candidate[2]]) for candidate in candidates]
+
+    def route(self, texts):
+        """
+        Finds the best (module, alternative) pair.
+
+        Arguments:
+        texts -- the alternatives, best first
+
+        Returns:
+            A tuple (module, text) or None if no module accepts any of the
+            alternatives
+        """
+        candidates = self.rank(texts)
+        if not candidates:
+            return None
+        self._logger.debug("Best candidates: %s", ', '.join(
+            "%s '%s' (%.2f)" % (module.__name__, text, score)
+            for score, module, text in candidates[:3]))
+        score, module, text = candidates[0]
+        return (module, text)
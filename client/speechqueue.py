@@ -0,0 +1,154 @@
+# -*- coding: utf-8-*-
+"""
+Speaks phrases in the background, so that saying something doesn't block the
+conversation.
+
+Phrases are split into sentences, which pass through two worker threads: one
+synthesizes them into WAV files, the other plays these files. While a
+sentence is being played, the next one is already synthesized, so the first
+sound comes out quickly and there are no gaps in a longer response.
+"""
+import os
+import logging
+import time
+import threading
+import Queue
+import tts
+
+
+class SpeechQueue(object):
+    """
+    Queues phrases for a TTS engine.
+    """
+
+    def __init__(self, engine, lookahead=1, cache=None):
+        """
+        Arguments:
+            engine -- the TTS engine instance used to speak
+            lookahead -- the number of synthesized phrases that may wait for
+                         their playback (Default: 1)
+            cache -- (optional) a TTSCache for the synthesized phrases
+        """
+        self._logger = logging.getLogger(__name__)
+        self.engine = engine
+        self.cache = cache
+        self._phrases = Queue.Queue()
+        self._sounds = Queue.Queue(maxsize=lookahead)
+        self._cond = threading.Condition()
+        # number of phrases that have been queued, but not spoken yet
+        self._pending = 0
+        # incremented by flush(), phrases queued before are dropped
+        self._generation = 0
+        for target, name in ((self._synthesize, 'SpeechSynthesizer'),
+                             (self._play, 'SpeechPlayer')):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+
+    @property
+    def busy(self):
+        """
+        True while there are phrases that haven't been spoken completely.
+        """
+        return self._pending > 0
+
+    def say(self, phrase):
+        """
+        Queues phrase and returns immediately. Longer phrases are split into
+        sentences, which are synthesized and played one after another.
+        """
+        sentences = tts.split_sentences(phrase)
+        with self._cond:
+            self._pending += len(sentences)
+            generation = self._generation
+        for sentence in sentences:
+            self._phrases.put((generation, sentence))
+
+    def wait(self, timeout=None):
+        """
+        Blocks until all queued phrases have been spoken.
+
+        Arguments:
+            timeout -- (optional) the maximum number of seconds to wait
+
+        Returns:
+            True if all phrases have been spoken, False on timeout
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = 1
+                if timeout is not None:
+                    remaining = min(remaining, deadline - time.time())
+                    if remaining <= 0:
+                        break
+                # Use a timeout, otherwise the wait can't be interrupted
+                # by KeyboardInterrupt
+                self._cond.wait(remaining)
+            return not self._pending
+
+    def flush(self):
+        """
+        Drops all phrases that haven't been spoken yet and stops the current
+        playback.
+        """
+        with self._cond:
+            self._generation += 1
+        self.engine.stop()
+
+    def _done(self):
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _synthesize(self):
+        while True:
+            generation, phrase = self._phrases.get()
+            fname = None
+            temporary = True
+            if generation == self._generation and self.cache is not None:
+                fname = self.cache.get(self.engine, phrase)
+                temporary = fname is None
+            if generation == self._generation and fname is None:
+                try:
+                    fname = self.engine.synthesize(phrase)
+                except NotImplementedError:
+                    # the player will let the engine speak the phrase itself
+                    pass
+                except Exception:
+                    self._logger.error("Failed to synthesize '%s'", phrase,
+                                       exc_info=True)
+                    self._done()
+                    continue
+                else:
+                    if self.cache is not None:
+                        self._store(phrase, fname)
+            self._sounds.put((generation, phrase, fname, temporary))
+
+    def _store(self, phrase, fname):
+        try:
+            self.cache.put(self.engine, phrase, fname)
+        except (IOError, OSError):
+            self._logger.warning("Failed to cache '%s'", phrase,
+                                 exc_info=True)
+
+    def _play(self):
+        while True:
+            generation, phrase, fname, temporary = self._sounds.get()
+            try:
+                if generation != self._generation:
+                    self._logger.debug("Dropped phrase '%s'", phrase)
+                elif fname is None:
+                    self.engine.say(phrase)
+                else:
+                    self.engine.play(fname)
+            except Exception:
+                self._logger.error("Failed to say '%s'", phrase,
+                                   exc_info=True)
+            finally:
+                if fname is not None and temporary:
+                    os.remove(fname)
+                elif fname is not None:
+                    self.cache.release(fname)
+                self._done()
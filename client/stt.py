@@ -1,20 +1,44 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
 import os
-import wave
 import json
+import socket
+import struct
+import atexit
+import audioop
+import itertools
 import tempfile
 import logging
 import urllib
 import urlparse
 import re
 import subprocess
+import collections
+import threading
+import time
+import Queue
 from abc import ABCMeta, abstractmethod
 import requests
-import yaml
 import nikitapath
+import nikitaconfig
 import diagnose
 import vocabcompiler
+import audio
+import audiocodec
+import httpsession
+import decoderpool
+
+
+class Hypothesis(unicode):
+    """
+    A transcribed phrase, which also carries the engine's confidence in it
+    (between 0 and 1, or None if the engine doesn't say).
+    """
+
+    def __new__(cls, text, confidence=None):
+        hypothesis = super(Hypothesis, cls).__new__(cls, text)
+        hypothesis.confidence = confidence
+        return hypothesis
 
 
 class AbstractSTTEngine(object):
@@ -25,6 +49,27 @@ class AbstractSTTEngine(object):
     __metaclass__ = ABCMeta
     VOCABULARY_TYPE = None
 
+    # Engines that can decode audio chunk by chunk while it is being recorded
+    # set this to True and implement start_utterance(), process_chunk() and
+    # end_utterance()
+    INCREMENTAL = False
+
+    # Engines that can upload audio while it is still being recorded set
+    # this to True and override transcribe_stream()
+    STREAMING = False
+
+    # (encoder slug, content type) pairs of the audio encodings the engine
+    # accepts, most preferred first. See the audiocodec module.
+    CODECS = (('pcm', 'audio/l16; rate=%(rate)d'),)
+
+    # the slug of the encoder to prefer over the CODECS order, if any
+    codec = None
+
+    # Network engines return an empty result both when nothing has been said
+    # and when the request failed. In the latter case, they describe the
+    # failure here until the next request.
+    last_error = None
+
     @classmethod
     def get_config(cls):
         return {}
@@ -59,8 +104,51 @@ class AbstractSTTEngine(object):
 
     @abstractmethod
     def transcribe(self, fp):
+        """
+        Transcribes recorded audio.
+
+        Arguments:
+            fp -- an audio.AudioSegment or a file object containing WAV data
+        """
         pass
 
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        """
+        Transcribes audio while it is being recorded. This implementation
+        waits for the recording to end and passes it on to transcribe().
+
+        Arguments:
+            chunks -- an iterable of raw mono PCM chunks, which ends when
+                      the recording is complete
+            rate -- the sample rate in Hz (Default: 16000)
+            width -- the sample width in bytes (Default: 2)
+        """
+        return self.transcribe(audio.AudioSegment(''.join(chunks),
+                                                  rate=rate, width=width))
+
+    @staticmethod
+    def _finish_recording(chunks):
+        """
+        Consumes the rest of chunks. The caller of transcribe_stream() may
+        rely on the recording to be completed, even if a streamed request
+        was never made or failed half way.
+
+        Arguments:
+            chunks -- the iterator of chunks passed to transcribe_stream()
+        """
+        for chunk in chunks:
+            pass
+
+    def _encoder(self, rate=16000, width=2):
+        """
+        Returns:
+            A tuple (encoder, content type) for the uploaded audio
+        """
+        encoder, content_type = audiocodec.negotiate(
+            self.CODECS, rate=rate, width=width, preferred=self.codec)
+        self._logger.debug("Encoding audio as '%s'", content_type)
+        return (encoder, content_type)
+
 
 class PocketSphinxSTT(AbstractSTTEngine):
     """
@@ -69,9 +157,11 @@ class PocketSphinxSTT(AbstractSTTEngine):
 
     SLUG = 'sphinx'
     VOCABULARY_TYPE = vocabcompiler.PocketsphinxVocabulary
+    INCREMENTAL = True
 
     def __init__(self, vocabulary, hmm_dir="/usr/local/share/" +
-                 "pocketsphinx/model/hmm/en_US/hub4wsj_sc_8k"):
+                 "pocketsphinx/model/hmm/en_US/hub4wsj_sc_8k", decoders=1,
+                 queue_size=None):
 
         """
         Initiates the pocketsphinx instance.
@@ -79,6 +169,11 @@ class PocketSphinxSTT(AbstractSTTEngine):
         Arguments:
             vocabulary -- a PocketsphinxVocabulary instance
             hmm_dir -- the path of the Hidden Markov Model (HMM)
+            decoders -- the number of decoders; more than one decode in a
+                        pool of worker processes, so that utterances from
+                        several microphones are decoded in parallel
+            queue_size -- (optional) the number of utterances that may wait
+                          for a decoder of the pool
         """
 
         self._logger = logging.getLogger(__name__)
@@ -122,27 +217,32 @@ class PocketSphinxSTT(AbstractSTTEngine):
                                  "hmm_dir in your profile.",
                                  hmm_dir, ', '.join(missing_hmm_files))
 
-        self._decoder = ps.Decoder(hmm=hmm_dir, logfn=self._logfile,
-                                   **vocabulary.decoder_kwargs)
+        self._pool = None
+        if decoders > 1:
+            self._pool = decoderpool.DecoderPool(
+                PocketSphinxSTT,
+                {'vocabulary': vocabulary, 'hmm_dir': hmm_dir},
+                size=decoders, queue_size=queue_size)
+            atexit.register(self._pool.close)
+            # the decoders of the pool can only transcribe whole utterances
+            self.INCREMENTAL = False
+        else:
+            self._decoder = ps.Decoder(hmm=hmm_dir, logfn=self._logfile,
+                                       **vocabulary.decoder_kwargs)
 
     def __del__(self):
         os.remove(self._logfile)
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                try:
-                    config['hmm_dir'] = profile['pocketsphinx']['hmm_dir']
-                except KeyError:
-                    pass
+        profile = nikitaconfig.get_profile()
+        if 'pocketsphinx' in profile:
+            for key in ('hmm_dir', 'decoders', 'queue_size'):
+                if key in profile['pocketsphinx']:
+                    config[key] = profile['pocketsphinx'][key]
 
         return config
 
@@ -151,111 +251,388 @@ class PocketSphinxSTT(AbstractSTTEngine):
         Performs STT, transcribing an audio file and returning the result.
 
         Arguments:
-            fp -- a file object containing audio data
+            fp -- an audio.AudioSegment or a file object containing WAV data
         """
 
-        fp.seek(44)
+        segment = audio.to_segment(fp)
+
+        if self._pool is not None:
+            transcribed = self._pool.transcribe(segment)
+            self._logger.transcript('Transcribed: %r', transcribed)
+            return transcribed
 
-        # FIXME: Can't use the Decoder.decode_raw() here, because
-        # pocketsphinx segfaults with tempfile.SpooledTemporaryFile()
-        data = fp.read()
+        # The pocketsphinx python binding only accepts str, so this is where
+        # the recording gets copied
         self._decoder.start_utt()
-        self._decoder.process_raw(data, False, True)
+        self._decoder.process_raw(segment.raw, False, True)
         self._decoder.end_utt()
 
         result = self._decoder.get_hyp()
-        with open(self._logfile, 'r+') as f:
-            for line in f:
-                self._logger.debug(line.strip())
-            f.truncate()
+        self._flush_log()
 
         transcribed = [result[0]]
         self._logger.transcript('Transcribed: %r', transcribed)
         return transcribed
 
+    def start_utterance(self):
+        """
+        Starts a new utterance that is fed with process_chunk().
+        """
+        self._decoder.start_utt()
+
+    def process_chunk(self, data):
+        """
+        Decodes a chunk of raw audio data as part of the current utterance.
+
+        Arguments:
+            data -- raw 16 bit mono PCM data
+
+        Returns:
+            The partial hypothesis for the utterance so far (may be empty)
+        """
+        self._decoder.process_raw(data, False, False)
+        result = self._decoder.get_hyp()
+        return result[0] if result and result[0] else ''
+
+    def end_utterance(self):
+        """
+        Ends the current utterance.
+
+        Returns:
+            A list containing the final hypothesis
+        """
+        self._decoder.end_utt()
+        result = self._decoder.get_hyp()
+        self._flush_log()
+        transcribed = [result[0]] if result and result[0] else []
+        self._logger.debug('Transcribed: %r', transcribed)
+        return transcribed
+
+    def _flush_log(self):
+        with open(self._logfile, 'r+') as f:
+            for line in f:
+                self._logger.debug(line.strip())
+            f.truncate()
+
     @classmethod
     def is_available(cls):
         return diagnose.check_python_import('pocketsphinx')
 
 
+class JuliusServer(object):
+    """
+    Keeps a julius process running in module mode, so that the acoustic
+    model is only loaded once instead of for every utterance. The audio is
+    streamed to julius over an adinnet connection and the results are read
+    from the module connection. If julius crashes or hangs, it is restarted.
+    """
+
+    def __init__(self, cmd, host='localhost', port=10500, adport=5530,
+                 timeout=30):
+        """
+        Arguments:
+            cmd -- the julius command line without any input or module
+                   options
+            host -- the host julius listens on (Default: localhost)
+            port -- the port of the module connection (Default: 10500)
+            adport -- the port of the adinnet connection (Default: 5530)
+            timeout -- the number of seconds to wait for julius to start or
+                       to answer (Default: 30)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.cmd = cmd
+        self.host = host
+        self.port = port
+        self.adport = adport
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._process = None
+        self._module = None
+        self._adin = None
+        self._buffer = ''
+
+    @staticmethod
+    def free_port():
+        """
+        Returns:
+            A port on localhost that is currently unused
+        """
+        sock = socket.socket()
+        try:
+            sock.bind(('localhost', 0))
+            return sock.getsockname()[1]
+        finally:
+            sock.close()
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def check(self):
+        """
+        Starts julius if necessary.
+
+        Returns:
+            True if julius is running and connected, else False
+        """
+        with self._lock:
+            try:
+                self._ensure_running()
+            except (IOError, EOFError):
+                self._logger.warning("Julius server is not healthy.",
+                                     exc_info=True)
+                self._stop()
+                return False
+            return True
+
+    def recognize(self, chunks):
+        """
+        Sends raw 16 kHz, 16 bit mono PCM chunks to julius as one utterance.
+
+        Returns:
+            A list of (text, confidence) tuples, best first
+
+        Raises:
+            IOError if julius doesn't work even after a restart
+        """
+        chunks = iter(chunks)
+        sent = []
+
+        def record():
+            for chunk in chunks:
+                sent.append(chunk)
+                yield chunk
+
+        with self._lock:
+            try:
+                self._ensure_running()
+                return self._recognize(record())
+            except (IOError, EOFError) as e:
+                self._logger.warning("Julius server failed, restarting " +
+                                     "it: %s", e)
+                self._stop()
+                self._ensure_running()
+                return self._recognize(itertools.chain(list(sent), chunks))
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        for sock in (self._adin, self._module):
+            if sock is not None:
+                sock.close()
+        self._adin = self._module = None
+        if self.is_alive():
+            self._process.terminate()
+            self._process.wait()
+        self._process = None
+
+    def _ensure_running(self):
+        if self._adin is not None:
+            return
+        if not self.is_alive():
+            cmd = self.cmd + ['-input', 'adinnet',
+                              '-adport', self.adport,
+                              '-nocutsilence',
+                              '-module', self.port]
+            cmd = [str(x) for x in cmd]
+            self._logger.debug('Executing: %r', cmd)
+            self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT)
+            thread = threading.Thread(target=self._log_output,
+                                      args=(self._process,),
+                                      name='JuliusServer-log')
+            thread.daemon = True
+            thread.start()
+        # julius waits for the module client before it opens the adinnet
+        # port
+        self._module = self._connect(self.port)
+        self._buffer = ''
+        self._adin = self._connect(self.adport)
+
+    def _connect(self, port):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                return socket.create_connection((self.host, port),
+                                                self.timeout)
+            except socket.error:
+                if not self.is_alive() or time.time() > deadline:
+                    raise
+                # julius is still loading the acoustic model
+                time.sleep(0.1)
+
+    def _log_output(self, process):
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if len(line) > 7 and line[:7].upper() == 'ERROR: ':
+                if not line[7:].startswith('adin_'):
+                    self._logger.error(line[7:])
+            elif len(line) > 9 and line[:9].upper() == 'WARNING: ':
+                self._logger.warning(line[9:])
+            elif len(line) > 6 and line[:6].upper() == 'STAT: ':
+                self._logger.debug(line[6:])
+
+    def _recognize(self, chunks):
+        empty = True
+        for chunk in chunks:
+            if chunk:
+                # adinnet packets are the data size followed by the data
+                self._adin.sendall(struct.pack('i', len(chunk)) + chunk)
+                empty = False
+        if empty:
+            return []
+        # an empty packet ends the utterance
+        self._adin.sendall(struct.pack('i', 0))
+        while True:
+            message = self._read_message()
+            if '<RECOGOUT>' in message:
+                return self._parse(message)
+            elif '<RECOGFAIL' in message or '<REJECTED' in message:
+                return []
+
+    def _parse(self, message):
+        results = []
+        for rank, hypothesis in re.findall(
+                r'<SHYPO RANK="(\d+)"[^>]*>(.*?)</SHYPO>', message, re.S):
+            words = re.findall(r'<WHYPO WORD="([^"]*)"(?:[^>]*CM="([\d.]+)")?',
+                               hypothesis)
+            # leave out the silence at the start and the end
+            words = [(word, cm) for word, cm in words
+                     if not (word.startswith('<') and word.endswith('>'))]
+            confidences = [float(cm) for word, cm in words if cm]
+            confidence = None
+            if confidences:
+                confidence = sum(confidences) / len(confidences)
+            results.append((int(rank),
+                            ' '.join(word for word, cm in words),
+                            confidence))
+        return [result[1:] for result in sorted(results)]
+
+    def _read_message(self):
+        # module messages end with a line containing a single period
+        while '\n.\n' not in self._buffer:
+            data = self._module.recv(4096)
+            if not data:
+                raise EOFError("Julius closed the module connection")
+            self._buffer += data
+        message, self._buffer = self._buffer.split('\n.\n', 1)
+        return message
+
+
 class JuliusSTT(AbstractSTTEngine):
     """
-    A very basic Speech-to-Text engine using Julius.
+    A very basic Speech-to-Text engine using Julius. By default, julius is
+    kept running in module mode and the audio is streamed to it.
     """
 
     SLUG = 'julius'
+    STREAMING = True
     VOCABULARY_TYPE = vocabcompiler.JuliusVocabulary
 
+    # the sample format of the VoxForge acoustic model
+    RATE = 16000
+    WIDTH = 2
+
     def __init__(self, vocabulary=None, hmmdefs="/usr/share/voxforge/julius/" +
                  "acoustic_model_files/hmmdefs", tiedlist="/usr/share/" +
-                 "voxforge/julius/acoustic_model_files/tiedlist"):
+                 "voxforge/julius/acoustic_model_files/tiedlist",
+                 server=True, port=None, adport=None):
         self._logger = logging.getLogger(__name__)
         self._vocabulary = vocabulary
         self._hmmdefs = hmmdefs
         self._tiedlist = tiedlist
         self._pattern = re.compile(r'sentence(\d+): <s> (.+) </s>')
-
-        # Inital test run: we run this command once to log errors/warnings
-        cmd = ['julius',
-               '-input', 'stdin',
-               '-dfa', self._vocabulary.dfa_file,
-               '-v', self._vocabulary.dict_file,
-               '-h', self._hmmdefs,
-               '-hlist', self._tiedlist,
-               '-forcedict']
-        cmd = [str(x) for x in cmd]
-        self._logger.debug('Executing: %r', cmd)
-        with tempfile.SpooledTemporaryFile() as out_f:
-            with tempfile.SpooledTemporaryFile() as f:
-                with tempfile.SpooledTemporaryFile() as err_f:
-                    subprocess.call(cmd, stdin=f, stdout=out_f, stderr=err_f)
-            out_f.seek(0)
-            for line in out_f.read().splitlines():
-                line = line.strip()
-                if len(line) > 7 and line[:7].upper() == 'ERROR: ':
-                    if not line[7:].startswith('adin_'):
-                        self._logger.error(line[7:])
-                elif len(line) > 9 and line[:9].upper() == 'WARNING: ':
-                    self._logger.warning(line[9:])
-                elif len(line) > 6 and line[:6].upper() == 'STAT: ':
-                    self._logger.debug(line[6:])
+        self._server = None
+        if server:
+            # the passive and the active instance run their own servers, so
+            # pick unused ports unless they have been configured
+            self._server = JuliusServer(
+                self._command(),
+                port=port or JuliusServer.free_port(),
+                adport=adport or JuliusServer.free_port())
+            atexit.register(self._server.stop)
+            # start the server in the background, it takes a while
+            thread = threading.Thread(target=self._server.check,
+                                      name='JuliusServer-start')
+            thread.daemon = True
+            thread.start()
+        else:
+            self.STREAMING = False
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'julius' in profile:
-                    if 'hmmdefs' in profile['julius']:
-                        config['hmmdefs'] = profile['julius']['hmmdefs']
-                    if 'tiedlist' in profile['julius']:
-                        config['tiedlist'] = profile['julius']['tiedlist']
+        profile = nikitaconfig.get_profile()
+        if 'julius' in profile:
+            for key in ('hmmdefs', 'tiedlist', 'server', 'port',
+                        'adport'):
+                if key in profile['julius']:
+                    config[key] = profile['julius'][key]
         return config
 
+    def _command(self):
+        return ['julius',
+                '-dfa', self._vocabulary.dfa_file,
+                '-v', self._vocabulary.dict_file,
+                '-h', self._hmmdefs,
+                '-hlist', self._tiedlist,
+                '-forcedict']
+
     def transcribe(self, fp, mode=None):
-        cmd = ['julius',
-               '-quiet',
-               '-nolog',
-               '-input', 'stdin',
-               '-dfa', self._vocabulary.dfa_file,
-               '-v', self._vocabulary.dict_file,
-               '-h', self._hmmdefs,
-               '-hlist', self._tiedlist,
-               '-forcedict']
+        segment = audio.to_segment(fp)
+        if self._server is None:
+            return self._transcribe_once(segment)
+        data = segment.buffer
+        if segment.channels > 1:
+            data = audioop.tomono(data, segment.width, 0.5, 0.5)
+        # send the recording in packets of 4096 bytes, every packet is
+        # copied anyway when its length is prepended
+        chunks = (data[i:i + 4096] for i in range(0, len(data), 4096))
+        return self.transcribe_stream(chunks, rate=segment.rate,
+                                      width=segment.width)
+
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        if self._server is None:
+            return super(JuliusSTT, self).transcribe_stream(
+                chunks, rate=rate, width=width)
+        chunks = iter(chunks)
+        try:
+            results = self._server.recognize(self._convert(chunks, rate,
+                                                           width))
+        except (IOError, EOFError):
+            self._logger.error('Julius server failed.', exc_info=True)
+            self._finish_recording(chunks)
+            results = []
+        transcribed = [Hypothesis(text, confidence)
+                       for text, confidence in results if text]
+        if not transcribed:
+            transcribed.append('')
+        self._logger.info('Transcribed: %r', transcribed)
+        return transcribed
+
+    def _convert(self, chunks, rate, width):
+        state = None
+        for chunk in chunks:
+            if width != self.WIDTH:
+                chunk = audioop.lin2lin(chunk, width, self.WIDTH)
+            if rate != self.RATE:
+                chunk, state = audioop.ratecv(chunk, self.WIDTH, 1, rate,
+                                              self.RATE, state)
+            yield chunk
+
+    def _transcribe_once(self, segment):
+        cmd = self._command() + ['-quiet', '-nolog', '-input', 'stdin']
         cmd = [str(x) for x in cmd]
         self._logger.debug('Executing: %r', cmd)
-        with tempfile.SpooledTemporaryFile() as out_f:
-            with tempfile.SpooledTemporaryFile() as err_f:
-                subprocess.call(cmd, stdin=fp, stdout=out_f, stderr=err_f)
-            out_f.seek(0)
-            results = [(int(i), text) for i, text in
-                       self._pattern.findall(out_f.read())]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        output, errors = proc.communicate(segment.wav)
+        results = [(int(i), text) for i, text in
+                   self._pattern.findall(output)]
         transcribed = [text for i, text in
                        sorted(results, key=lambda x: x[0])
                        if text]
@@ -300,6 +677,9 @@ class GoogleSTT(AbstractSTTEngine):
     """
 
     SLUG = 'google'
+    STREAMING = True
+    CODECS = (('flac', 'audio/x-flac; rate=%(rate)d'),
+              ('pcm', 'audio/l16; rate=%(rate)d'))
 
     def __init__(self, api_key=None, language='en-us'):
         # FIXME: get init args from config
@@ -311,7 +691,7 @@ class GoogleSTT(AbstractSTTEngine):
         self._request_url = None
         self._language = None
         self._api_key = None
-        self._http = requests.Session()
+        self._http = httpsession.get_session()
         self.language = language
         self.api_key = api_key
 
@@ -353,16 +733,12 @@ class GoogleSTT(AbstractSTTEngine):
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'keys' in profile and 'GOOGLE_SPEECH' in profile['keys']:
-                    config['api_key'] = profile['keys']['GOOGLE_SPEECH']
+        profile = nikitaconfig.get_profile()
+        if 'keys' in profile and 'GOOGLE_SPEECH' in profile['keys']:
+            config['api_key'] = profile['keys']['GOOGLE_SPEECH']
         return config
 
     def transcribe(self, fp):
@@ -371,24 +747,37 @@ class GoogleSTT(AbstractSTTEngine):
         returning an English string.
 
         Arguments:
-        audio_file_path -- the path to the .wav file to be transcribed
+        fp -- an audio.AudioSegment or a file object containing WAV data
         """
-
+        segment = audio.to_segment(fp)
+        encoder, content_type = self._encoder(segment.rate, segment.width)
+        return self._recognize(encoder.encode(segment.buffer),
+                               content_type)
+
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        encoder, content_type = self._encoder(rate, width)
+        chunks = iter(chunks)
+        try:
+            # a generator body is sent with chunked transfer encoding
+            return self._recognize(encoder.encode_stream(chunks),
+                                   content_type)
+        finally:
+            self._finish_recording(chunks)
+
+    def _recognize(self, data, content_type):
+        self.last_error = None
         if not self.api_key:
             self._logger.critical('API key missing, transcription request ' +
                                   'aborted.')
+            self.last_error = 'API key missing'
             return []
         elif not self.language:
             self._logger.critical('Language info missing, transcription ' +
                                   'request aborted.')
+            self.last_error = 'Language info missing'
             return []
 
-        wav = wave.open(fp, 'rb')
-        frame_rate = wav.getframerate()
-        wav.close()
-        data = fp.read()
-
-        headers = {'content-type': 'audio/l16; rate=%s' % frame_rate}
+        headers = {'content-type': content_type}
         r = self._http.post(self.request_url, data=data, headers=headers)
         try:
             r.raise_for_status()
@@ -398,6 +787,7 @@ class GoogleSTT(AbstractSTTEngine):
             if r.status_code == requests.codes['forbidden']:
                 self._logger.warning('Status 403 is probably caused by an ' +
                                      'invalid Google API key.')
+            self.last_error = 'HTTP status %d' % r.status_code
             return []
         r.encoding = 'utf-8'
         try:
@@ -408,17 +798,20 @@ class GoogleSTT(AbstractSTTEngine):
             if len(response['result']) == 0:
                 # Response result is empty
                 raise ValueError('Nothing has been transcribed.')
-            results = [alt['transcript'] for alt
+            # only the first alternative has a confidence
+            results = [(alt['transcript'], alt.get('confidence')) for alt
                        in response['result'][0]['alternative']]
         except ValueError as e:
             self._logger.warning('Empty response: %s', e.args[0])
             results = []
         except (KeyError, IndexError):
             self._logger.warning('Cannot parse response.', exc_info=True)
+            self.last_error = 'Cannot parse response'
             results = []
         else:
             # Convert all results to uppercase
-            results = tuple(result.upper() for result in results)
+            results = tuple(Hypothesis(result.upper(), confidence)
+                            for result, confidence in results)
             self._logger.info('Transcribed: %r', results)
         return results
 
@@ -443,27 +836,26 @@ class AttSTT(AbstractSTTEngine):
     """
 
     SLUG = "att"
+    STREAMING = True
+    CODECS = (('pcm', 'audio/raw;coding=linear;rate=%(rate)d;byteorder=LE'),)
 
     def __init__(self, app_key, app_secret):
         self._logger = logging.getLogger(__name__)
+        self._http = httpsession.get_session()
         self._token = None
         self.app_key = app_key
         self.app_secret = app_secret
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # Try to get AT&T app_key/app_secret from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'att-stt' in profile:
-                    if 'app_key' in profile['att-stt']:
-                        config['app_key'] = profile['att-stt']['app_key']
-                    if 'app_secret' in profile['att-stt']:
-                        config['app_secret'] = profile['att-stt']['app_secret']
+        profile = nikitaconfig.get_profile()
+        if 'att-stt' in profile:
+            if 'app_key' in profile['att-stt']:
+                config['app_key'] = profile['att-stt']['app_key']
+            if 'app_secret' in profile['att-stt']:
+                config['app_secret'] = profile['att-stt']['app_secret']
         return config
 
     @property
@@ -475,30 +867,57 @@ class AttSTT(AbstractSTTEngine):
                        'client_secret': self.app_secret,
                        'scope': 'SPEECH',
                        'grant_type': 'client_credentials'}
-            r = requests.post('https://api.att.com/oauth/v4/token',
-                              data=payload,
-                              headers=headers)
+            r = self._http.post('https://api.att.com/oauth/v4/token',
+                                data=payload,
+                                headers=headers)
             self._token = r.json()['access_token']
         return self._token
 
     def transcribe(self, fp):
-        data = fp.read()
-        r = self._get_response(data)
+        segment = audio.to_segment(fp)
+        encoder, content_type = self._encoder(segment.rate, segment.width)
+        data = encoder.encode(segment.buffer)
+        return self._recognize(lambda: data, content_type)
+
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        encoder, content_type = self._encoder(rate, width)
+        chunks = iter(chunks)
+        sent = []
+
+        def upload():
+            for chunk in encoder.encode_stream(chunks):
+                sent.append(chunk)
+                yield chunk
+
+        def data():
+            # a retry has to send again what has already been recorded
+            return ''.join(sent) if sent else upload()
+
+        try:
+            return self._recognize(data, content_type)
+        finally:
+            self._finish_recording(chunks)
+
+    def _recognize(self, get_data, content_type):
+        self.last_error = None
+        r = self._get_response(get_data(), content_type)
         if r.status_code == requests.codes['unauthorized']:
             # Request token invalid, retry once with a new token
             self._logger.warning('OAuth access token invalid, generating a ' +
                                  'new one and retrying...')
             self._token = None
-            r = self._get_response(data)
+            r = self._get_response(get_data(), content_type)
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError:
             self._logger.critical('Request failed with response: %r',
                                   r.text,
                                   exc_info=True)
+            self.last_error = 'HTTP status %d' % r.status_code
             return []
-        except requests.exceptions.RequestException:
+        except requests.exceptions.RequestException as e:
             self._logger.critical('Request failed.', exc_info=True)
+            self.last_error = str(e)
             return []
         else:
             try:
@@ -514,21 +933,23 @@ class AttSTT(AbstractSTTEngine):
             except KeyError:
                 self._logger.critical('Cannot parse response.',
                                       exc_info=True)
+                self.last_error = 'Cannot parse response'
                 return []
             else:
-                transcribed = [x[0].upper() for x in sorted(results,
-                                                            key=lambda x: x[1],
-                                                            reverse=True)]
+                transcribed = [Hypothesis(x[0].upper(), x[1])
+                               for x in sorted(results, key=lambda x: x[1],
+                                               reverse=True)]
                 self._logger.info('Transcribed: %r', transcribed)
                 return transcribed
 
-    def _get_response(self, data):
+    def _get_response(self, data, content_type='audio/wav'):
         headers = {'authorization': 'Bearer %s' % self.token,
                    'accept': 'application/json',
-                   'content-type': 'audio/wav'}
-        return requests.post('https://api.att.com/speech/v3/speechToText',
-                             data=data,
-                             headers=headers)
+                   'content-type': content_type}
+        return self._http.post(
+            'https://api.att.com/speech/v3/speechToText',
+            data=data,
+            headers=headers)
 
     @classmethod
     def is_available(cls):
@@ -550,24 +971,37 @@ class WitAiSTT(AbstractSTTEngine):
     """
 
     SLUG = "witai"
-
-    def __init__(self, access_token):
+    STREAMING = True
+    # wit.ai doesn't accept FLAC, mu-law halves the upload but is lossy and
+    # therefore only used if the profile asks for it (codec: ulaw)
+    CODECS = (('pcm', 'audio/raw;encoding=signed-integer;bits=%(bits)d;' +
+                      'rate=%(rate)d;endian=little'),
+              ('ulaw', 'audio/raw;encoding=mu-law;bits=8;rate=%(rate)d;' +
+                       'endian=little'))
+
+    def __init__(self, access_token, codec=None):
+        """
+        Arguments:
+            access_token -- the wit.ai server access token
+            codec -- (optional) the slug of the encoder to prefer, e.g.
+                     'ulaw' to trade some accuracy for smaller uploads
+        """
         self._logger = logging.getLogger(__name__)
+        self._http = httpsession.get_session()
         self.token = access_token
+        self.codec = codec
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # Try to get wit.ai Auth token from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'witai-stt' in profile:
-                    if 'access_token' in profile['witai-stt']:
-                        config['access_token'] = \
-                            profile['witai-stt']['access_token']
+        profile = nikitaconfig.get_profile()
+        if 'witai-stt' in profile:
+            if 'access_token' in profile['witai-stt']:
+                config['access_token'] = \
+                    profile['witai-stt']['access_token']
+            if 'codec' in profile['witai-stt']:
+                config['codec'] = profile['witai-stt']['codec']
         return config
 
     @property
@@ -586,10 +1020,28 @@ class WitAiSTT(AbstractSTTEngine):
         return self._headers
 
     def transcribe(self, fp):
-        data = fp.read()
-        r = requests.post('https://api.wit.ai/speech?v=20150101',
-                          data=data,
-                          headers=self.headers)
+        segment = audio.to_segment(fp)
+        encoder, content_type = self._encoder(segment.rate, segment.width)
+        return self._recognize(encoder.encode(segment.buffer),
+                               content_type)
+
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        encoder, content_type = self._encoder(rate, width)
+        chunks = iter(chunks)
+        try:
+            # a generator body is sent with chunked transfer encoding
+            return self._recognize(encoder.encode_stream(chunks),
+                                   content_type)
+        finally:
+            self._finish_recording(chunks)
+
+    def _recognize(self, data, content_type):
+        self.last_error = None
+        headers = dict(self.headers)
+        headers['Content-Type'] = content_type
+        r = self._http.post('https://api.wit.ai/speech?v=20150101',
+                            data=data,
+                            headers=headers)
         try:
             r.raise_for_status()
             text = r.json()['_text']
@@ -597,17 +1049,21 @@ class WitAiSTT(AbstractSTTEngine):
             self._logger.critical('Request failed with response: %r',
                                   r.text,
                                   exc_info=True)
+            self.last_error = 'HTTP status %d' % r.status_code
             return []
-        except requests.exceptions.RequestException:
+        except requests.exceptions.RequestException as e:
             self._logger.critical('Request failed.', exc_info=True)
+            self.last_error = str(e)
             return []
         except ValueError as e:
             self._logger.critical('Cannot parse response: %s',
                                   e.args[0])
+            self.last_error = 'Cannot parse response'
             return []
         except KeyError:
             self._logger.critical('Cannot parse response.',
                                   exc_info=True)
+            self.last_error = 'Cannot parse response'
             return []
         else:
             transcribed = []
@@ -621,6 +1077,366 @@ class WitAiSTT(AbstractSTTEngine):
         return diagnose.check_network_connection()
 
 
+class EnsembleSTT(AbstractSTTEngine):
+    """
+    Sends the same audio to several engines at once, usually a local one
+    (e.g. PocketSphinx) and one or more cloud engines, and takes the first
+    good result:
+
+    - a result whose confidence reaches min_confidence wins immediately
+    - after latency_budget seconds, the result of the local engine wins
+    - if there is none, the first result that comes in wins
+
+    Engines that are still busy then are abandoned: their results are
+    ignored, but their latencies are still recorded. An engine only
+    transcribes one utterance at a time, so the next utterance waits for an
+    abandoned call to finish before it uses the same engine (and e.g. its
+    decoder). The statistics of every engine are available in the stats
+    attribute.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        stt_engine: ensemble
+        ensemble-stt:
+          engines: [sphinx, google]
+          local: sphinx
+          latency_budget: 1.5
+          min_confidence: 0.7
+    """
+
+    SLUG = 'ensemble'
+
+    def __init__(self, engines, local=None, latency_budget=1.5,
+                 min_confidence=0.7):
+        """
+        Arguments:
+        engines -- the STT engine instances to run
+        local -- (optional) the instance among engines that is always
+                 available, its result wins after the latency budget
+        latency_budget -- the number of seconds to wait for a confident
+                          result
+        min_confidence -- the confidence with which a result wins at once
+        """
+        self._logger = logging.getLogger(__name__)
+        self.engines = engines
+        self.local = local
+        self.latency_budget = latency_budget
+        self.min_confidence = min_confidence
+        self._stats_lock = threading.Lock()
+        # engines aren't thread-safe, abandoned calls may still be running
+        self._engine_locks = dict((engine, threading.Lock())
+                                  for engine in engines)
+        self.stats = dict((engine.SLUG, {'requests': 0, 'wins': 0,
+                                         'errors': 0, 'latency': 0.0})
+                          for engine in engines)
+
+    @classmethod
+    def get_config(cls):
+        config = {}
+        profile = nikitaconfig.get_profile()
+        if 'ensemble-stt' in profile:
+            for key in ('engines', 'local', 'latency_budget',
+                        'min_confidence'):
+                if key in profile['ensemble-stt']:
+                    config[key] = profile['ensemble-stt'][key]
+        return config
+
+    @classmethod
+    def get_instance(cls, vocabulary_name, phrases):
+        config = cls.get_config()
+        slugs = config.pop('engines', ['sphinx', 'google'])
+        local = config.pop('local', slugs[0])
+        if local and local not in slugs:
+            raise ValueError(("The local engine '%s' of the ensemble is " +
+                              "not one of its engines: %s") %
+                             (local, ', '.join(slugs)))
+        engines = [get_engine_by_slug(slug).get_instance(vocabulary_name,
+                                                         phrases)
+                   for slug in slugs]
+        config['local'] = engines[slugs.index(local)] if local else None
+        return cls(engines, **config)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def average_latency(self, slug):
+        stats = self.stats[slug]
+        if not stats['requests']:
+            return None
+        return stats['latency'] / stats['requests']
+
+    def transcribe(self, fp):
+        """
+        Transcribes the audio with all engines in parallel.
+
+        Arguments:
+        fp -- an audio.AudioSegment or a file object containing WAV data
+        """
+        segment = audio.to_segment(fp)
+        results = Queue.Queue()
+        for engine in self.engines:
+            thread = threading.Thread(target=self._run,
+                                      args=(engine, segment, results),
+                                      name='EnsembleSTT-%s' % engine.SLUG)
+            thread.daemon = True
+            thread.start()
+
+        deadline = time.time() + self.latency_budget
+        # results in the order they came in
+        received = collections.OrderedDict()
+        winner = None
+        while len(received) < len(self.engines):
+            now = time.time()
+            if now >= deadline:
+                winner = self._fallback(received)
+                if winner is not None:
+                    break
+            try:
+                # Use a timeout, otherwise the wait can't be interrupted
+                # by KeyboardInterrupt
+                engine, result = results.get(
+                    timeout=deadline - now if now < deadline else 1)
+            except Queue.Empty:
+                continue
+            received[engine] = result
+            confidence = None
+            if result:
+                confidence = getattr(result[0], 'confidence', None)
+            if confidence is not None and confidence >= self.min_confidence:
+                winner = (engine, result)
+                break
+        else:
+            winner = self._fallback(received)
+
+        if winner is None:
+            self._logger.info('No engine transcribed anything.')
+            return []
+        engine, result = winner
+        with self._stats_lock:
+            self.stats[engine.SLUG]['wins'] += 1
+        self._logger.info("Engine '%s' won with %r", engine.SLUG, result)
+        self._logger.debug("Ensemble statistics: %r", self.stats)
+        return result
+
+    def _fallback(self, received):
+        """
+        Returns:
+            The (engine, result) that wins without a confident result, or
+            None if it's not clear yet
+        """
+        if self.local is not None and self.local not in received:
+            return None
+        if received.get(self.local):
+            return (self.local, received[self.local])
+        for engine, result in received.items():
+            if result:
+                return (engine, result)
+        return None
+
+    def _run(self, engine, segment, results):
+        with self._engine_locks[engine]:
+            start = time.time()
+            try:
+                result = engine.transcribe(segment)
+            except Exception:
+                self._logger.error("Engine '%s' failed.", engine.SLUG,
+                                   exc_info=True)
+                result = []
+                failed = True
+            else:
+                failed = False
+        with self._stats_lock:
+            stats = self.stats[engine.SLUG]
+            stats['requests'] += 1
+            stats['latency'] += time.time() - start
+            if failed:
+                stats['errors'] += 1
+        results.put((engine, list(result)))
+
+
+class CircuitBreakerSTT(AbstractSTTEngine):
+    """
+    Guards a network engine with a local fallback engine (e.g. PocketSphinx
+    or Julius). Utterances go to the network engine as long as it works;
+    when a request fails, the same audio is transcribed by the fallback
+    engine instead.
+
+    After max_failures failed or slow requests in a row (slower than
+    latency_slo seconds), the breaker trips: all utterances then go to the
+    fallback engine directly, so that the user doesn't have to wait for
+    timeouts. In the background, a probe clip is sent to the network
+    engine every probe_interval seconds, and the breaker closes again as
+    soon as it has been transcribed in time.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        stt_engine: breaker
+        breaker-stt:
+          engine: google
+          fallback: sphinx
+          max_failures: 3
+          latency_slo: 4.0
+          probe_interval: 30
+    """
+
+    SLUG = 'breaker'
+
+    def __init__(self, engine, fallback, max_failures=3, latency_slo=4.0,
+                 probe_interval=30, probe_clip=None):
+        """
+        Arguments:
+        engine -- the network STT engine instance to guard
+        fallback -- the local STT engine instance to use instead
+        max_failures -- the number of failed or slow requests in a row that
+                        trip the breaker
+        latency_slo -- the number of seconds after which a request counts
+                       as slow
+        probe_interval -- the number of seconds between two probes while
+                          the breaker is tripped
+        probe_clip -- (optional) the WAV file sent as a probe
+        """
+        self._logger = logging.getLogger(__name__)
+        self.engine = engine
+        self.fallback = fallback
+        self.max_failures = max_failures
+        self.latency_slo = latency_slo
+        self.probe_interval = probe_interval
+        if probe_clip is None:
+            probe_clip = nikitapath.data('audio', 'time.wav')
+        self.probe_clip = probe_clip
+        # stream like the guarded engine, the recording is kept for the
+        # fallback engine in case the upload fails
+        self.STREAMING = engine.STREAMING
+        self.failures = 0
+        self.trips = 0
+        self.tripped = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_config(cls):
+        config = {}
+        profile = nikitaconfig.get_profile()
+        if 'breaker-stt' in profile:
+            for key in ('engine', 'fallback', 'max_failures',
+                        'latency_slo', 'probe_interval'):
+                if key in profile['breaker-stt']:
+                    config[key] = profile['breaker-stt'][key]
+        return config
+
+    @classmethod
+    def get_instance(cls, vocabulary_name, phrases):
+        config = cls.get_config()
+        for key, default in (('engine', 'google'), ('fallback', 'sphinx')):
+            slug = config.get(key, default)
+            config[key] = get_engine_by_slug(slug).get_instance(
+                vocabulary_name, phrases)
+        return cls(**config)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def transcribe(self, fp):
+        """
+        Transcribes the audio with the network engine, or with the fallback
+        engine if the breaker is tripped or the request fails.
+
+        Arguments:
+        fp -- an audio.AudioSegment or a file object containing WAV data
+        """
+        segment = audio.to_segment(fp)
+        if self.tripped:
+            return self.fallback.transcribe(segment)
+        start = time.time()
+        result, error = self._call(self.engine.transcribe, segment)
+        self._record(error, time.time() - start)
+        if error is not None:
+            self._logger.info("Falling back to '%s'", self.fallback.SLUG)
+            return self.fallback.transcribe(segment)
+        return result
+
+    def transcribe_stream(self, chunks, rate=16000, width=2):
+        if self.tripped:
+            return self.fallback.transcribe_stream(chunks, rate=rate,
+                                                   width=width)
+        chunks = iter(chunks)
+        recorded = []
+        # the latency of a streamed request starts when the recording ends
+        start = [time.time()]
+
+        def record():
+            for chunk in chunks:
+                recorded.append(chunk)
+                yield chunk
+            start[0] = time.time()
+
+        result, error = self._call(self.engine.transcribe_stream, record(),
+                                   rate=rate, width=width)
+        self._record(error, time.time() - start[0])
+        if error is not None:
+            self._logger.info("Falling back to '%s'", self.fallback.SLUG)
+            # a failed upload may have stopped before the recording ended
+            recorded.extend(chunks)
+            return self.fallback.transcribe(audio.AudioSegment(
+                ''.join(recorded), rate=rate, width=width))
+        return result
+
+    def _call(self, transcribe, *args, **kwargs):
+        """
+        Returns:
+            A tuple (result, error), error is None if the request succeeded
+        """
+        try:
+            result = transcribe(*args, **kwargs)
+        except Exception as e:
+            self._logger.error("Engine '%s' failed.", self.engine.SLUG,
+                               exc_info=True)
+            return ([], str(e) or e.__class__.__name__)
+        return (result, self.engine.last_error)
+
+    def _record(self, error, latency):
+        with self._lock:
+            if error is None and latency <= self.latency_slo:
+                self.failures = 0
+                return
+            if error is None:
+                self._logger.warning("Engine '%s' took %.1fs, more than " +
+                                     "the %.1fs objective", self.engine.SLUG,
+                                     latency, self.latency_slo)
+            self.failures += 1
+            if self.tripped or self.failures < self.max_failures:
+                return
+            self.tripped = True
+            self.trips += 1
+        self._logger.warning("Engine '%s' failed %d times in a row, using " +
+                             "'%s' until it recovers", self.engine.SLUG,
+                             self.failures, self.fallback.SLUG)
+        thread = threading.Thread(target=self._probe,
+                                  name='CircuitBreakerSTT-probe')
+        thread.daemon = True
+        thread.start()
+
+    def _probe(self):
+        segment = audio.AudioSegment.from_wav(self.probe_clip)
+        while True:
+            time.sleep(self.probe_interval)
+            start = time.time()
+            result, error = self._call(self.engine.transcribe, segment)
+            latency = time.time() - start
+            if error is None and latency <= self.latency_slo:
+                break
+            self._logger.debug("Engine '%s' is still unhealthy: %s",
+                               self.engine.SLUG,
+                               error or 'took %.1fs' % latency)
+        with self._lock:
+            self.failures = 0
+            self.tripped = False
+        self._logger.info("Engine '%s' has recovered", self.engine.SLUG)
+
+
 def get_engine_by_slug(slug=None):
     """
     Returns:
@@ -34,3 +34,9 @@ class Mic:
     def say(self, speechType, phrase, OPTIONS=None):
         self.outputs.append(phrase)
         self._logger.transcript('Returned: %r|%r', speechType, phrase)
+
+    def wait(self):
+        pass
+
+    def flush(self):
+        pass
@@ -4,7 +4,9 @@ A Speaker handles audio output from Nikita to the user
 
 Speaker methods:
     say - output 'phrase' as speech
+    synthesize - render 'phrase' into a WAV file without playing it
     play - play the audio in 'filename'
+    stop - stop the current playback
     is_available - returns True if the platform supports this implementation
 """
 import os
@@ -14,22 +16,59 @@ import tempfile
 import subprocess
 import pipes
 import logging
+import threading
+import time
+import atexit
+import socket
+import ctypes
+import ctypes.util
 import wave
+import Queue
 import urllib
 import urlparse
 import requests
 from abc import ABCMeta, abstractmethod
 
 import argparse
-import yaml
 try:
     import mad
     import gtts
 except ImportError:
     pass
 
+import audio
 import diagnose
-import nikitapath
+import httpsession
+import nikitaconfig
+import player
+
+# end of a sentence: punctuation followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+
+
+def split_sentences(phrase, min_length=20):
+    """
+    Splits phrase into sentences that can be synthesized one by one. Short
+    sentences are joined with the following one, so that abbreviations like
+    "Mr." don't cause unnatural pauses.
+
+    Arguments:
+        phrase -- the text to split
+        min_length -- the minimum length of a sentence (Default: 20)
+
+    Returns:
+        A list of sentences
+    """
+    sentences = []
+    current = ''
+    for part in SENTENCE_END.split(phrase.strip()):
+        current = '%s %s' % (current, part) if current else part
+        if len(current) >= min_length:
+            sentences.append(current)
+            current = ''
+    if current:
+        sentences.append(current)
+    return sentences
 
 
 class AbstractTTSEngine(object):
@@ -38,6 +77,10 @@ class AbstractTTSEngine(object):
     """
     __metaclass__ = ABCMeta
 
+    # FIXME: Use platform-independent audio-output here
+    # See issue nikitaproject/nikita-client#188
+    PLAY_COMMAND = ['aplay', '-D', 'hw:1,0']
+
     @classmethod
     def get_config(cls):
         return {}
@@ -55,23 +98,98 @@ class AbstractTTSEngine(object):
 
     def __init__(self, **kwargs):
         self._logger = logging.getLogger(__name__)
+        # plays the synthesized WAV files, see the player module
+        self.player = player.CommandPlayer(self.PLAY_COMMAND)
+
+    @property
+    def now_playing(self):
+        """
+        (AudioSegment, start time) of the sound that is currently played
+        """
+        return self.player.now_playing
 
-    @abstractmethod
     def say(self, phrase, *args):
-        pass
+        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+        for fname in self._synthesize_ahead(split_sentences(phrase)):
+            try:
+                self.play(fname)
+            finally:
+                os.remove(fname)
+
+    def _synthesize_ahead(self, sentences):
+        """
+        Yields the WAV files of sentences. The next sentence is synthesized
+        on a separate thread while the caller plays the current one, so
+        that the first sound comes out as early as possible.
+        """
+        results = Queue.Queue(maxsize=1)
+        stopped = threading.Event()
+
+        def synthesize():
+            try:
+                for sentence in sentences:
+                    if stopped.is_set():
+                        break
+                    results.put((self.synthesize(sentence), None))
+            except Exception as e:
+                results.put((None, e))
+            else:
+                results.put((None, None))
+
+        thread = threading.Thread(target=synthesize, name='Synthesizer')
+        thread.daemon = True
+        thread.start()
+        finished = False
+        try:
+            while True:
+                fname, error = results.get()
+                if fname is None:
+                    finished = True
+                    if error is not None:
+                        raise error
+                    break
+                yield fname
+        finally:
+            if not finished:
+                # the caller gave up, remove what has been synthesized
+                stopped.set()
+                while True:
+                    fname, error = results.get()
+                    if fname is None:
+                        break
+                    os.remove(fname)
+
+    def cache_key(self):
+        """
+        Returns:
+            A tuple of the settings that change how the engine sounds, e.g.
+            its voice or language. Synthesized phrases are cached under
+            this key (see the ttscache module).
+        """
+        return ()
+
+    def synthesize(self, phrase):
+        """
+        Renders phrase into a temporary WAV file.
+
+        Returns:
+            The name of the WAV file, which has to be removed by the caller
+
+        Raises:
+            NotImplementedError if the engine can only speak directly
+        """
+        raise NotImplementedError(
+            "TTS engine '%s' can't synthesize to a file" % self.SLUG)
 
     def play(self, filename):
-        # FIXME: Use platform-independent audio-output here
-        # See issue nikitaproject/nikita-client#188
-        cmd = ['aplay', '-D', 'hw:1,0', str(filename)]
-        self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
-                                                     for arg in cmd]))
-        with tempfile.TemporaryFile() as f:
-            subprocess.call(cmd, stdout=f, stderr=f)
-            f.seek(0)
-            output = f.read()
-            if output:
-                self._logger.debug("Output was: '%s'", output)
+        self.player.play(filename)
+
+    def stop(self):
+        """
+        Stops the current playback. This is meant to be called from another
+        thread than the one that is playing.
+        """
+        self.player.stop()
 
 
 class AbstractMp3TTSEngine(AbstractTTSEngine):
@@ -84,8 +202,21 @@ class AbstractMp3TTSEngine(AbstractTTSEngine):
                 diagnose.check_python_import('mad'))
 
     def play_mp3(self, filename):
+        fname = self.mp3_to_wav(filename)
+        try:
+            self.play(fname)
+        finally:
+            os.remove(fname)
+
+    def mp3_to_wav(self, filename):
+        """
+        Decodes an mp3 file into a temporary WAV file.
+
+        Returns:
+            The name of the WAV file, which has to be removed by the caller
+        """
         mf = mad.MadFile(filename)
-        with tempfile.NamedTemporaryFile(suffix='.wav') as f:
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             wav = wave.open(f, mode='wb')
             wav.setframerate(mf.samplerate())
             wav.setnchannels(1 if mf.mode() == mad.MODE_SINGLE_CHANNEL else 2)
@@ -96,7 +227,7 @@ class AbstractMp3TTSEngine(AbstractTTSEngine):
                 wav.writeframes(frame)
                 frame = mf.read()
             wav.close()
-            self.play(f.name)
+        return f.name
 
 
 class DummyTTS(AbstractTTSEngine):
@@ -119,40 +250,128 @@ class DummyTTS(AbstractTTSEngine):
         pass
 
 
+class EspeakLibrary(object):
+    """
+    Runs eSpeak in-process through libespeak, so that no process has to be
+    started per phrase. The library keeps global state, therefore there is
+    only one instance (see get_instance) and calls are serialized.
+    """
+
+    # constants from speak_lib.h
+    AUDIO_OUTPUT_SYNCHRONOUS = 2
+    POS_CHARACTER = 1
+    CHARS_UTF8 = 1
+    RATE = 1
+    PITCH = 3
+
+    SYNTH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int,
+                                      ctypes.POINTER(ctypes.c_short),
+                                      ctypes.c_int, ctypes.c_void_p)
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Returns:
+            The shared EspeakLibrary or None, if libespeak isn't available
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                try:
+                    cls._instance = cls()
+                except (OSError, RuntimeError) as e:
+                    logging.getLogger(__name__).info(
+                        "libespeak not available, using the espeak " +
+                        "executable instead: %s", e)
+                    cls._instance = False
+            return cls._instance or None
+
+    def __init__(self):
+        self._logger = logging.getLogger(__name__)
+        name = ctypes.util.find_library('espeak') or 'libespeak.so.1'
+        self._lib = ctypes.cdll.LoadLibrary(name)
+        self._lock = threading.Lock()
+        self._samples = []
+        # keep a reference, otherwise the callback gets garbage collected
+        self._callback = self.SYNTH_CALLBACK(self._collect)
+        self.rate = self._lib.espeak_Initialize(
+            self.AUDIO_OUTPUT_SYNCHRONOUS, 0, None, 0)
+        if self.rate <= 0:
+            raise RuntimeError("espeak_Initialize failed")
+        self._lib.espeak_SetSynthCallback(self._callback)
+
+    def _collect(self, wav, numsamples, events):
+        if wav and numsamples > 0:
+            self._samples.append(ctypes.string_at(wav, numsamples * 2))
+        return 0
+
+    def synthesize(self, phrase, voice, pitch, rate):
+        """
+        Returns:
+            The synthesized phrase as AudioSegment (16 bit mono)
+
+        Raises:
+            RuntimeError if eSpeak reported an error
+        """
+        if isinstance(phrase, unicode):
+            phrase = phrase.encode('utf-8')
+        with self._lock:
+            if self._lib.espeak_SetVoiceByName(str(voice)) != 0:
+                raise RuntimeError("Unknown eSpeak voice '%s'" % voice)
+            self._lib.espeak_SetParameter(self.RATE, int(rate), 0)
+            self._lib.espeak_SetParameter(self.PITCH, int(pitch), 0)
+            self._samples = []
+            error = self._lib.espeak_Synth(phrase, len(phrase) + 1, 0,
+                                           self.POS_CHARACTER, 0,
+                                           self.CHARS_UTF8, None, None)
+            if error != 0:
+                raise RuntimeError("espeak_Synth failed with error %d" %
+                                   error)
+            data = ''.join(self._samples)
+            self._samples = []
+        return audio.AudioSegment(data, rate=self.rate, width=2)
+
+
 class EspeakTTS(AbstractTTSEngine):
     """
     Uses the eSpeak speech synthesizer included in the Nikita disk image
-    Requires espeak to be available
+    Requires espeak to be available. If libespeak is installed as well, it is
+    used in-process instead of running espeak for every phrase.
     """
 
     SLUG = "espeak-tts"
 
     def __init__(self, voice='default+m3', pitch_adjustment=40,
-                 words_per_minute=160):
+                 words_per_minute=160, use_library=True):
         super(self.__class__, self).__init__()
         self.voice = voice
         self.pitch_adjustment = pitch_adjustment
         self.words_per_minute = words_per_minute
+        self._library = EspeakLibrary.get_instance() if use_library else None
+
+    def cache_key(self):
+        return (self.voice, self.pitch_adjustment, self.words_per_minute)
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'espeak-tts' in profile:
-                    if 'voice' in profile['espeak-tts']:
-                        config['voice'] = profile['espeak-tts']['voice']
-                    if 'pitch_adjustment' in profile['espeak-tts']:
-                        config['pitch_adjustment'] = \
-                            profile['espeak-tts']['pitch_adjustment']
-                    if 'words_per_minute' in profile['espeak-tts']:
-                        config['words_per_minute'] = \
-                            profile['espeak-tts']['words_per_minute']
+        profile = nikitaconfig.get_profile()
+        if 'espeak-tts' in profile:
+            if 'voice' in profile['espeak-tts']:
+                config['voice'] = profile['espeak-tts']['voice']
+            if 'pitch_adjustment' in profile['espeak-tts']:
+                config['pitch_adjustment'] = \
+                    profile['espeak-tts']['pitch_adjustment']
+            if 'words_per_minute' in profile['espeak-tts']:
+                config['words_per_minute'] = \
+                    profile['espeak-tts']['words_per_minute']
+            if 'use_library' in profile['espeak-tts']:
+                config['use_library'] = \
+                    profile['espeak-tts']['use_library']
         return config
 
     @classmethod
@@ -160,8 +379,20 @@ class EspeakTTS(AbstractTTSEngine):
         return (super(cls, cls).is_available() and
                 diagnose.check_executable('espeak'))
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
+        if self._library is not None:
+            try:
+                segment = self._library.synthesize(
+                    phrase, self.voice, self.pitch_adjustment,
+                    self.words_per_minute)
+            except RuntimeError:
+                self._logger.warning("libespeak failed, running espeak " +
+                                     "instead.", exc_info=True)
+            else:
+                with tempfile.NamedTemporaryFile(suffix='.wav',
+                                                 delete=False) as f:
+                    f.write(segment.wav)
+                return f.name
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             fname = f.name
         cmd = ['espeak', '-v', self.voice,
@@ -178,18 +409,195 @@ class EspeakTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
+
+
+class FestivalServer(object):
+    """
+    Keeps a 'festival --server' process running, so that festival and its
+    voices are only loaded once instead of for every phrase. Phrases are
+    sent over a persistent connection, using festival's client/server
+    protocol. If the server crashes or hangs, it is restarted.
+    """
+
+    # terminates the data of a reply
+    KEY = 'ft_StUfF_key'
+
+    def __init__(self, host='localhost', port=1314, timeout=30):
+        """
+        Arguments:
+            host -- the host the server listens on (Default: localhost)
+            port -- the port the server listens on (Default: 1314)
+            timeout -- the number of seconds to wait for the server to start
+                       or to answer (Default: 30)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._process = None
+        self._sock = None
+        self._buffer = ''
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def check(self):
+        """
+        Starts the server if necessary and checks that it answers.
+
+        Returns:
+            True if the server is healthy, else False
+        """
+        with self._lock:
+            try:
+                self._ensure_running()
+                self._command('(+ 1 1)')
+            except (IOError, EOFError, RuntimeError):
+                self._logger.warning("Festival server is not healthy.",
+                                     exc_info=True)
+                self._stop()
+                return False
+            return True
+
+    def synthesize(self, phrase):
+        """
+        Returns:
+            The synthesized phrase as WAV file contents (str)
+
+        Raises:
+            IOError if the server doesn't work even after a restart
+            RuntimeError if festival failed to synthesize the phrase
+        """
+        if isinstance(phrase, unicode):
+            phrase = phrase.encode('utf-8')
+        phrase = phrase.replace('\\', '\\\\').replace('"', '\\"')
+        expr = ('(utt.send.wave.client (utt.synth (Utterance Text "%s")))' %
+                phrase)
+        with self._lock:
+            try:
+                self._ensure_running()
+                waves = self._command(expr)
+            except (IOError, EOFError) as e:
+                self._logger.warning("Festival server failed, restarting " +
+                                     "it: %s", e)
+                self._stop()
+                self._ensure_running()
+                waves = self._command(expr)
+        if not waves:
+            raise RuntimeError("Festival didn't return any audio")
+        return waves[0]
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self.is_alive():
+            self._process.terminate()
+            self._process.wait()
+        self._process = None
+
+    def _ensure_running(self):
+        if self._sock is not None:
+            return
+        if not self.is_alive():
+            cmd = ['festival', '--server', '(set! server_port %d)' % self.port]
+            self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
+                                                         for arg in cmd]))
+            with open(os.devnull, 'w') as devnull:
+                self._process = subprocess.Popen(cmd, stdout=devnull,
+                                                 stderr=devnull)
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                self._sock = socket.create_connection((self.host, self.port),
+                                                      self.timeout)
+                break
+            except socket.error:
+                if not self.is_alive() or time.time() > deadline:
+                    raise
+                # festival is still loading its voices
+                time.sleep(0.1)
+        self._buffer = ''
+        self._command("(Parameter.set 'Wavefiletype 'riff)")
+
+    def _command(self, expr):
+        """
+        Evaluates expr on the server.
+
+        Returns:
+            A list of the waves sent by the server
+        """
+        self._sock.sendall(expr + '\n')
+        waves = []
+        while True:
+            kind = self._read(3)
+            if kind == 'OK\n':
+                return waves
+            elif kind == 'ER\n':
+                raise RuntimeError("Festival failed to evaluate %s" % expr)
+            data = self._read_until(self.KEY)
+            if kind == 'WV\n':
+                waves.append(data)
+            elif kind != 'LP\n':
+                raise IOError("Unexpected reply from festival: %r" % kind)
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            self._receive()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_until(self, key):
+        while key not in self._buffer:
+            self._receive()
+        data, self._buffer = self._buffer.split(key, 1)
+        return data
+
+    def _receive(self):
+        data = self._sock.recv(4096)
+        if not data:
+            raise EOFError("Festival server closed the connection")
+        self._buffer += data
 
 
 class FestivalTTS(AbstractTTSEngine):
     """
     Uses the festival speech synthesizer
-    Requires festival (text2wave) to be available
+    Requires festival (text2wave) to be available. By default, festival is
+    kept running in server mode, so that it only starts up once.
     """
 
     SLUG = 'festival-tts'
 
+    def __init__(self, server=True, port=1314):
+        super(self.__class__, self).__init__()
+        self._server = None
+        if server:
+            self._server = FestivalServer(port=port)
+            atexit.register(self._server.stop)
+            # start the server in the background, it takes a while
+            thread = threading.Thread(target=self._server.check,
+                                      name='FestivalServer')
+            thread.daemon = True
+            thread.start()
+
+    @classmethod
+    def get_config(cls):
+        config = {}
+        profile = nikitaconfig.get_profile()
+        if 'festival-tts' in profile:
+            if 'server' in profile['festival-tts']:
+                config['server'] = profile['festival-tts']['server']
+            if 'port' in profile['festival-tts']:
+                config['port'] = profile['festival-tts']['port']
+        return config
+
     @classmethod
     def is_available(cls):
         if (super(cls, cls).is_available() and
@@ -211,10 +619,21 @@ class FestivalTTS(AbstractTTSEngine):
                     return ('No default voice found' not in output)
         return False
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
+        if self._server is not None:
+            try:
+                data = self._server.synthesize(phrase)
+            except (IOError, EOFError, RuntimeError):
+                self._logger.warning("Festival server failed, running " +
+                                     "text2wave instead.", exc_info=True)
+            else:
+                with tempfile.NamedTemporaryFile(suffix='.wav',
+                                                 delete=False) as f:
+                    f.write(data)
+                return f.name
         cmd = ['text2wave']
-        with tempfile.NamedTemporaryFile(suffix='.wav') as out_f:
+        with tempfile.NamedTemporaryFile(suffix='.wav',
+                                         delete=False) as out_f:
             with tempfile.SpooledTemporaryFile() as in_f:
                 in_f.write(phrase)
                 in_f.seek(0)
@@ -228,7 +647,7 @@ class FestivalTTS(AbstractTTSEngine):
                     output = err_f.read()
                     if output:
                         self._logger.debug("Output was: '%s'", output)
-            self.play(out_f.name)
+        return out_f.name
 
 
 class FliteTTS(AbstractTTSEngine):
@@ -243,6 +662,9 @@ class FliteTTS(AbstractTTSEngine):
         super(self.__class__, self).__init__()
         self.voice = voice if voice and voice in self.get_voices() else ''
 
+    def cache_key(self):
+        return (self.voice,)
+
     @classmethod
     def get_voices(cls):
         cmd = ['flite', '-lv']
@@ -258,17 +680,13 @@ class FliteTTS(AbstractTTSEngine):
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'flite-tts' in profile:
-                    if 'voice' in profile['flite-tts']:
-                        config['voice'] = profile['flite-tts']['voice']
+        profile = nikitaconfig.get_profile()
+        if 'flite-tts' in profile:
+            if 'voice' in profile['flite-tts']:
+                config['voice'] = profile['flite-tts']['voice']
         return config
 
     @classmethod
@@ -277,8 +695,7 @@ class FliteTTS(AbstractTTSEngine):
                 diagnose.check_executable('flite') and
                 len(cls.get_voices()) > 0)
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         cmd = ['flite']
         if self.voice:
             cmd.extend(['-voice', self.voice])
@@ -295,8 +712,7 @@ class FliteTTS(AbstractTTSEngine):
             output = out_f.read().strip()
         if output:
             self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
 
 
 class MacOSXTTS(AbstractTTSEngine):
@@ -305,6 +721,7 @@ class MacOSXTTS(AbstractTTSEngine):
     """
 
     SLUG = "osx-tts"
+    PLAY_COMMAND = ['afplay']
 
     @classmethod
     def is_available(cls):
@@ -312,20 +729,11 @@ class MacOSXTTS(AbstractTTSEngine):
                 diagnose.check_executable('say') and
                 diagnose.check_executable('afplay'))
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
-        cmd = ['say', str(phrase)]
-        self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
-                                                     for arg in cmd]))
-        with tempfile.TemporaryFile() as f:
-            subprocess.call(cmd, stdout=f, stderr=f)
-            f.seek(0)
-            output = f.read()
-            if output:
-                self._logger.debug("Output was: '%s'", output)
-
-    def play(self, filename):
-        cmd = ['afplay', str(filename)]
+    def synthesize(self, phrase):
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            fname = f.name
+        cmd = ['say', '-o', fname, '--file-format=WAVE',
+               '--data-format=LEI16@22050', str(phrase)]
         self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
                                                      for arg in cmd]))
         with tempfile.TemporaryFile() as f:
@@ -334,6 +742,7 @@ class MacOSXTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
+        return fname
 
 
 class PicoTTS(AbstractTTSEngine):
@@ -347,6 +756,10 @@ class PicoTTS(AbstractTTSEngine):
     def __init__(self, language="en-US"):
         super(self.__class__, self).__init__()
         self.language = language
+        self._languages = None
+
+    def cache_key(self):
+        return (self.language,)
 
     @classmethod
     def is_available(cls):
@@ -355,21 +768,20 @@ class PicoTTS(AbstractTTSEngine):
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'pico-tts' in profile and 'language' in profile['pico-tts']:
-                    config['language'] = profile['pico-tts']['language']
+        profile = nikitaconfig.get_profile()
+        if 'pico-tts' in profile and 'language' in profile['pico-tts']:
+            config['language'] = profile['pico-tts']['language']
 
         return config
 
     @property
     def languages(self):
+        # pico2wave is only asked once, not for every phrase
+        if self._languages is not None:
+            return self._languages
         cmd = ['pico2wave', '-l', 'NULL',
                             '-w', os.devnull,
                             'NULL']
@@ -382,11 +794,10 @@ class PicoTTS(AbstractTTSEngine):
         matchobj = pattern.match(output)
         if not matchobj:
             raise RuntimeError("pico2wave: valid languages not detected")
-        langs = matchobj.group(1).split()
-        return langs
+        self._languages = matchobj.group(1).split()
+        return self._languages
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             fname = f.name
         cmd = ['pico2wave', '--wave', fname]
@@ -403,8 +814,7 @@ class PicoTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
 
 
 class GoogleTTS(AbstractMp3TTSEngine):
@@ -419,6 +829,9 @@ class GoogleTTS(AbstractMp3TTSEngine):
         super(self.__class__, self).__init__()
         self.language = language
 
+    def cache_key(self):
+        return (self.language,)
+
     @classmethod
     def is_available(cls):
         return (super(cls, cls).is_available() and
@@ -427,17 +840,13 @@ class GoogleTTS(AbstractMp3TTSEngine):
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if ('google-tts' in profile and
-                   'language' in profile['google-tts']):
-                    config['language'] = profile['google-tts']['language']
+        profile = nikitaconfig.get_profile()
+        if ('google-tts' in profile and
+           'language' in profile['google-tts']):
+            config['language'] = profile['google-tts']['language']
 
         return config
 
@@ -450,8 +859,7 @@ class GoogleTTS(AbstractMp3TTSEngine):
                  'th', 'tr', 'vi', 'cy']
         return langs
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         if self.language not in self.languages:
             raise ValueError("Language '%s' not supported by '%s'",
                              self.language, self.SLUG)
@@ -459,8 +867,10 @@ class GoogleTTS(AbstractMp3TTSEngine):
         with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as f:
             tmpfile = f.name
         tts.save(tmpfile)
-        self.play_mp3(tmpfile)
-        os.remove(tmpfile)
+        try:
+            return self.mp3_to_wav(tmpfile)
+        finally:
+            os.remove(tmpfile)
 
 
 class MaryTTS(AbstractTTSEngine):
@@ -483,44 +893,51 @@ class MaryTTS(AbstractTTSEngine):
                                                port=self.port)
         self.language = language
         self.voice = voice
-        self.session = requests.Session()
+        self.session = httpsession.get_session()
+        self._languages = None
+        self._voices = None
+
+    def cache_key(self):
+        return (self.server, self.port, self.language, self.voice)
 
     @property
     def languages(self):
-        try:
-            r = self.session.get(self._makeurl('/locales'))
-            r.raise_for_status()
-        except requests.exceptions.RequestException:
-            self._logger.critical("Communication with MaryTTS server at %s " +
-                                  "failed.", self.netloc)
-            raise
-        return r.text.splitlines()
+        # the server is only asked once, not for every phrase
+        if self._languages is None:
+            try:
+                r = self.session.get(self._makeurl('/locales'))
+                r.raise_for_status()
+            except requests.exceptions.RequestException:
+                self._logger.critical("Communication with MaryTTS server " +
+                                      "at %s failed.", self.netloc)
+                raise
+            self._languages = r.text.splitlines()
+        return self._languages
 
     @property
     def voices(self):
-        r = self.session.get(self._makeurl('/voices'))
-        r.raise_for_status()
-        return [line.split()[0] for line in r.text.splitlines()]
+        if self._voices is None:
+            r = self.session.get(self._makeurl('/voices'))
+            r.raise_for_status()
+            self._voices = [line.split()[0]
+                            for line in r.text.splitlines()]
+        return self._voices
 
     @classmethod
     def get_config(cls):
-        # FIXME: Replace this as soon as we have a config module
         config = {}
         # HMM dir
         # Try to get hmm_dir from config
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'mary-tts' in profile:
-                    if 'server' in profile['mary-tts']:
-                        config['server'] = profile['mary-tts']['server']
-                    if 'port' in profile['mary-tts']:
-                        config['port'] = profile['mary-tts']['port']
-                    if 'language' in profile['mary-tts']:
-                        config['language'] = profile['mary-tts']['language']
-                    if 'voice' in profile['mary-tts']:
-                        config['voice'] = profile['mary-tts']['voice']
+        profile = nikitaconfig.get_profile()
+        if 'mary-tts' in profile:
+            if 'server' in profile['mary-tts']:
+                config['server'] = profile['mary-tts']['server']
+            if 'port' in profile['mary-tts']:
+                config['port'] = profile['mary-tts']['port']
+            if 'language' in profile['mary-tts']:
+                config['language'] = profile['mary-tts']['language']
+            if 'voice' in profile['mary-tts']:
+                config['voice'] = profile['mary-tts']['voice']
 
         return config
 
@@ -534,8 +951,7 @@ class MaryTTS(AbstractTTSEngine):
         urlparts = ('http', self.netloc, path, query_s, '')
         return urlparse.urlunsplit(urlparts)
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         if self.language not in self.languages:
             raise ValueError("Language '%s' not supported by '%s'"
                              % (self.language, self.SLUG))
@@ -554,8 +970,7 @@ class MaryTTS(AbstractTTSEngine):
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             f.write(r.content)
             tmpfile = f.name
-        self.play(tmpfile)
-        os.remove(tmpfile)
+        return tmpfile
 
 
 def get_default_engine_slug():
@@ -0,0 +1,176 @@
+# -*- coding: utf-8-*-
+"""
+A disk cache for synthesized speech.
+
+Many phrases are spoken over and over again ("Pardon?", the salutation,
+help texts). The cache keeps their WAV files, so that they don't have to be
+synthesized (or downloaded) again. Entries are addressed by a hash of the
+engine, its voice configuration (see AbstractTTSEngine.cache_key) and the
+phrase. When the cache grows beyond its size limit, the least recently used
+entries are removed, except for those that are still being played.
+"""
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import collections
+
+import nikitapath
+
+
+class TTSCache(object):
+
+    def __init__(self, directory, max_size=50 * 1024 * 1024):
+        """
+        Arguments:
+            directory -- the directory to keep the WAV files in
+            max_size -- the maximum total size of the files in bytes
+                        (Default: 50 MiB)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # the number of users of every entry handed out by get()
+        self._pinned = collections.Counter()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # cached files and their sizes, least recently used first
+        self._entries = collections.OrderedDict()
+        files = [os.path.join(directory, fname)
+                 for fname in os.listdir(directory)
+                 if fname.endswith('.wav')]
+        for path in sorted(files, key=os.path.getmtime):
+            self._entries[os.path.basename(path)[:-4]] = \
+                os.path.getsize(path)
+        self._size = sum(self._entries.values())
+        self._evict()
+
+    @classmethod
+    def get_instance(cls, profile):
+        """
+        Creates a cache as configured in the 'tts_cache' section of profile.
+
+        Returns:
+            A TTSCache instance or None, if caching has been disabled
+        """
+        config = profile.get('tts_cache', {})
+        if not config.get('enabled', True):
+            return None
+        directory = config.get('directory', nikitapath.config('cache', 'tts'))
+        # the profile specifies the size in MiB
+        max_size = int(config.get('max_size', 50) * 1024 * 1024)
+        return cls(os.path.expanduser(directory), max_size=max_size)
+
+    @property
+    def size(self):
+        """
+        The total size of the cached files in bytes.
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(engine, phrase):
+        """
+        Returns:
+            The cache key of phrase when spoken by engine. It depends on the
+            engine's slug and its cache_key(), i.e. settings like voice or
+            language.
+        """
+        settings = engine.cache_key()
+        if isinstance(phrase, unicode):
+            phrase = phrase.encode('utf-8')
+        digest = hashlib.sha1()
+        digest.update(repr((getattr(engine, 'SLUG', None), settings)))
+        digest.update(' '.join(phrase.split()))
+        return digest.hexdigest()
+
+    def get(self, engine, phrase):
+        """
+        Returns:
+            The name of the cached WAV file of phrase or None, if it hasn't
+            been cached yet. The file must not be modified or removed. It
+            isn't evicted until it is handed back with release().
+        """
+        key = self.key(engine, phrase)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # mark as recently used, the order survives a restart via mtime
+            self._entries[key] = self._entries.pop(key)
+            self._pinned[key] += 1
+        path = self._path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            self._logger.warning("Cached file '%s' disappeared", path)
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+                self._unpin(key)
+            return None
+        self._logger.debug("Cache hit for '%s' (%d hits, %d misses)",
+                           phrase, self.hits, self.misses)
+        return path
+
+    def put(self, engine, phrase, fname):
+        """
+        Copies the WAV file fname into the cache.
+
+        Returns:
+            The name of the cached file
+        """
+        key = self.key(engine, phrase)
+        path = self._path(key)
+        # copy to a temporary file first, so that no half written file is
+        # ever visible under the final name
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp',
+                                         delete=False) as f:
+            with open(fname, 'rb') as src:
+                shutil.copyfileobj(src, f)
+        os.rename(f.name, path)
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = os.path.getsize(path)
+            self._size += self._entries[key]
+            self._evict()
+        return path
+
+    def release(self, path):
+        """
+        Hands back a file returned by get(), once it has been played.
+        """
+        with self._lock:
+            self._unpin(os.path.basename(path)[:-4])
+            self._evict()
+
+    def _unpin(self, key):
+        self._pinned[key] -= 1
+        if self._pinned[key] <= 0:
+            del self._pinned[key]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.wav')
+
+    def _evict(self):
+        for key in list(self._entries):
+            if self._size <= self.max_size:
+                break
+            if self._pinned[key]:
+                # still being played, evicted once it is released
+                continue
+            size = self._entries.pop(key)
+            self._size -= size
+            self._logger.debug("Evicting '%s' from the cache", key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,462 @@
+# -*- coding: utf-8-*-
+"""
+Voice activity detectors (VAD) decide whether chunks of audio contain speech.
+
+Every detector turns a stream of audio chunks into SPEECH_START and SPEECH_END
+events. The Mic class uses them to trigger passive listening and to find the
+end of a command during active listening.
+
+The detector and its per-room calibration can be configured in profile.yml:
+
+    ...
+    vad:
+      detector: zcr
+      calibration:
+        noise_floor: 112.5
+        noise_zcr: 0.21
+
+Run this module directly to measure a calibration for the current room.
+"""
+import logging
+import audioop
+from abc import ABCMeta, abstractmethod, abstractproperty
+
+import argparse
+try:
+    import numpy
+except ImportError:
+    pass
+
+import diagnose
+
+SPEECH_START = 'start'
+SPEECH_END = 'end'
+
+
+class AbstractVAD(object):
+    """
+    Generic parent class for all voice activity detectors
+    """
+    __metaclass__ = ABCMeta
+
+    @classmethod
+    def get_config(cls, profile):
+        config = {}
+        if 'vad' in profile:
+            if 'calibration' in profile['vad']:
+                config['calibration'] = profile['vad']['calibration']
+            if cls.SLUG in profile['vad']:
+                config.update(profile['vad'][cls.SLUG])
+        return config
+
+    @classmethod
+    def get_instance(cls, profile, **kwargs):
+        config = cls.get_config(profile)
+        config.update(kwargs)
+        instance = cls(**config)
+        return instance
+
+    @classmethod
+    @abstractmethod
+    def is_available(cls):
+        return True
+
+    def __init__(self, rate=16000, width=2, start_time=0.1, end_time=0.8):
+        """
+        Arguments:
+            rate -- the sample rate of the audio in Hz (Default: 16000)
+            width -- the sample width of the audio in bytes (Default: 2)
+            start_time -- seconds of speech needed before SPEECH_START is
+                          emitted (Default: 0.1)
+            end_time -- seconds of silence needed before SPEECH_END is
+                        emitted (Default: 0.8)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.rate = rate
+        self.width = width
+        self.start_time = start_time
+        self.end_time = end_time
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets whether speech is in progress. The calibration is kept.
+        """
+        self.in_speech = False
+        self._speech_time = 0
+        self._silence_time = 0
+
+    def process(self, chunk):
+        """
+        Analyses the next chunk of audio.
+
+        Arguments:
+            chunk -- raw PCM data
+
+        Returns:
+            SPEECH_START, SPEECH_END or None
+        """
+        duration = float(len(chunk)) / (self.width * self.rate)
+        event = None
+        if self.is_speech(chunk):
+            self._silence_time = 0
+            if not self.in_speech:
+                self._speech_time += duration
+                if self._speech_time >= self.start_time:
+                    self.in_speech = True
+                    event = SPEECH_START
+        else:
+            self._speech_time = 0
+            if self.in_speech:
+                self._silence_time += duration
+                if self._silence_time >= self.end_time:
+                    self.in_speech = False
+                    self._silence_time = 0
+                    event = SPEECH_END
+        return event
+
+    def track(self, chunk):
+        """
+        Updates the noise statistics with a chunk from the live stream
+        without emitting any events. Detectors keep their calibration up to
+        date this way while nobody is listening.
+        """
+        self.is_speech(chunk)
+
+    def events(self, chunks):
+        """
+        Generator that yields an (event, chunk) tuple for every chunk in
+        chunks. event is SPEECH_START, SPEECH_END or None.
+        """
+        for chunk in chunks:
+            yield (self.process(chunk), chunk)
+
+    @abstractmethod
+    def is_speech(self, chunk):
+        """
+        Returns True if the chunk looks like speech.
+        """
+        pass
+
+    @abstractmethod
+    def calibrate(self, chunks):
+        """
+        Learns the background noise of the room from chunks that don't
+        contain speech.
+        """
+        pass
+
+    @abstractmethod
+    def load_calibration(self, calibration):
+        """
+        Replaces the noise statistics with those from a dict as returned by
+        calibration.
+        """
+        pass
+
+    @abstractproperty
+    def calibration(self):
+        """
+        Returns:
+            A dict that can be stored in the 'calibration' section of the
+            profile and passed back to the constructor
+        """
+        pass
+
+    @abstractproperty
+    def threshold(self):
+        """
+        Returns:
+            The energy (RMS) above which a chunk is considered as speech
+        """
+        pass
+
+
+class EnergyVAD(AbstractVAD):
+    """
+    Considers everything that is significantly louder than the background
+    noise as speech. The noise floor is continuously adapted while nobody
+    speaks.
+    """
+
+    SLUG = 'energy'
+
+    def __init__(self, ratio=1.8, adaptation=0.05, drift=0.01,
+                 calibration=None, **kwargs):
+        """
+        Arguments:
+            ratio -- how many times louder than the noise floor speech has
+                     to be (Default: 1.8)
+            adaptation -- the weight of a new chunk when updating the noise
+                          floor (Default: 0.05)
+            drift -- the fraction of adaptation used for chunks considered as
+                     speech, so that the noise floor can follow a room that
+                     got louder permanently (Default: 0.01)
+            calibration -- (optional) a dict as returned by calibration
+        """
+        super(EnergyVAD, self).__init__(**kwargs)
+        self.ratio = ratio
+        self.adaptation = adaptation
+        self.drift = drift
+        self.noise_floor = None
+        if calibration:
+            self.load_calibration(calibration)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @property
+    def threshold(self):
+        if self.noise_floor is None:
+            return None
+        return self.noise_floor * self.ratio
+
+    @property
+    def calibration(self):
+        return {'noise_floor': self.noise_floor}
+
+    def load_calibration(self, calibration):
+        if calibration.get('noise_floor') is not None:
+            self.noise_floor = float(calibration['noise_floor'])
+
+    def energy(self, chunk):
+        # Digital silence would make every sound look like speech
+        return max(1.0, float(audioop.rms(chunk, self.width)))
+
+    def calibrate(self, chunks):
+        energies = [self.energy(chunk) for chunk in chunks]
+        if energies:
+            self.noise_floor = sum(energies) / len(energies)
+        self._logger.debug('Calibrated %s: %r', self.SLUG, self.calibration)
+
+    def adapt(self, energy, speech=False):
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        else:
+            weight = self.adaptation * (self.drift if speech else 1)
+            self.noise_floor += weight * (energy - self.noise_floor)
+
+    def is_speech(self, chunk):
+        energy = self.energy(chunk)
+        if self.noise_floor is None:
+            self.adapt(energy)
+            return False
+        speech = energy > self.threshold
+        self.adapt(energy, speech)
+        return speech
+
+
+class ZeroCrossingVAD(EnergyVAD):
+    """
+    Like EnergyVAD, but also detects quiet unvoiced sounds (e.g. 's' or 'f')
+    by their high zero-crossing rate. This prevents commands from being cut
+    off early.
+    """
+
+    SLUG = 'zcr'
+
+    def __init__(self, zcr_ratio=1.5, fricative_ratio=1.3, calibration=None,
+                 **kwargs):
+        """
+        Arguments:
+            zcr_ratio -- how many times higher than in the background noise
+                         the zero-crossing rate of unvoiced speech has to be
+                         (Default: 1.5)
+            fricative_ratio -- how many times louder than the noise floor
+                               unvoiced speech has to be (Default: 1.3)
+            calibration -- (optional) a dict as returned by calibration
+        """
+        self.noise_zcr = None
+        super(ZeroCrossingVAD, self).__init__(calibration=calibration,
+                                              **kwargs)
+        self.zcr_ratio = zcr_ratio
+        self.fricative_ratio = fricative_ratio
+
+    @property
+    def calibration(self):
+        calibration = super(ZeroCrossingVAD, self).calibration
+        calibration['noise_zcr'] = self.noise_zcr
+        return calibration
+
+    def load_calibration(self, calibration):
+        super(ZeroCrossingVAD, self).load_calibration(calibration)
+        if calibration.get('noise_zcr') is not None:
+            self.noise_zcr = float(calibration['noise_zcr'])
+
+    def zcr(self, chunk):
+        samples = len(chunk) / self.width
+        if not samples:
+            return 0.0
+        return float(audioop.cross(chunk, self.width)) / samples
+
+    def calibrate(self, chunks):
+        chunks = list(chunks)
+        rates = [self.zcr(chunk) for chunk in chunks]
+        if rates:
+            self.noise_zcr = sum(rates) / len(rates)
+        super(ZeroCrossingVAD, self).calibrate(chunks)
+
+    def is_speech(self, chunk):
+        energy = self.energy(chunk)
+        zcr = self.zcr(chunk)
+        if self.noise_floor is None or self.noise_zcr is None:
+            self.adapt(energy)
+            self.noise_zcr = zcr
+            return False
+        speech = (energy > self.threshold or
+                  (energy > self.noise_floor * self.fricative_ratio and
+                   zcr > self.noise_zcr * self.zcr_ratio))
+        self.adapt(energy, speech)
+        if not speech:
+            self.noise_zcr += self.adaptation * (zcr - self.noise_zcr)
+        return speech
+
+
+class SpectralFlatnessVAD(EnergyVAD):
+    """
+    Like EnergyVAD, but rejects loud noise with a flat spectrum (e.g. fans,
+    running water) by looking at the spectral flatness of each chunk.
+    Requires NumPy.
+    """
+
+    SLUG = 'spectral'
+
+    def __init__(self, flatness_ratio=0.7, calibration=None, **kwargs):
+        """
+        Arguments:
+            flatness_ratio -- speech must have a spectral flatness below this
+                              fraction of the noise's flatness (Default: 0.7)
+            calibration -- (optional) a dict as returned by calibration
+        """
+        self.noise_flatness = None
+        super(SpectralFlatnessVAD, self).__init__(calibration=calibration,
+                                                  **kwargs)
+        if self.width != 2:
+            raise ValueError("'%s' only supports 16 bit audio" % self.SLUG)
+        self.flatness_ratio = flatness_ratio
+
+    @classmethod
+    def is_available(cls):
+        return diagnose.check_python_import('numpy')
+
+    @property
+    def calibration(self):
+        calibration = super(SpectralFlatnessVAD, self).calibration
+        calibration['noise_flatness'] = self.noise_flatness
+        return calibration
+
+    def load_calibration(self, calibration):
+        super(SpectralFlatnessVAD, self).load_calibration(calibration)
+        if calibration.get('noise_flatness') is not None:
+            self.noise_flatness = float(calibration['noise_flatness'])
+
+    def flatness(self, chunk):
+        samples = numpy.frombuffer(chunk, dtype='<i2').astype(numpy.float64)
+        if not len(samples):
+            return 1.0
+        spectrum = numpy.abs(numpy.fft.rfft(samples *
+                                            numpy.hanning(len(samples))))
+        power = spectrum ** 2 + 1e-10
+        return float(numpy.exp(numpy.mean(numpy.log(power))) /
+                     numpy.mean(power))
+
+    def calibrate(self, chunks):
+        chunks = list(chunks)
+        values = [self.flatness(chunk) for chunk in chunks]
+        if values:
+            self.noise_flatness = sum(values) / len(values)
+        super(SpectralFlatnessVAD, self).calibrate(chunks)
+
+    def is_speech(self, chunk):
+        energy = self.energy(chunk)
+        flatness = self.flatness(chunk)
+        if self.noise_floor is None or self.noise_flatness is None:
+            self.adapt(energy)
+            self.noise_flatness = flatness
+            return False
+        speech = (energy > self.threshold and
+                  flatness < self.noise_flatness * self.flatness_ratio)
+        self.adapt(energy, speech)
+        if not speech:
+            self.noise_flatness += self.adaptation * (flatness -
+                                                      self.noise_flatness)
+        return speech
+
+
+def get_default_detector_slug():
+    return 'energy'
+
+
+def get_detector_by_slug(slug=None):
+    """
+    Returns:
+        A voice activity detector available on the current platform
+
+    Raises:
+        ValueError if no detector with that slug is available
+    """
+
+    if not slug or type(slug) is not str:
+        raise TypeError("Invalid slug '%s'", slug)
+
+    selected_detectors = filter(lambda detector: hasattr(detector, "SLUG") and
+                                detector.SLUG == slug, get_detectors())
+    if len(selected_detectors) == 0:
+        raise ValueError("No VAD found for slug '%s'" % slug)
+    else:
+        if len(selected_detectors) > 1:
+            print(("WARNING: Multiple VADs found for slug '%s'. " +
+                   "This is most certainly a bug.") % slug)
+        detector = selected_detectors[0]
+        if not detector.is_available():
+            raise ValueError(("VAD '%s' is not available (due to " +
+                              "missing dependencies, etc.)") % slug)
+        return detector
+
+
+def get_detectors():
+    def get_subclasses(cls):
+        subclasses = set()
+        for subclass in cls.__subclasses__():
+            subclasses.add(subclass)
+            subclasses.update(get_subclasses(subclass))
+        return subclasses
+    return [detector for detector in
+            list(get_subclasses(AbstractVAD))
+            if hasattr(detector, 'SLUG') and detector.SLUG]
+
+
+if __name__ == '__main__':
+    import yaml
+    import pyaudio
+
+    parser = argparse.ArgumentParser(description='Nikita VAD calibration')
+    parser.add_argument('--detector', default=get_default_detector_slug(),
+                        help='The detector to calibrate')
+    parser.add_argument('--seconds', type=int, default=5,
+                        help='Seconds of background noise to record')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    detector = get_detector_by_slug(args.detector)()
+
+    print("Recording %d seconds of background noise. Please be quiet..." %
+          args.seconds)
+    RATE = 16000
+    CHUNK = 1024
+    audio = pyaudio.PyAudio()
+    stream = audio.open(format=pyaudio.paInt16, channels=1, rate=RATE,
+                        input=True, frames_per_buffer=CHUNK)
+    chunks = [stream.read(CHUNK)
+              for i in range(0, RATE / CHUNK * args.seconds)]
+    stream.stop_stream()
+    stream.close()
+    audio.terminate()
+
+    detector.calibrate(chunks)
+    print("Add this to your profile.yml:")
+    print("")
+    print(yaml.safe_dump({'vad': {'detector': detector.SLUG,
+                                  'calibration': detector.calibration}},
+                         default_flow_style=False))
@@ -14,10 +14,10 @@ import re
 import contextlib
 import shutil
 from abc import ABCMeta, abstractmethod, abstractproperty
-import yaml
 
 import brain
 import nikitapath
+import nikitaconfig
 
 from g2p import PhonetisaurusG2P
 try:
@@ -421,16 +421,13 @@ class JuliusVocabulary(AbstractVocabulary):
 
         lexicon_file = nikitapath.data('julius-stt', 'VoxForge.tgz')
         lexicon_archive_member = 'VoxForge/VoxForgeDict'
-        profile_path = nikitapath.config('profile.yml')
-        if os.path.exists(profile_path):
-            with open(profile_path, 'r') as f:
-                profile = yaml.safe_load(f)
-                if 'julius' in profile:
-                    if 'lexicon' in profile['julius']:
-                        lexicon_file = profile['julius']['lexicon']
-                    if 'lexicon_archive_member' in profile['julius']:
-                        lexicon_archive_member = \
-                            profile['julius']['lexicon_archive_member']
+        profile = nikitaconfig.get_profile()
+        if 'julius' in profile:
+            if 'lexicon' in profile['julius']:
+                lexicon_file = profile['julius']['lexicon']
+            if 'lexicon_archive_member' in profile['julius']:
+                lexicon_archive_member = \
+                    profile['julius']['lexicon_archive_member']
 
         lexicon = JuliusVocabulary.VoxForgeLexicon(lexicon_file,
                                                    lexicon_archive_member)
@@ -6,10 +6,9 @@ import sys
 import shutil
 import logging
 import MySQLdb
-import yaml
 import argparse
 
-from client import tts, stt, nikitapath, diagnose
+from client import tts, stt, nikitapath, nikitaconfig, diagnose
 from client.conversation import Conversation
 
 # Add nikitapath.LIB_PATH to sys.path
@@ -74,12 +73,11 @@ class Nikita(object):
 
         # Read config
         self._logger.debug("Trying to read config file: '%s'", new_configfile)
-        try:
-            with open(new_configfile, "r") as f:
-                self.config = yaml.safe_load(f)
-        except OSError:
+        if not os.path.exists(new_configfile):
             self._logger.error("Can't open config file: '%s'", new_configfile)
-            raise
+            raise IOError("Config file '%s' not found" % new_configfile)
+        # the engines share this profile, so it is only parsed once
+        self.config = nikitaconfig.get_profile()
 
         # Reset the log level to what is configured in the profile
         try:
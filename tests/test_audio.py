@@ -0,0 +1,173 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import array
+import mock
+from client import audio, nikitapath
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def testAppendAndGet(self):
+        buf = audio.RingBuffer(3)
+        for chunk in ('a', 'b', 'c', 'd'):
+            buf.append(chunk)
+        self.assertEqual(buf.head, 4)
+        self.assertEqual(buf.tail, 1)
+        self.assertEqual(buf.get(1), 'b')
+        self.assertEqual(buf.get(3), 'd')
+        with self.assertRaises(IndexError):
+            buf.get(0)
+
+    def testClosed(self):
+        buf = audio.RingBuffer(3)
+        buf.close()
+        with self.assertRaises(EOFError):
+            buf.get(0)
+
+    def testReaderSkipsOverwrittenChunks(self):
+        buf = audio.RingBuffer(2)
+        reader = audio.StreamReader(buf, 0)
+        for chunk in ('a', 'b', 'c'):
+            buf.append(chunk)
+        self.assertEqual(reader.read(), 'b')
+        self.assertEqual(reader.read(), 'c')
+        self.assertEqual(reader.position, 3)
+
+    def testCaptureTime(self):
+        buf = audio.RingBuffer(2)
+        reader = audio.StreamReader(buf, 0)
+        buf.append('a', 10.0)
+        buf.append('b', 10.5)
+        self.assertEqual(buf.get_with_time(0), ('a', 10.0))
+        self.assertEqual(reader.read(), 'a')
+        self.assertEqual(reader.timestamp, 10.0)
+        self.assertEqual(reader.read(), 'b')
+        self.assertEqual(reader.timestamp, 10.5)
+
+    def testMute(self):
+        buf = audio.RingBuffer(4)
+        reader = audio.StreamReader(buf, 0, chunk_time=0.5)
+        for chunk, timestamp in (('a', 10.0), ('b', 10.5), ('c', 11.0),
+                                 ('d', 11.5)):
+            buf.append(chunk, timestamp)
+        # a beep played from 10.2 to 10.6
+        reader.mute(10.2, 10.6)
+        self.assertEqual([reader.read() for i in range(4)],
+                         ['a', '\x00', '\x00', 'd'])
+
+
+class TestCaptureStream(unittest.TestCase):
+
+    def testReadersShareOneInputStream(self):
+        chunks = iter(['a', 'b', 'c', 'd'])
+
+        def read(n):
+            try:
+                return next(chunks)
+            except StopIteration:
+                stream._running = False
+                return 'e'
+
+        pa = mock.Mock()
+        pa.open.return_value.read.side_effect = read
+        stream = audio.CaptureStream(pa, 8, rate=4, chunk=1, buffer_time=2)
+        listener = mock.Mock()
+        stream.add_listener(listener)
+        first = stream.reader()
+        stream.start()
+        self.assertEqual(first.read(), 'a')
+        self.assertEqual(first.read(), 'b')
+        second = stream.reader(position=first.position, preroll=1)
+        self.assertEqual(second.read(), 'b')
+        self.assertEqual(pa.open.call_count, 1)
+        stream._thread.join()
+        listener.assert_any_call('a')
+
+
+class TestAudioSegment(unittest.TestCase):
+
+    def testFromWav(self):
+        segment = audio.AudioSegment.from_wav(
+            nikitapath.data('audio', 'nikita.wav'))
+        self.assertEqual(segment.rate, 16000)
+        self.assertEqual(segment.width, 2)
+        self.assertGreater(segment.duration, 0)
+
+    def testWavRoundTrip(self):
+        segment = audio.AudioSegment('\x01\x00' * 1600, rate=16000)
+        self.assertAlmostEqual(segment.duration, 0.1)
+        copy = audio.AudioSegment.from_wav(segment.wav_file())
+        self.assertEqual(copy.raw, segment.raw)
+        self.assertEqual(copy.rate, segment.rate)
+
+    def testPcmIsNotCopied(self):
+        data = bytearray('\x01\x00' * 16)
+        segment = audio.AudioSegment(data)
+        segment.pcm[0] = '\x02'
+        self.assertEqual(data[0], 2)
+        self.assertEqual(segment.raw[:2], '\x02\x00')
+
+    def testBufferIsNotCopied(self):
+        data = bytearray('\x01\x00' * 16)
+        buf = audio.AudioSegment(data).buffer
+        data[0] = 2
+        self.assertEqual(buf[:2], '\x02\x00')
+        self.assertEqual(audio.AudioSegment(memoryview(data)).buffer[:2],
+                         '\x02\x00')
+
+    def testToSegment(self):
+        segment = audio.AudioSegment('\x00\x00')
+        self.assertIs(audio.to_segment(segment), segment)
+        with open(nikitapath.data('audio', 'time.wav'), 'rb') as f:
+            self.assertIsInstance(audio.to_segment(f), audio.AudioSegment)
+
+
+class TestRecorder(unittest.TestCase):
+
+    def testRecord(self):
+        recorder = audio.Recorder(0.001, rate=4000)
+        self.assertEqual(recorder.capacity, 8)
+        self.assertTrue(recorder.append('ab'))
+        self.assertTrue(recorder.append('cd'))
+        self.assertEqual(len(recorder), 4)
+        segment = recorder.segment()
+        self.assertEqual(segment.raw, 'abcd')
+        self.assertEqual(segment.rate, 4000)
+        # the segment is backed by the recorder's buffer
+        recorder._buffer[0] = ord('x')
+        self.assertEqual(segment.buffer[:], 'xbcd')
+        self.assertEqual(segment.pcm.tobytes(), 'xbcd')
+
+    def testOverflow(self):
+        recorder = audio.Recorder(0.001, rate=2000)
+        self.assertTrue(recorder.append('abc'))
+        self.assertFalse(recorder.append('def'))
+        self.assertEqual(recorder.segment().raw, 'abcd')
+
+
+class TestEchoSuppressor(unittest.TestCase):
+
+    def setUp(self):
+        # one second of loud output, followed by one second of silence
+        loud = array.array('h', [4000, -4000] * 8000).tostring()
+        output = audio.AudioSegment(loud + '\x00' * len(loud))
+        self.suppressor = audio.EchoSuppressor(output, 100.0, coupling=0.5)
+
+    def chunk(self, amplitude):
+        return array.array('h', [amplitude, -amplitude] * 512).tostring()
+
+    def testEchoIsRemoved(self):
+        echo = self.chunk(3000)
+        self.assertEqual(self.suppressor.process(echo, now=100.5),
+                         '\x00' * len(echo))
+        # the coupling is learned from the echo
+        self.assertGreater(self.suppressor.coupling, 0.5)
+
+    def testSpeechPassesThrough(self):
+        speech = self.chunk(8000)
+        self.assertEqual(self.suppressor.process(speech, now=100.5), speech)
+
+    def testSilentOutput(self):
+        quiet = self.chunk(100)
+        self.assertEqual(self.suppressor.process(quiet, now=101.8), quiet)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import audioop
+import array
+import math
+from client import audiocodec, diagnose
+
+
+def tone():
+    return array.array('h', [int(8000 * math.sin(i / 10.0))
+                             for i in range(16000)]).tostring()
+
+
+class TestEncoders(unittest.TestCase):
+
+    def testULaw(self):
+        data = tone()
+        encoded = audiocodec.ULawEncoder().encode(data)
+        self.assertEqual(len(encoded), len(data) / 2)
+        self.assertEqual(
+            ''.join(audiocodec.ULawEncoder().encode_stream(
+                [data[:1000], data[1000:]])),
+            encoded)
+        error = audioop.add(audioop.ulaw2lin(encoded, 2),
+                            audioop.mul(data, 2, -1), 2)
+        self.assertLess(audioop.rms(error, 2), audioop.rms(data, 2) / 20)
+
+    @unittest.skipUnless(diagnose.check_python_import('soundfile') and
+                         diagnose.check_python_import('numpy'),
+                         "soundfile or NumPy not present")
+    def testFLAC(self):
+        import soundfile
+        import io
+        data = tone()
+        encoded = ''.join(audiocodec.FLACEncoder().encode_stream(
+            [data[:4096], data[4096:]]))
+        self.assertLess(len(encoded), len(data))
+        decoded, rate = soundfile.read(io.BytesIO(encoded), dtype='int16')
+        self.assertEqual(decoded.tostring(), data)
+
+
+class TestNegotiate(unittest.TestCase):
+
+    CODECS = (('unavailable', 'audio/x-nothing'),
+              ('ulaw', 'audio/ulaw; rate=%(rate)d'),
+              ('pcm', 'audio/l16; rate=%(rate)d; bits=%(bits)d'))
+
+    def setUp(self):
+        class UnavailableEncoder(audiocodec.PCMEncoder):
+            SLUG = 'unavailable'
+
+            @classmethod
+            def is_available(cls):
+                return False
+        self.addCleanup(setattr, UnavailableEncoder, 'SLUG', None)
+
+    def testFirstAvailable(self):
+        encoder, content_type = audiocodec.negotiate(self.CODECS, rate=8000)
+        self.assertIsInstance(encoder, audiocodec.ULawEncoder)
+        self.assertEqual(content_type, 'audio/ulaw; rate=8000')
+
+    def testPreferred(self):
+        encoder, content_type = audiocodec.negotiate(self.CODECS,
+                                                     preferred='pcm')
+        self.assertIsInstance(encoder, audiocodec.PCMEncoder)
+        self.assertEqual(content_type, 'audio/l16; rate=16000; bits=16')
+
+    def testWidth(self):
+        codecs = (('flac', 'audio/x-flac'), ('pcm', 'audio/l32'))
+        encoder, content_type = audiocodec.negotiate(codecs, width=4)
+        self.assertIsInstance(encoder, audiocodec.PCMEncoder)
+        with self.assertRaises(ValueError):
+            audiocodec.FLACEncoder(width=4)
+
+    def testNoneAvailable(self):
+        with self.assertRaises(ValueError):
+            audiocodec.negotiate(self.CODECS[:1])
@@ -0,0 +1,128 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import unittest
+import multiprocessing
+import tempfile
+import threading
+import time
+from client import decoderpool, audio
+
+
+class SlowEngine(object):
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def transcribe(self, segment):
+        time.sleep(self.delay)
+        return [segment.raw.upper()]
+
+
+class MeetingEngine(object):
+    """
+    Waits until the given number of utterances are being decoded at the
+    same time, which only happens if they are decoded in parallel.
+    """
+
+    def __init__(self, arrived, expected):
+        self.arrived = arrived
+        self.expected = expected
+
+    def transcribe(self, segment):
+        with self.arrived.get_lock():
+            self.arrived.value += 1
+        # the timeout only prevents a hang if there is no parallelism
+        deadline = time.time() + 10
+        while self.arrived.value < self.expected and time.time() < deadline:
+            time.sleep(0.01)
+        return [segment.raw.upper(), self.arrived.value >= self.expected]
+
+
+class TempFileEngine(object):
+
+    def __init__(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            self.path = f.name
+
+    def transcribe(self, segment):
+        return [self.path]
+
+
+class TestDecoderPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+
+    def transcribe_all(self, phrases):
+        results = {}
+
+        def transcribe(phrase):
+            results[phrase] = self.pool.transcribe(audio.AudioSegment(phrase))
+        threads = [threading.Thread(target=transcribe, args=(phrase,))
+                   for phrase in phrases]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def testTranscribe(self):
+        self.pool = decoderpool.DecoderPool(SlowEngine, {'delay': 0})
+        self.assertEqual(self.pool.transcribe(audio.AudioSegment('time')),
+                         ['TIME'])
+
+    def testParallel(self):
+        arrived = multiprocessing.Value('i', 0)
+        self.pool = decoderpool.DecoderPool(MeetingEngine,
+                                            {'arrived': arrived,
+                                             'expected': 2}, size=2)
+        results = self.transcribe_all(['time', 'news'])
+        self.assertEqual(results, {'time': ['TIME', True],
+                                   'news': ['NEWS', True]})
+
+    def testTempFiles(self):
+        self.pool = decoderpool.DecoderPool(TempFileEngine, {}, size=1)
+        path = self.pool.transcribe(audio.AudioSegment(''))[0]
+        self.assertTrue(os.path.exists(path))
+        self.pool.close()
+        self.pool = None
+        self.assertFalse(os.path.exists(path))
+
+    def testBackPressure(self):
+        self.pool = decoderpool.DecoderPool(SlowEngine, {'delay': 0.2},
+                                            size=1, queue_size=0)
+        waiting = []
+        original_wait = self.pool._cond.wait
+
+        def wait(timeout):
+            waiting.append(self.pool.pending)
+            original_wait(timeout)
+        self.pool._cond.wait = wait
+        results = self.transcribe_all(['time', 'news'])
+        self.assertEqual(results, {'time': ['TIME'], 'news': ['NEWS']})
+        self.assertTrue(waiting)
+        self.assertEqual(max(waiting), 1)
+        self.assertEqual(self.pool.pending, 0)
+
+    def testTimeoutStillPending(self):
+        self.pool = decoderpool.DecoderPool(SlowEngine, {'delay': 0.5},
+                                            size=1, timeout=0.1)
+        with self.assertRaises(multiprocessing.TimeoutError):
+            self.pool.transcribe(audio.AudioSegment('time'))
+        # the worker is still decoding
+        self.assertEqual(self.pool.pending, 1)
+        deadline = time.time() + 5
+        while self.pool.pending and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.pool.pending, 0)
+
+    def testEngineError(self):
+        self.pool = decoderpool.DecoderPool(SlowEngine, {'delay': 'x'})
+        with self.assertRaises(TypeError):
+            self.pool.transcribe(audio.AudioSegment('time'))
+        self.assertEqual(self.pool.pending, 0)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import mock
+import requests
+from client import httpsession
+
+
+class TestSession(unittest.TestCase):
+
+    def testDefaultTimeout(self):
+        session = httpsession.Session(connect_timeout=1, read_timeout=5)
+        with mock.patch.object(requests.Session, 'request') as request:
+            session.get('http://localhost/')
+            session.post('http://localhost/', timeout=10)
+        self.assertEqual(request.call_args_list[0][1]['timeout'], (1, 5))
+        self.assertEqual(request.call_args_list[1][1]['timeout'], 10)
+
+    def testPool(self):
+        session = httpsession.Session(pool_size=7, retries=3)
+        adapter = session.get_adapter('https://api.wit.ai/')
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.connect, 3)
+
+    def testSharedSession(self):
+        with mock.patch.object(httpsession, '_session', None):
+            with mock.patch.object(httpsession, 'get_config',
+                                   return_value={'pool_size': 2}):
+                session = httpsession.get_session()
+                self.assertIs(httpsession.get_session(), session)
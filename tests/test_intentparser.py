@@ -0,0 +1,63 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import mock
+from client import intentparser
+
+
+class TestIntentParser(unittest.TestCase):
+
+    EXAMPLES = {
+        'travel_time': ['how long does it take to get to {location}',
+                        'how far is {location}',
+                        'travel time to {location}'],
+        'query_movie': ['play {title}', 'play the movie {title}',
+                        'i want to watch {title}'],
+        'weather': ['what is the weather like', 'will it rain {day}']
+    }
+
+    def setUp(self):
+        self.parser = intentparser.IntentParser(self.EXAMPLES)
+
+    def testClassify(self):
+        ranking = self.parser.classify('how long does it take to get there')
+        self.assertEqual(ranking[0][1], 'travel_time')
+        self.assertAlmostEqual(sum(p for p, intent in ranking), 1.0)
+
+    def testParse(self):
+        outcome = self.parser.parse('How long does it take to get to ' +
+                                    'Ann Arbor?')
+        self.assertEqual(outcome['intent'], 'travel_time')
+        self.assertGreaterEqual(outcome['confidence'], 0.5)
+        self.assertEqual(outcome['entities'],
+                         {'location': [{'value': 'Ann Arbor',
+                                        'suggested': True}]})
+        outcome = self.parser.parse('play the movie  the matrix')
+        self.assertEqual(outcome['intent'], 'query_movie')
+        self.assertEqual(outcome['entities']['title'][0]['value'],
+                         'the matrix')
+
+    def testGazetteer(self):
+        outcome = self.parser.parse('how far is work from here',
+                                    {'location': ['home', 'work']})
+        self.assertEqual(outcome['entities']['location'][0]['value'],
+                         'work')
+
+    def testNoIntent(self):
+        self.assertEqual(self.parser.parse('tell me a joke'), {})
+        self.assertEqual(self.parser.parse(''), {})
+
+    def testUnknownWords(self):
+        self.assertEqual(self.parser.classify('XYZZY'), [])
+        self.assertEqual(self.parser.parse('PAUSE'), {})
+        self.assertEqual(self.parser.parse('xyzzy plugh'), {})
+        self.assertEqual(intentparser.IntentParser({}).parse('play it'), {})
+
+    def testModules(self):
+        module = mock.Mock(spec=['INTENTS'])
+        module.INTENTS = {'query_movie': ['put on {title}']}
+        with mock.patch('client.nikitapath.config',
+                        return_value='/nonexistent/intents.yml'):
+            parser = intentparser.IntentParser.get_instance([module])
+        self.assertEqual(parser.parse('put on Up')['entities']['title'][0]
+                         ['value'], 'Up')
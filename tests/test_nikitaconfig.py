@@ -0,0 +1,59 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from client import nikitaconfig
+
+
+class TestProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profile.yml')
+        self.write('stt_engine: sphinx\nensemble-stt:\n' +
+                   '  engines: [sphinx, google]\n')
+        patcher = mock.patch.object(nikitaconfig.nikitapath, 'config',
+                                    lambda *fname: os.path.join(
+                                        self.directory, *fname))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+        nikitaconfig._profile = None
+        self.addCleanup(setattr, nikitaconfig, '_profile', None)
+
+    def write(self, text, mtime=None):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def testReadOnly(self):
+        profile = nikitaconfig.get_profile()
+        self.assertEqual(profile['stt_engine'], 'sphinx')
+        self.assertEqual(profile['ensemble-stt']['engines'],
+                         ('sphinx', 'google'))
+        with self.assertRaises(TypeError):
+            profile['stt_engine'] = 'google'
+        with self.assertRaises(TypeError):
+            profile['ensemble-stt'].pop('engines')
+
+    def testCached(self):
+        profile = nikitaconfig.get_profile()
+        with mock.patch.object(nikitaconfig, 'load') as load:
+            self.assertIs(nikitaconfig.get_profile(), profile)
+            self.assertIs(nikitaconfig.get_profile(reload=True), profile)
+            self.assertFalse(load.called)
+
+    def testReload(self):
+        nikitaconfig.get_profile()
+        self.write('stt_engine: google\n', mtime=1)
+        self.assertEqual(nikitaconfig.get_profile()['stt_engine'], 'sphinx')
+        self.assertEqual(nikitaconfig.get_profile(reload=True)['stt_engine'],
+                         'google')
+
+    def testMissing(self):
+        os.remove(self.path)
+        self.assertEqual(nikitaconfig.get_profile(), {})
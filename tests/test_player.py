@@ -0,0 +1,68 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import threading
+import mock
+from client import audio, player, nikitapath
+
+
+class TestAbstractPlayer(unittest.TestCase):
+
+    def testIncompletePlayer(self):
+        class SilentPlayer(player.AbstractPlayer):
+            def stop(self):
+                pass
+        with self.assertRaises(TypeError):
+            SilentPlayer()
+
+
+class TestPyAudioPlayer(unittest.TestCase):
+
+    def setUp(self):
+        self.pyaudio = mock.Mock()
+        self.player = player.PyAudioPlayer(self.pyaudio, chunk=4)
+
+    def testPlaySegment(self):
+        self.player.play_segment(audio.AudioSegment('abcdefghij'))
+        stream = self.pyaudio.open.return_value
+        self.assertEqual([args[0] for args, kwargs
+                          in stream.write.call_args_list],
+                         ['abcdefgh', 'ij'])
+        self.assertIsNone(self.player.now_playing)
+
+    def testStreamIsReused(self):
+        self.player.play_segment(audio.AudioSegment('ab'))
+        self.player.play_segment(audio.AudioSegment('cd'))
+        self.player.play_segment(audio.AudioSegment('ef', rate=8000))
+        self.assertEqual(self.pyaudio.open.call_count, 2)
+
+    def testPreload(self):
+        fname = nikitapath.data('audio', 'beep_hi.wav')
+        self.player.preload(fname)
+        with mock.patch.object(audio.AudioSegment, 'from_wav') as from_wav:
+            self.player.play(fname)
+            self.assertFalse(from_wav.called)
+        self.assertTrue(self.pyaudio.open.return_value.write.called)
+
+    def testStop(self):
+        stream = self.pyaudio.open.return_value
+        stream.write.side_effect = lambda data: self.player.stop()
+        self.player.play_segment(audio.AudioSegment('a' * 64))
+        self.assertEqual(stream.write.call_count, 1)
+
+    def testConcurrentPlayback(self):
+        stream = self.pyaudio.open.return_value
+        written = []
+        second = threading.Thread(target=self.player.play_segment,
+                                  args=(audio.AudioSegment('b' * 16),))
+
+        def write(data):
+            if not written:
+                # the second sound has to wait for the first one
+                second.start()
+                second.join(0.1)
+            written.append(data)
+        stream.write.side_effect = write
+        self.player.play_segment(audio.AudioSegment('a' * 16))
+        second.join()
+        self.assertEqual(written, ['a' * 8, 'a' * 8, 'b' * 8, 'b' * 8])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import mock
+from client import registry, manifest, brain
+
+
+class TestModuleRegistry(unittest.TestCase):
+
+    MODULES = {
+        'RegistryLow': "import re\nWORDS = ['LOW']\nLOADED = []\n\n\n" +
+                       "def handle(text, mic, profile):\n" +
+                       "    LOADED.append(text)\n\n\n" +
+                       "def isValid(text):\n" +
+                       "    return bool(re.search(r'\\blow\\b', text, " +
+                       "re.IGNORECASE))\n",
+        'RegistryHigh': "WORDS = ['HIGH']\nPRIORITY = 5\n",
+        'RegistryNoWords': "PRIORITY = 1\n",
+        'RegistryBroken': "import registry_missing_dependency\n" +
+                          "WORDS = ['BROKEN']\n"
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, code in self.MODULES.items():
+            self.write(name, code)
+        self.manifest_path = os.path.join(self.directory, 'modules.json')
+        self.registry = registry.ModuleRegistry([self.directory])
+
+    def write(self, name, code):
+        with open(os.path.join(self.directory, name + '.py'), 'w') as f:
+            f.write(code)
+
+    def module(self, name):
+        return [mod for mod in self.registry.modules
+                if mod.__name__ == name][0]
+
+    def testModules(self):
+        names = [mod.__name__ for mod in self.registry.modules]
+        self.assertEqual(names, ['RegistryHigh', 'RegistryBroken',
+                                 'RegistryLow'])
+        self.assertEqual(self.registry.load_times, {})
+
+    def testLazyImport(self):
+        low = self.module('RegistryLow')
+        self.assertTrue(low.isValid('how low can you go'))
+        self.assertFalse(low.isValid('below'))
+        self.assertFalse(low.loaded)
+        low.handle('low', None, {})
+        self.assertTrue(low.loaded)
+        self.assertEqual(low.LOADED, ['low'])
+        self.assertEqual(list(self.registry.load_times), ['RegistryLow'])
+        self.assertEqual(len(self.registry.report()), 1)
+
+    def testReportLogged(self):
+        self.write('RegistryComputed', "WORDS = ['COMPUTED'.lower()]\n")
+        with mock.patch.object(self.registry, '_logger') as logger:
+            self.registry.modules
+        self.assertEqual(list(self.registry.load_times),
+                         ['RegistryComputed'])
+        logger.info.assert_called_with("Module import times:\n%s",
+                                       self.registry.report()[0])
+
+    def testBrokenModule(self):
+        broken = self.module('RegistryBroken')
+        self.assertFalse(broken.isValid('broken'))
+        with self.assertRaises(ImportError):
+            broken.handle('broken', None, {})
+
+    def testLoadedOnce(self):
+        low = self.module('RegistryLow')
+        low.LOADED.append(True)
+        self.assertIs(self.module('RegistryLow'), low)
+        self.assertEqual(low.LOADED, [True])
+
+    def testManifest(self):
+        registry.ModuleRegistry([self.directory],
+                                self.manifest_path).modules
+        self.assertEqual(len(manifest.load(self.manifest_path)), 4)
+        with mock.patch.object(manifest, 'describe') as describe:
+            registry.ModuleRegistry([self.directory],
+                                    self.manifest_path).modules
+            self.assertFalse(describe.called)
+        self.write('RegistryHigh', "WORDS = ['HIGHER']\nPRIORITY = 6\n")
+        modules = registry.ModuleRegistry([self.directory],
+                                          self.manifest_path).modules
+        self.assertEqual(modules[0].WORDS, ['HIGHER'])
+        self.assertEqual(modules[0].PRIORITY, 6)
+
+    def testSharedWithBrain(self):
+        self.assertEqual(brain.Brain.get_modules(),
+                         registry.get_registry().modules)
+
+
+class TestManifest(unittest.TestCase):
+
+    def describe(self, code):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'ManifestModule.py')
+        with open(path, 'w') as f:
+            f.write(code)
+        return manifest.describe(directory, 'ManifestModule', path)
+
+    def testPatternConstant(self):
+        entry = self.describe(
+            "import re\nWORDS = ['ECHO']\nPATTERN = r'\\b(echo|' + " +
+            "r'repeat)\\b'\n\n\ndef isValid(text):\n    \"\"\"Echo\"\"\"\n" +
+            "    return bool(re.search(PATTERN, text, re.I | re.U))\n")
+        self.assertEqual(entry['words'], ['ECHO'])
+        self.assertEqual(entry['priority'], 0)
+        self.assertEqual(entry['pattern'], r'\b(echo|repeat)\b')
+        self.assertEqual(entry['flags'], re.I | re.U)
+
+    def testNoPattern(self):
+        entry = self.describe(
+            "WORDS = ['TIME']\n\n\ndef isValid(text):\n" +
+            "    return text.lower() == 'what time is it'\n")
+        self.assertIsNone(entry['pattern'])
+
+    def testImportsNonLiterals(self):
+        entry = self.describe("from sys import maxint\nWORDS = []\n" +
+                              "PRIORITY = -(maxint + 1)\n\n\n" +
+                              "def isValid(text):\n    return True\n")
+        self.assertEqual(entry['priority'], -(__import__('sys').maxint + 1))
+        self.assertEqual(entry['pattern'], '')
+
+    def testScore(self):
+        entry = self.describe("WORDS = []\nSCORE = 0.5\n\n\n" +
+                              "def score(text):\n    return 0.1\n")
+        self.assertEqual(entry['score'], 0.5)
+        self.assertTrue(entry['scored'])
+        entry = self.describe("WORDS = []\n")
+        self.assertEqual(entry['score'], 1.0)
+        self.assertFalse(entry['scored'])
+
+    def testIntents(self):
+        entry = self.describe("WORDS = []\nINTENTS = {'query_movie': " +
+                              "['play {title}']}\n")
+        self.assertEqual(entry['intents'], {'query_movie': ['play {title}']})
+        module = manifest.LazyModule(entry)
+        self.assertEqual(module.INTENTS, {'query_movie': ['play {title}']})
+        self.assertFalse(module.loaded)
+        self.assertIsNone(manifest.LazyModule(
+            self.describe("WORDS = []\n")).INTENTS)
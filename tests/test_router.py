@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import re
+import unittest
+import mock
+from client import router, manifest, registry, stt
+
+
+def lazy(name, pattern, priority=0, flags=re.IGNORECASE):
+    return manifest.LazyModule({'name': name, 'location': None,
+                                'words': [], 'priority': priority,
+                                'pattern': pattern, 'flags': flags})
+
+
+class TestRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.help = lazy('help', r'\bhelp|what can you do\b', 5)
+        self.time = mock.Mock(spec=['isValid', 'handle'])
+        self.time.__name__ = 'Time'
+        self.time.PRIORITY = 0
+        self.time.isValid.side_effect = \
+            lambda text: text.lower() == 'what time is it'
+        self.news = lazy('News', r'\b(news|headline)\b', 3)
+        self.repeat = lazy('repeat', r'\b(\w+) \1\b', 1)
+        self.unclear = lazy('Unclear', '', -1, flags=0)
+        self.unclear.SCORE = 0.01
+        self.router = router.Router([self.help, self.news, self.repeat,
+                                     self.time, self.unclear])
+
+    def testPriority(self):
+        self.assertEqual(self.router.route(['help with the news']),
+                         (self.help, 'help with the news'))
+        self.assertEqual(self.router.route(['the NEWS please']),
+                         (self.news, 'the NEWS please'))
+
+    def testBestAlternative(self):
+        self.assertEqual(self.router.route(['what time is it', 'headlines',
+                                            'headline']),
+                         (self.time, 'what time is it'))
+        self.assertEqual(self.router.route(['zzz', 'headlines',
+                                            'headline']),
+                         (self.news, 'headline'))
+
+    def testConfidence(self):
+        texts = [stt.Hypothesis('help me', 0.3),
+                 stt.Hypothesis('the news', 0.8)]
+        self.assertEqual(self.router.route(texts), (self.news, 'the news'))
+        self.assertEqual(router.Router.confidences(
+            ['a', stt.Hypothesis('b', 0.5), 'c']), [1.0, 0.5, 0.45])
+
+    def testScoreFunction(self):
+        self.time.score = lambda text: 0.2 if 'time' in text else 0.0
+        self.time.isValid.side_effect = AssertionError
+        self.assertEqual(self.router.route(['news time']),
+                         (self.news, 'news time'))
+        self.assertEqual(self.router.route(['time']), (self.time, 'time'))
+        self.assertEqual(self.router.rank(['time'])[1],
+                         (0.01, self.unclear, 'time'))
+
+    def testBrokenModule(self):
+        broken = lazy('Broken', None)
+        broken.scored = True
+        broken.load = mock.Mock(side_effect=ImportError('missing'))
+        self.time.score = mock.Mock(side_effect=ValueError)
+        modules = [broken, self.time, self.news]
+        self.assertEqual(router.Router(modules).route(['the news']),
+                         (self.news, 'the news'))
+
+    def testDirectModules(self):
+        self.assertEqual(self.router.route(['What time is it']),
+                         (self.time, 'What time is it'))
+        self.assertEqual(self.router.route(['very very good']),
+                         (self.repeat, 'very very good'))
+        self.assertEqual(self.router.route(['zzz']), (self.unclear, 'zzz'))
+        self.assertEqual(router.Router([self.news]).route(['zzz']), None)
+
+    def testCombined(self):
+        self.assertEqual(self.router.accepting('help with the news'),
+                         set([0, 1, 4]))
+
+    def testSameAsLinearScan(self):
+        modules = registry.get_registry().modules
+        modules = [module for module in modules
+                   if getattr(module, 'pattern', None) is not None]
+        plugin_router = router.Router(modules)
+        for text in ('what is the weather tomorrow', 'tell me a joke',
+                     'how are you', 'play the movie', 'hacker news',
+                     'turn the tv on', 'zzz'):
+            expected = None
+            for module in modules:
+                if module.isValid(text):
+                    expected = (module, text)
+                    break
+            self.assertEqual(plugin_router.route([text]), expected)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import shutil
+import unittest
+import tempfile
+import threading
+import mock
+from client import speechqueue, ttscache
+
+
+class TestSpeechQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = mock.Mock()
+        self.engine.synthesize.side_effect = self.synthesize
+        self.played = []
+        self.engine.play.side_effect = lambda fname: self.played.append(
+            open(fname).read())
+        self.queue = speechqueue.SpeechQueue(self.engine)
+
+    def synthesize(self, phrase):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(phrase)
+        return f.name
+
+    def testSayInOrder(self):
+        for phrase in ('one', 'two', 'three'):
+            self.queue.say(phrase)
+        self.assertTrue(self.queue.wait(5))
+        self.assertFalse(self.queue.busy)
+        self.assertEqual(self.played, ['one', 'two', 'three'])
+
+    def testCache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.engine.SLUG = 'mock-tts'
+        self.queue.cache = ttscache.TTSCache(directory)
+        self.queue.say('Pardon?')
+        self.assertTrue(self.queue.wait(5))
+        self.queue.say('Pardon?')
+        self.assertTrue(self.queue.wait(5))
+        self.assertEqual(self.engine.synthesize.call_count, 1)
+        self.assertEqual(self.played, ['Pardon?', 'Pardon?'])
+
+    def testFallbackToSay(self):
+        self.engine.synthesize.side_effect = NotImplementedError
+        self.queue.say('one')
+        self.assertTrue(self.queue.wait(5))
+        self.engine.say.assert_called_once_with('one')
+
+    def testFlush(self):
+        playing = threading.Event()
+        release = threading.Event()
+
+        def play(fname):
+            playing.set()
+            release.wait(5)
+        self.engine.play.side_effect = play
+        self.queue.say('one')
+        self.queue.say('two')
+        playing.wait(5)
+        self.queue.flush()
+        release.set()
+        self.assertTrue(self.queue.wait(5))
+        self.engine.stop.assert_called_once_with()
+        self.assertEqual(self.engine.play.call_count, 1)
+
+    def testWaitTimeout(self):
+        release = threading.Event()
+        self.engine.play.side_effect = lambda fname: release.wait(5)
+        self.queue.say('one')
+        self.assertFalse(self.queue.wait(0.1))
+        release.set()
+        self.assertTrue(self.queue.wait(5))
@@ -2,7 +2,13 @@
 # -*- coding: utf-8-*-
 import unittest
 import imp
-from client import stt, nikitapath
+import threading
+import time
+import audioop
+import struct
+import mock
+import requests
+from client import stt, audio, nikitapath
 
 
 def cmuclmtk_installed():
@@ -49,3 +55,303 @@ class TestSTT(unittest.TestCase):
         with open(self.time_clip, mode="rb") as f:
             transcription = self.active_stt_engine.transcribe(f)
         self.assertIn("TIME", transcription)
+
+
+class TestJuliusServer(unittest.TestCase):
+
+    RESULT = ('<STARTRECOG/>\n.\n<RECOGOUT>\n' +
+              '  <SHYPO RANK="1" SCORE="-1234.5">\n' +
+              '    <WHYPO WORD="<s>" CLASSID="0" PHONE="sil" CM="1.000"/>\n' +
+              '    <WHYPO WORD="TIME" CLASSID="1" PHONE="t ay m" ' +
+              'CM="0.800"/>\n' +
+              '    <WHYPO WORD="NOW" CLASSID="2" PHONE="n aw" CM="0.600"/>\n' +
+              '    <WHYPO WORD="</s>" CLASSID="3" PHONE="sil" CM="1.000"/>\n' +
+              '  </SHYPO>\n</RECOGOUT>\n.\n')
+
+    def setUp(self):
+        self.server = stt.JuliusServer(['julius'])
+        self.server._module = mock.Mock()
+        self.server._adin = mock.Mock()
+
+    def testRecognize(self):
+        self.server._module.recv.side_effect = [self.RESULT[:30],
+                                                self.RESULT[30:]]
+        results = self.server.recognize(['ab', '', 'cd'])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], 'TIME NOW')
+        self.assertAlmostEqual(results[0][1], 0.7)
+        sent = [args[0] for args, kwargs
+                in self.server._adin.sendall.call_args_list]
+        self.assertEqual(sent, [struct.pack('i', 2) + 'ab',
+                                struct.pack('i', 2) + 'cd',
+                                struct.pack('i', 0)])
+
+    def testRecognitionFailure(self):
+        self.server._module.recv.side_effect = ['<RECOGFAIL/>\n.\n']
+        self.assertEqual(self.server.recognize(['ab']), [])
+
+    def testRestartResendsAudio(self):
+        self.server._module.recv.side_effect = ['']
+        with mock.patch.object(self.server, '_ensure_running') as ensure:
+            def reconnect():
+                if self.server._adin is None:
+                    self.server._module = mock.Mock()
+                    self.server._module.recv.side_effect = [self.RESULT]
+                    self.server._adin = mock.Mock()
+            ensure.side_effect = reconnect
+            results = self.server.recognize(iter(['ab', 'cd']))
+            self.assertEqual(ensure.call_count, 2)
+        self.assertEqual(results[0][0], 'TIME NOW')
+        self.assertEqual(self.server._adin.sendall.call_count, 3)
+
+    def testRestartFails(self):
+        self.server._module.recv.side_effect = ['']
+        engine = stt.JuliusSTT(server=False)
+        engine._server = self.server
+        recorded = []
+
+        def record():
+            for chunk in ('ab', 'cd', 'ef'):
+                recorded.append(chunk)
+                yield chunk
+        with mock.patch.object(self.server, '_ensure_running') as ensure:
+            ensure.side_effect = [None, IOError('Address already in use')]
+            self.assertEqual(engine.transcribe_stream(record()), [''])
+        self.assertEqual(recorded, ['ab', 'cd', 'ef'])
+
+
+class TestStreamingSTT(unittest.TestCase):
+
+    def response(self, status_code, json):
+        r = mock.Mock(status_code=status_code)
+        r.json.return_value = json
+        return r
+
+    def testWitAiStream(self):
+        engine = stt.WitAiSTT('token')
+        uploaded = []
+
+        def post(url, data, headers):
+            uploaded.append((''.join(data), headers['Content-Type']))
+            return self.response(200, {'_text': 'what time is it'})
+        engine._http = mock.Mock(post=mock.Mock(side_effect=post))
+        self.assertEqual(engine.transcribe_stream(iter(['ab', 'cd'])),
+                         ['WHAT TIME IS IT'])
+        engine.codec = 'ulaw'
+        engine.transcribe_stream(iter(['ab', 'cd']))
+        # lossless unless mu-law has been asked for
+        self.assertEqual(uploaded[0][0], 'abcd')
+        self.assertIn('encoding=signed-integer;bits=16', uploaded[0][1])
+        self.assertEqual(uploaded[1][0], audioop.lin2ulaw('abcd', 2))
+        self.assertIn('encoding=mu-law', uploaded[1][1])
+
+    def testWitAiUploadsWithoutCopy(self):
+        engine = stt.WitAiSTT('token')
+        engine._http = mock.Mock()
+        engine._http.post.return_value = self.response(200, {'_text': ''})
+        engine.transcribe(audio.AudioSegment(bytearray('abcd')))
+        data = engine._http.post.call_args[1]['data']
+        self.assertIsInstance(data, buffer)
+        self.assertEqual(data[:], 'abcd')
+
+    def testWitAiCodecFromProfile(self):
+        profile = {'witai-stt': {'access_token': 'token', 'codec': 'ulaw'}}
+        with mock.patch('client.nikitaconfig.get_profile',
+                        return_value=profile):
+            self.assertEqual(stt.WitAiSTT.get_config(),
+                             {'access_token': 'token', 'codec': 'ulaw'})
+
+    def testAttRetryResendsStream(self):
+        engine = stt.AttSTT('key', 'secret')
+        uploaded = []
+        responses = [self.response(401, {}), self.response(200, {
+            'Recognition': {'Status': 'OK', 'NBest': [
+                {'Hypothesis': 'time', 'Confidence': 0.9}]}})]
+
+        def post(url, data, headers):
+            uploaded.append(''.join(data))
+            return responses.pop(0)
+        engine._http = mock.Mock(post=mock.Mock(side_effect=post))
+        with mock.patch.object(stt.AttSTT, 'token', 'token'):
+            self.assertEqual(engine.transcribe_stream(iter(['ab', 'cd'])),
+                             ['TIME'])
+        self.assertEqual(uploaded, ['abcd', 'abcd'])
+
+    def testStreamCompletesRecording(self):
+        def record():
+            for chunk in ('ab', 'cd', 'ef'):
+                recorded.append(chunk)
+                yield chunk
+        recorded = []
+        engine = stt.GoogleSTT(api_key=None)
+        self.assertEqual(engine.transcribe_stream(record()), [])
+        self.assertEqual(recorded, ['ab', 'cd', 'ef'])
+        recorded = []
+        engine = stt.WitAiSTT('token')
+        engine._http = mock.Mock()
+        engine._http.post.side_effect = \
+            requests.exceptions.ConnectionError('unreachable')
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            engine.transcribe_stream(record())
+        self.assertEqual(recorded, ['ab', 'cd', 'ef'])
+
+    def testDefaultCollectsChunks(self):
+        engine = stt.WitAiSTT('token')
+        with mock.patch.object(engine, 'transcribe') as transcribe:
+            stt.AbstractSTTEngine.transcribe_stream(engine, ['ab', 'cd'],
+                                                    rate=8000)
+            segment = transcribe.call_args[0][0]
+        self.assertEqual(segment.raw, 'abcd')
+        self.assertEqual(segment.rate, 8000)
+
+
+class TestEnsembleSTT(unittest.TestCase):
+
+    def engine(self, slug, result, event=None):
+        engine = mock.Mock(SLUG=slug)
+
+        def transcribe(fp):
+            if event is not None:
+                # the timeout only prevents a hang if the test fails
+                event.wait(5)
+            return result
+        engine.transcribe.side_effect = transcribe
+        return engine
+
+    def ensemble(self, *engines, **kwargs):
+        kwargs.setdefault('latency_budget', 0.2)
+        return stt.EnsembleSTT(list(engines), local=engines[0], **kwargs)
+
+    def transcribe(self, ensemble):
+        return ensemble.transcribe(audio.AudioSegment(''))
+
+    def testConfidentResultWins(self):
+        done = threading.Event()
+        self.addCleanup(done.set)
+        local = self.engine('local', ['LOCAL'], event=done)
+        cloud = self.engine('cloud', [stt.Hypothesis('CLOUD', 0.9)])
+        ensemble = self.ensemble(local, cloud)
+        self.assertEqual(self.transcribe(ensemble), ['CLOUD'])
+        self.assertEqual(ensemble.stats['cloud']['wins'], 1)
+
+    def testLocalResultAfterBudget(self):
+        done = threading.Event()
+        self.addCleanup(done.set)
+        local = self.engine('local', ['LOCAL'])
+        # the confident result would win if the ensemble waited for it
+        cloud = self.engine('cloud', [stt.Hypothesis('CLOUD', 0.9)],
+                            event=done)
+        self.assertEqual(self.transcribe(self.ensemble(local, cloud)),
+                         ['LOCAL'])
+
+    def testUnconfidentResult(self):
+        local = self.engine('local', ['LOCAL'])
+        cloud = self.engine('cloud', [stt.Hypothesis('CLOUD', 0.5)])
+        self.assertEqual(self.transcribe(self.ensemble(local, cloud)),
+                         ['LOCAL'])
+
+    def testLocalFailure(self):
+        local = self.engine('local', [])
+        cloud = self.engine('cloud', [stt.Hypothesis('CLOUD', 0.5)])
+        ensemble = self.ensemble(local, cloud)
+        self.assertEqual(self.transcribe(ensemble), ['CLOUD'])
+        self.assertEqual(ensemble.stats['local']['requests'], 1)
+
+    def testAbandonedEngineIsSerialized(self):
+        release = threading.Event()
+        finished = threading.Event()
+        self.addCleanup(release.set)
+        calls = {'active': 0, 'max': 0, 'done': 0}
+        lock = threading.Lock()
+
+        def transcribe(fp):
+            with lock:
+                calls['active'] += 1
+                calls['max'] = max(calls['max'], calls['active'])
+            release.wait(5)
+            with lock:
+                calls['active'] -= 1
+                calls['done'] += 1
+                if calls['done'] == 2:
+                    finished.set()
+            return []
+        local = self.engine('local', ['LOCAL'])
+        cloud = mock.Mock(SLUG='cloud')
+        cloud.transcribe.side_effect = transcribe
+        ensemble = self.ensemble(local, cloud, latency_budget=0)
+        self.assertEqual(self.transcribe(ensemble), ['LOCAL'])
+        self.assertEqual(self.transcribe(ensemble), ['LOCAL'])
+        release.set()
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(calls['max'], 1)
+
+    def testUnknownLocalEngine(self):
+        with mock.patch.object(stt.EnsembleSTT, 'get_config',
+                               return_value={'engines': ['sphinx', 'google'],
+                                             'local': 'julius'}):
+            with mock.patch.object(stt, 'get_engine_by_slug') as get_engine:
+                self.assertRaises(ValueError, stt.EnsembleSTT.get_instance,
+                                  'default', [])
+        self.assertFalse(get_engine.called)
+
+
+class TestCircuitBreakerSTT(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = mock.Mock(SLUG='cloud', STREAMING=True,
+                                last_error=None)
+        self.engine.transcribe.return_value = ['CLOUD']
+        self.fallback = mock.Mock(SLUG='local')
+        self.fallback.transcribe.return_value = ['LOCAL']
+        self.breaker = stt.CircuitBreakerSTT(self.engine, self.fallback,
+                                             max_failures=2,
+                                             probe_interval=0.05)
+        self.segment = audio.AudioSegment('')
+
+    def fail(self, *args, **kwargs):
+        self.engine.last_error = 'HTTP status 503'
+        return []
+
+    def testSuccess(self):
+        self.assertEqual(self.breaker.transcribe(self.segment), ['CLOUD'])
+        self.assertFalse(self.fallback.transcribe.called)
+
+    def testFailureFallsBack(self):
+        self.engine.transcribe.side_effect = self.fail
+        self.assertEqual(self.breaker.transcribe(self.segment), ['LOCAL'])
+        self.assertFalse(self.breaker.tripped)
+
+    def testTripAndRecover(self):
+        self.engine.transcribe.side_effect = IOError('timeout')
+        with mock.patch.object(self.breaker, '_probe'):
+            self.breaker.transcribe(self.segment)
+            self.breaker.transcribe(self.segment)
+        self.assertTrue(self.breaker.tripped)
+        self.engine.transcribe.reset_mock()
+        self.assertEqual(self.breaker.transcribe(self.segment), ['LOCAL'])
+        self.assertFalse(self.engine.transcribe.called)
+
+        self.engine.transcribe.side_effect = None
+        self.breaker._probe()
+        self.assertFalse(self.breaker.tripped)
+        self.assertEqual(self.breaker.transcribe(self.segment), ['CLOUD'])
+
+    def testSlowRequestsTrip(self):
+        self.breaker.latency_slo = 0.01
+        self.engine.transcribe.side_effect = lambda fp: time.sleep(0.02)
+        with mock.patch.object(self.breaker, '_probe'):
+            self.breaker.transcribe(self.segment)
+            self.breaker.transcribe(self.segment)
+        self.assertTrue(self.breaker.tripped)
+
+    def testStreamFailureTranscribesRecording(self):
+        def transcribe_stream(chunks, rate, width):
+            next(chunks)
+            return self.fail()
+        self.engine.transcribe_stream.side_effect = transcribe_stream
+        self.assertEqual(
+            self.breaker.transcribe_stream(iter(['ab', 'cd']), rate=8000),
+            ['LOCAL'])
+        segment = self.fallback.transcribe.call_args[0][0]
+        self.assertEqual(segment.raw, 'abcd')
+        self.assertEqual(segment.rate, 8000)
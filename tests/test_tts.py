@@ -1,6 +1,9 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
 import unittest
+import os
+import tempfile
+import mock
 from client import tts
 
 
@@ -9,3 +12,91 @@ class TestTTS(unittest.TestCase):
         tts_engine = tts.get_engine_by_slug('dummy-tts')
         tts_instance = tts_engine()
         tts_instance.say('This is a test.')
+
+    def testStop(self):
+        tts_instance = tts.get_engine_by_slug('dummy-tts')()
+        process = mock.Mock()
+        process.poll.return_value = None
+        tts_instance.player._process = process
+        tts_instance.stop()
+        process.terminate.assert_called_once_with()
+
+    def testSplitSentences(self):
+        self.assertEqual(tts.split_sentences(
+            "Hello Mr. Smith, how are you? The weather is fine today. Bye!"),
+            ["Hello Mr. Smith, how are you?", "The weather is fine today.",
+             "Bye!"])
+        self.assertEqual(tts.split_sentences(''), [])
+
+    def testSayPipelined(self):
+        played = []
+
+        class FileTTS(tts.AbstractTTSEngine):
+            SLUG = None
+
+            @classmethod
+            def is_available(cls):
+                return True
+
+            def synthesize(self, phrase):
+                with tempfile.NamedTemporaryFile(delete=False) as f:
+                    f.write(phrase)
+                return f.name
+
+            def play(self, filename):
+                played.append(open(filename).read())
+
+        FileTTS().say("This is the first sentence. This is the second one.")
+        self.assertEqual(played, ["This is the first sentence.",
+                                  "This is the second one."])
+
+
+class TestFestivalServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = tts.FestivalServer()
+        self.server._sock = mock.Mock()
+
+    def testSynthesize(self):
+        self.server._sock.recv.side_effect = [
+            'WV\nRIFFdata', 'ft_StUfF_keyLP\nnilft_St', 'UfF_keyOK\n']
+        self.assertEqual(self.server.synthesize('Say "hi"'), 'RIFFdata')
+        self.server._sock.sendall.assert_called_once_with(
+            '(utt.send.wave.client (utt.synth (Utterance Text ' +
+            '"Say \\"hi\\"")))\n')
+
+    def testError(self):
+        self.server._sock.recv.side_effect = ['ER\n']
+        with self.assertRaises(RuntimeError):
+            self.server.synthesize('hi')
+
+    def testRestart(self):
+        self.server._sock.recv.side_effect = ['']
+        with mock.patch.object(self.server, '_ensure_running') as ensure:
+            def reconnect():
+                if self.server._sock is None:
+                    self.server._sock = mock.Mock()
+                    self.server._sock.recv.side_effect = [
+                        'WV\nRIFFft_StUfF_keyOK\n']
+            ensure.side_effect = reconnect
+            self.assertEqual(self.server.synthesize('hi'), 'RIFF')
+            self.assertEqual(ensure.call_count, 2)
+
+
+class TestMaryTTS(unittest.TestCase):
+
+    def testLanguagesAndVoicesCached(self):
+        with mock.patch('client.httpsession.get_session'):
+            engine = tts.MaryTTS()
+        responses = {'/locales': 'de\nen_GB\n',
+                     '/voices': 'dfki-spike en_GB male unitselection\n',
+                     '/process': 'RIFF'}
+
+        def get(url):
+            path = url.split('59125', 1)[1].split('?')[0]
+            return mock.Mock(text=responses[path], content=responses[path])
+        engine.session.get.side_effect = get
+        for phrase in ('hi', 'bye'):
+            tmpfile = engine.synthesize(phrase)
+            os.remove(tmpfile)
+        self.assertEqual(engine.session.get.call_count, 4)
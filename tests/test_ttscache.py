@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import shutil
+import tempfile
+import unittest
+from client import ttscache
+
+
+class DummyEngine(object):
+    SLUG = 'dummy-tts'
+
+    def __init__(self, voice='default'):
+        self.voice = voice
+        self._process = None
+
+    def cache_key(self):
+        return (self.voice,)
+
+
+class TestTTSCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ttscache.TTSCache(os.path.join(self.directory, 'tts'),
+                                       max_size=20)
+        self.engine = DummyEngine()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def wav(self, data):
+        fname = os.path.join(self.directory, 'input.wav')
+        with open(fname, 'wb') as f:
+            f.write(data)
+        return fname
+
+    def testKey(self):
+        key = self.cache.key(self.engine, 'Pardon?')
+        self.assertEqual(key, self.cache.key(self.engine, ' Pardon?\n'))
+        self.assertNotEqual(key, self.cache.key(DummyEngine('other'),
+                                                'Pardon?'))
+        self.assertNotEqual(key, self.cache.key(self.engine, 'Hello'))
+
+    def testGetAndPut(self):
+        self.assertIsNone(self.cache.get(self.engine, 'Pardon?'))
+        self.cache.put(self.engine, 'Pardon?', self.wav('abc'))
+        path = self.cache.get(self.engine, 'Pardon?')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), 'abc')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def testEviction(self):
+        self.cache.put(self.engine, 'one', self.wav('1' * 8))
+        self.cache.put(self.engine, 'two', self.wav('2' * 8))
+        # 'one' is now the most recently used phrase
+        self.cache.get(self.engine, 'one')
+        self.cache.put(self.engine, 'three', self.wav('3' * 8))
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, 16)
+        self.assertIsNone(self.cache.get(self.engine, 'two'))
+        self.assertIsNotNone(self.cache.get(self.engine, 'one'))
+
+    def testNoEvictionWhilePlaying(self):
+        self.cache.put(self.engine, 'one', self.wav('1' * 8))
+        path = self.cache.get(self.engine, 'one')
+        self.cache.put(self.engine, 'two', self.wav('2' * 8))
+        self.cache.put(self.engine, 'three', self.wav('3' * 8))
+        # 'one' is being played, so 'two' is evicted instead
+        self.assertTrue(os.path.exists(path))
+        self.assertIsNone(self.cache.get(self.engine, 'two'))
+        self.cache.release(path)
+        self.cache.release(self.cache.get(self.engine, 'three'))
+        self.cache.put(self.engine, 'four', self.wav('4' * 8))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.cache.size, 16)
+
+    def testReload(self):
+        self.cache.put(self.engine, 'one', self.wav('abc'))
+        cache = ttscache.TTSCache(self.cache.directory, max_size=20)
+        self.assertEqual(cache.size, 3)
+        self.assertIsNotNone(cache.get(self.engine, 'one'))
+
+    def testDisabled(self):
+        self.assertIsNone(ttscache.TTSCache.get_instance(
+            {'tts_cache': {'enabled': False}}))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import math
+import random
+import array
+from client import vad, diagnose
+
+RATE = 16000
+CHUNK = 1024
+
+
+def noise(amplitude, seed=0):
+    rand = random.Random(seed)
+    return array.array('h', [int(rand.uniform(-amplitude, amplitude))
+                             for i in range(CHUNK)]).tostring()
+
+
+def tone(amplitude, frequency=220):
+    return array.array('h', [int(amplitude * math.sin(2 * math.pi *
+                                                      frequency * i / RATE))
+                             for i in range(CHUNK)]).tostring()
+
+
+class TestEnergyVAD(unittest.TestCase):
+    VAD = vad.EnergyVAD
+
+    def setUp(self):
+        self.vad = self.VAD(rate=RATE)
+        self.vad.calibrate([noise(100, seed) for seed in range(5)])
+
+    def testEvents(self):
+        chunks = ([noise(100)] * 5 + [tone(8000)] * 10 +
+                  [noise(100)] * 20)
+        events = [event for event, chunk in self.vad.events(chunks)
+                  if event]
+        self.assertEqual(events, [vad.SPEECH_START, vad.SPEECH_END])
+
+    def testNoSpeech(self):
+        chunks = [noise(100, seed) for seed in range(20)]
+        events = [event for event, chunk in self.vad.events(chunks)
+                  if event]
+        self.assertEqual(events, [])
+        self.assertFalse(self.vad.in_speech)
+
+    def testTrack(self):
+        floor = self.vad.noise_floor
+        for i in range(50):
+            self.vad.track(noise(400, i))
+        self.assertGreater(self.vad.noise_floor, floor)
+        self.assertFalse(self.vad.in_speech)
+
+    def testLoadCalibration(self):
+        other = self.VAD(rate=RATE)
+        self.assertIsNone(other.threshold)
+        other.load_calibration(self.vad.calibration)
+        self.assertEqual(other.threshold, self.vad.threshold)
+
+    def testCalibration(self):
+        calibration = self.vad.calibration
+        other = self.VAD(rate=RATE, calibration=calibration)
+        self.assertEqual(other.calibration, calibration)
+        self.assertEqual(other.threshold, self.vad.threshold)
+
+
+class TestZeroCrossingVAD(TestEnergyVAD):
+    VAD = vad.ZeroCrossingVAD
+
+    def setUp(self):
+        self.vad = self.VAD(rate=RATE)
+        self.vad.calibrate([tone(100, frequency=100)] * 5)
+
+    def testNoSpeech(self):
+        chunks = [tone(100, frequency=100)] * 20
+        events = [event for event, chunk in self.vad.events(chunks)
+                  if event]
+        self.assertEqual(events, [])
+
+    def testUnvoicedSpeech(self):
+        # quiet, but with a high zero-crossing rate
+        self.assertTrue(self.vad.is_speech(noise(200)))
+        self.assertFalse(vad.EnergyVAD(
+            rate=RATE, calibration=self.vad.calibration).is_speech(
+                noise(200)))
+
+
+@unittest.skipUnless(diagnose.check_python_import('numpy'),
+                     "NumPy not present")
+class TestSpectralFlatnessVAD(TestEnergyVAD):
+    VAD = vad.SpectralFlatnessVAD
+
+    def testLoudNoise(self):
+        self.assertFalse(self.vad.is_speech(noise(8000)))
+
+
+class TestGetDetector(unittest.TestCase):
+    def testGetDetectorBySlug(self):
+        self.assertIs(vad.get_detector_by_slug('energy'), vad.EnergyVAD)
+        with self.assertRaises(ValueError):
+            vad.get_detector_by_slug('nonexistant')
+
+    def testGetInstance(self):
+        profile = {'vad': {'calibration': {'noise_floor': 50},
+                           'energy': {'ratio': 3}}}
+        detector = vad.EnergyVAD.get_instance(profile, rate=RATE)
+        self.assertEqual(detector.threshold, 150)